@@ -5,16 +5,59 @@ doitlive
 A tool for "live" presentations in the terminal.
 """
 
-from .cli import SessionState
-from .exceptions import ConfigurationError, DoItLiveError, SessionError
-from .keyboard import BACKSPACE, CTRLC, ESC, RETURNS, magicrun, magictype, wait_for
-from .python_consoles import PythonPlayerConsole, PythonRecorderConsole
-from .styling import THEMES, TTY, Style, TermString, echo, echo_prompt, format_prompt
-from .version_control import (
-    get_current_git_branch,
-    get_current_hg_branch,
-    get_current_vcs_branch,
-)
+import importlib
+
+# Map of public names => submodule that defines them. Submodules are only
+# imported when one of their names is first accessed, so that importing
+# doitlive (and running fast CLI commands like --version) stays cheap.
+_LAZY_ATTRS = {
+    "SessionState": "cli",
+    "ConfigurationError": "exceptions",
+    "DoItLiveError": "exceptions",
+    "SessionError": "exceptions",
+    "BACKSPACE": "keyboard",
+    "CTRLC": "keyboard",
+    "ESC": "keyboard",
+    "RETURNS": "keyboard",
+    "magicrun": "keyboard",
+    "magictype": "keyboard",
+    "wait_for": "keyboard",
+    "PythonPlayerConsole": "python_consoles",
+    "PythonRecorderConsole": "python_consoles",
+    "THEMES": "styling",
+    "TTY": "styling",
+    "Style": "styling",
+    "TermString": "styling",
+    "echo": "styling",
+    "echo_prompt": "styling",
+    "format_prompt": "styling",
+    "get_current_git_branch": "version_control",
+    "get_current_hg_branch": "version_control",
+    "get_current_vcs_branch": "version_control",
+}
+
+_SUBMODULES = {
+    "broadcast",
+    "cli",
+    "config",
+    "exceptions",
+    "graphemes",
+    "ipython",
+    "jobs",
+    "journal",
+    "keyboard",
+    "outputs",
+    "profiling",
+    "python_consoles",
+    "repl",
+    "session",
+    "styling",
+    "termutils",
+    "timing",
+    "version_control",
+    "watcher",
+    "workdir",
+}
 
 __all__ = [
     "SessionState",
@@ -41,3 +84,19 @@ __all__ = [
     "ConfigurationError",
     "SessionError",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        module = importlib.import_module(f".{_LAZY_ATTRS[name]}", __name__)
+        value = getattr(module, name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value  # Cache so __getattr__ is only hit once per name
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _SUBMODULES)
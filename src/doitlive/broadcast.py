@@ -0,0 +1,244 @@
+"""Mirroring of a session to other terminals. ``doitlive play --broadcast``
+sends everything written to the presenter's terminal to any number of
+``doitlive watch`` clients.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import signal
+import socket
+import sys
+import threading
+from contextlib import contextmanager
+
+from doitlive.exceptions import SessionError
+
+# Number of chunks of output a client may fall behind by before it is dropped
+CLIENT_QUEUE_SIZE = 1024
+READ_SIZE = 4096
+
+
+def parse_address(address):
+    """Parse ``unix:<path>`` or ``tcp:<host>:<port>``. Returns (family, address)."""
+    scheme, _, rest = address.partition(":")
+    if scheme == "unix" and rest:
+        return socket.AF_UNIX, rest
+    if scheme == "tcp":
+        host, _, port = rest.rpartition(":")
+        if port.isdigit():
+            return socket.AF_INET, (host or "localhost", int(port))
+    raise SessionError(
+        f'Invalid broadcast address "{address}". '
+        "Must be unix:<path> or tcp:<host>:<port>."
+    )
+
+
+class Broadcaster:
+    """Serves a stream of bytes to any number of clients. The server runs an
+    asyncio loop in a background thread. Each client has its own bounded
+    queue; clients that fall too far behind are dropped so that the presenter
+    is never blocked.
+    """
+
+    def __init__(self, address, queue_size=CLIENT_QUEUE_SIZE):
+        self.family, self.address = parse_address(address)
+        self.queue_size = queue_size
+        # Map of each client's queue => the task serving it
+        self.clients = {}
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._server = self._loop.run_until_complete(self._start_server())
+        except OSError as error:
+            self._loop.close()
+            raise SessionError(
+                f"Could not broadcast on {self.address}: {error}"
+            ) from error
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    async def _start_server(self):
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                # Remove a socket left behind by an earlier session
+                os.remove(self.address)
+            return await asyncio.start_unix_server(self._serve, self.address)
+        host, port = self.address
+        return await asyncio.start_server(self._serve, host, port)
+
+    async def _serve(self, reader, writer):
+        queue = asyncio.Queue(self.queue_size)
+        self.clients[queue] = asyncio.current_task()
+        try:
+            while True:
+                data = await queue.get()
+                if data is None:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except OSError:
+            pass
+        except asyncio.CancelledError:
+            # The client was dropped. Discard what it hasn't read instead of
+            # waiting for it to read it.
+            writer.transport.abort()
+            raise
+        finally:
+            self.clients.pop(queue, None)
+            writer.close()
+
+    def _publish(self, data):
+        for queue, task in list(self.clients.items()):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                # Drop the slow client
+                self.clients.pop(queue)
+                task.cancel()
+
+    def publish(self, data):
+        """Send ``data`` to all clients. Safe to call from any thread."""
+        if self._loop is not None and data:
+            self._loop.call_soon_threadsafe(self._publish, data)
+
+    async def _shutdown(self):
+        self._server.close()
+        tasks = list(self.clients.values())
+        # Let clients receive what they have been sent so far
+        self._publish(None)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result(timeout=5)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class TerminalTee:
+    """Redirects this process's stdout and stderr (including the output of
+    the commands it runs) through a pseudo-terminal. Everything written to it
+    is passed on, unchanged, to the real terminal and to ``callback``.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._saved_fds = None
+        self._master = None
+        self._thread = None
+        self._old_sigwinch = None
+
+    def start(self):
+        try:
+            # Not available on Windows
+            import pty
+            import termios
+        except ImportError as error:
+            raise SessionError(
+                "Broadcasting is not supported on this platform."
+            ) from error
+        from doitlive.termutils import _copy_window_size
+
+        master, slave = pty.openpty()
+        _copy_window_size(master, source=1)
+        # Pass output through as is; the real terminal does its own processing
+        attrs = termios.tcgetattr(slave)
+        attrs[1] &= ~termios.OPOST
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self._saved_fds = (os.dup(1), os.dup(2))
+        os.dup2(slave, 1)
+        os.dup2(slave, 2)
+        os.close(slave)
+        self._master = master
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+        if threading.current_thread() is threading.main_thread():
+            # Follow the real terminal when it is resized
+            self._old_sigwinch = signal.signal(
+                signal.SIGWINCH,
+                lambda *_: _copy_window_size(master, source=self._saved_fds[0]),
+            )
+
+    def _pump(self):
+        out = self._saved_fds[0]
+        while True:
+            try:
+                data = os.read(self._master, READ_SIZE)
+            except OSError:  # EIO: the terminal was closed
+                break
+            if not data:
+                break
+            os.write(out, data)
+            self.callback(data)
+
+    def stop(self):
+        if self._saved_fds is None:
+            return
+        if self._old_sigwinch is not None:
+            signal.signal(signal.SIGWINCH, self._old_sigwinch)
+            self._old_sigwinch = None
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved in zip((1, 2), self._saved_fds, strict=True):
+            os.dup2(saved, fd)
+        # Nothing holds the terminal open anymore, so the pump will finish
+        # once it has passed on what is left to read (unless a command
+        # left running in the background still holds it)
+        self._thread.join(timeout=1)
+        if not self._thread.is_alive():
+            os.close(self._master)
+            for saved in self._saved_fds:
+                os.close(saved)
+        self._saved_fds = None
+
+
+def watch(address, out=None):
+    """Connect to a broadcast session and copy its output to ``out`` until
+    the session ends.
+    """
+    family, address = parse_address(address)
+    out = out or sys.stdout.buffer
+    try:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+    except OSError as error:
+        raise SessionError(f"Could not connect to {address}: {error}") from error
+    with sock:
+        while True:
+            data = sock.recv(READ_SIZE)
+            if not data:
+                break
+            out.write(data)
+            out.flush()
+
+
+@contextmanager
+def broadcasting(address):
+    """Broadcast everything written to the terminal during the context."""
+    broadcaster = Broadcaster(address)
+    broadcaster.start()
+    tee = TerminalTee(broadcaster.publish)
+    try:
+        tee.start()
+        yield broadcaster
+    finally:
+        tee.stop()
+        broadcaster.stop()
@@ -1,39 +1,83 @@
+import bisect
+import contextlib
 import functools
-import importlib.metadata
+import importlib.util
 import os
 import re
 import shlex
+import string
 import sys
 import textwrap
+import time
 from codecs import open
 
 import click
-import click_completion
 from click import secho, style
 from click_didyoumean import DYMGroup
 
-from doitlive.exceptions import SessionError
+from doitlive import config
+from doitlive.exceptions import ConfigurationError, SessionError
+from doitlive.journal import (
+    CLOSING_FENCE,
+    PYTHON_FENCE,
+    RecorderJournal,
+    journal_path,
+    read_journal,
+)
 from doitlive.keyboard import (
     RETURNS,
+    Navigation,
     magicrun,
     magictype,
+    recordtype,
     regularrun,
     run_command,
     wait_for,
 )
-from doitlive.python_consoles import PythonRecorderConsole, start_python_player
-from doitlive.styling import THEMES, echo, echo_prompt, format_prompt
-from doitlive.termutils import get_default_shell
+from doitlive.outputs import (
+    CapturedOutputs,
+    command_runtimes,
+    outputs_path,
+    read_outputs,
+    write_outputs,
+)
+from doitlive.session import (
+    CODE,
+    COMMAND,
+    COMMENT,
+    DIRECTIVE,
+    DIRECTIVE_RE,
+    parse_session,
+)
+from doitlive.styling import (
+    THEMES,
+    compile_prompt,
+    echo,
+    echo_prompt,
+    format_prompt,
+)
+from doitlive.termutils import find_executables, get_default_shell
+from doitlive.timing import (
+    DEFAULT_KEYS_PER_SECOND,
+    DEFAULT_THINK_TIME,
+    estimate_time,
+    keystrokes_for,
+    read_timing,
+    timing_path,
+    timing_stats,
+    to_deltas,
+    write_timing,
+)
 
 env = os.environ
-click_completion.init()
 
+# click_completion is imported lazily by the completion command, unless
+# the shell is asking us for completions
+if "_DOITLIVE_COMPLETE" in env:
+    import click_completion
+
+    click_completion.init()
 
-OPTION_RE = re.compile(
-    r"^#\s?doitlive\s+"
-    r"(?P<option>prompt|shell|alias|env|speed"
-    r"|unalias|unset|commentecho):\s*(?P<arg>.+)$"
-)
 
 TESTING = False
 
@@ -46,10 +90,93 @@ def write_directives(fp, directive, args):
     return None
 
 
+def definition_name(definition):
+    """Return the name defined by an alias or environment variable
+    definition (``<name>=<value>``).
+    """
+    return definition.partition("=")[0].strip()
+
+
+VARIABLE_REFERENCE_RE = re.compile(r"\$\{?([A-Za-z_][A-Za-z0-9_]*)")
+
+
+def variable_references(definition):
+    """Return the names of the variables the value of a definition refers to."""
+    return set(VARIABLE_REFERENCE_RE.findall(definition.partition("=")[2]))
+
+
+class Definitions:
+    """Alias or environment variable definitions (``<name>=<value>``), in
+    the order they take effect, keyed by name.
+
+    Redefining a name replaces its definition in place, unless that would
+    change what a definition means: when the new value refers to the old one
+    (``PATH=/bin:$PATH``), to a variable defined after it, or when a later
+    definition refers to the old value. Then the new definition is added
+    after the others. ``references`` returns the names a definition refers
+    to; aliases are expanded where they're used, so they need none.
+    """
+
+    def __init__(self, references=None):
+        self._references = references
+        # Map of (name, position) => definition
+        self._definitions = {}
+        # Map of name => its keys in _definitions, latest last
+        self._keys = {}
+        # Map of name => latest position of a definition that refers to it
+        self._referenced_at = {}
+        self._position = 0
+
+    def __iter__(self):
+        return iter(self._definitions.values())
+
+    def __len__(self):
+        return len(self._definitions)
+
+    def __contains__(self, definition):
+        return definition in self._definitions.values()
+
+    def _latest_position(self, name):
+        keys = self._keys.get(name)
+        return keys[-1][1] if keys else -1
+
+    def add(self, definition):
+        name = definition_name(definition)
+        references = self._references(definition) if self._references else set()
+        position = self._latest_position(name)
+        if (
+            position >= 0
+            and name not in references
+            and self._referenced_at.get(name, -1) < position
+            and all(self._latest_position(ref) < position for ref in references)
+        ):
+            key = self._keys[name][-1]
+        else:
+            position = self._position
+            self._position += 1
+            key = (name, position)
+            self._keys.setdefault(name, []).append(key)
+        self._definitions[key] = definition
+        for ref in references:
+            self._referenced_at[ref] = max(self._referenced_at.get(ref, -1), position)
+
+    def remove(self, name):
+        """Remove every definition of ``name``. Returns None if it wasn't
+        defined.
+        """
+        keys = self._keys.pop(name, None)
+        if keys is None:
+            return None
+        for key in keys:
+            del self._definitions[key]
+        return True
+
+
 class SessionState(dict):
     """Stores information about a fake terminal session."""
 
     TRUTHY = {"true", "yes", "1"}
+    PYTHON_NAMESPACE_MODES = ("shared", "fresh")
 
     def __init__(
         self,
@@ -61,27 +188,31 @@ class SessionState(dict):
         extra_commands=None,
         test_mode=False,
         commentecho=False,
+        fresh_python=False,
     ):
-        aliases = aliases or []
-        envvars = envvars or []
         extra_commands = extra_commands or []
         dict.__init__(
             self,
             shell=shell,
             prompt_template=prompt_template,
             speed=speed,
-            aliases=aliases,
-            envvars=envvars,
+            aliases=Definitions(),
+            envvars=Definitions(references=variable_references),
             extra_commands=extra_commands,
             test_mode=test_mode,
             commentecho=commentecho,
+            fresh_python=fresh_python,
         )
+        for alias in aliases or []:
+            self.add_alias(alias)
+        for envvar in envvars or []:
+            self.add_envvar(envvar)
 
     def add_alias(self, alias):
-        self["aliases"].append(alias)
+        self["aliases"].add(alias)
 
     def add_envvar(self, envvar):
-        self["envvars"].append(envvar)
+        self["envvars"].add(envvar)
 
     def add_command(self, command):
         self["extra_commands"].append(command)
@@ -95,19 +226,11 @@ class SessionState(dict):
     def set_shell(self, shell):
         self["shell"] = shell
 
-    def _remove_var(self, key, variable):
-        for each in self[key]:
-            value, cmd = each.split("=")
-            if variable == value.strip():
-                self[key].remove(each)
-                return True
-        return None
-
     def remove_alias(self, alias):
-        return self._remove_var("aliases", alias)
+        return self["aliases"].remove(alias.strip())
 
     def remove_envvar(self, envvar):
-        return self._remove_var("envvars", envvar)
+        return self["envvars"].remove(envvar.strip())
 
     def commentecho(self, doit=None):
         if doit is not None:
@@ -115,6 +238,15 @@ class SessionState(dict):
             self["commentecho"] = doit in self.TRUTHY
         return self["commentecho"]
 
+    def set_python_namespace(self, mode):
+        mode = mode.strip().lower()
+        if mode not in self.PYTHON_NAMESPACE_MODES:
+            raise SessionError(
+                f'Invalid python mode "{mode}". '
+                f"Must be one of: {', '.join(self.PYTHON_NAMESPACE_MODES)}."
+            )
+        self["fresh_python"] = mode == "fresh"
+
 
 # Map of option names => function that modifies session state
 OPTION_MAP = {
@@ -126,9 +258,417 @@ OPTION_MAP = {
     "unalias": lambda state, arg: state.remove_alias(arg),
     "unset": lambda state, arg: state.remove_envvar(arg),
     "commentecho": lambda state, arg: state.commentecho(arg),
+    "python": lambda state, arg: state.set_python_namespace(arg),
+    # Setup commands are run before the session starts (see get_setup_commands)
+    "setup": lambda state, arg: None,
+    # Background jobs are started and awaited by run (see doitlive.jobs)
+    "background": lambda state, arg: None,
+    "await": lambda state, arg: None,
+    # The working directory is set up before the session starts (see get_workdir)
+    "workdir": lambda state, arg: None,
 }
 
-SHELL_RE = re.compile(r"```(python|ipython)")
+
+def step_position(steps, index):
+    """Return the position in ``steps`` of the first step at or after the
+    line at ``index``.
+    """
+    return bisect.bisect_left(steps, index, key=lambda step: step.index)
+
+
+def restart_point(old, new, steps):
+    """Find where to restart playing a session after it was edited from
+    ``old`` to ``new``, given the ``steps`` of ``old``. Only the part of
+    ``new`` from the first changed line on is parsed again.
+
+    Returns the index of the line to restart at and the steps of ``new``, or
+    None if the session didn't change.
+    """
+    if old == new:
+        return None
+    changed = next(
+        (i for i, (a, b) in enumerate(zip(old, new, strict=False)) if a != b),
+        min(len(old), len(new)),
+    )
+    start = changed
+    # Restart a changed code block from its opening fence
+    k = bisect.bisect_right(steps, changed, key=lambda step: step.index)
+    if k and changed < steps[k - 1].end:
+        start = steps[k - 1].index
+    kept = steps[: step_position(steps, start)]
+    return start, kept + parse_session(new, start, strict=False)
+
+
+def replay_state(steps, state, outputs=None):
+    """Bring ``state`` and the working directory up to date with ``steps``,
+    without typing or running them. Only what changes the session's state
+    is replayed: directives, ``alias`` and ``export`` commands, and ``cd``.
+    """
+    for step in steps:
+        if step.kind == DIRECTIVE:
+            # Background jobs aren't restarted
+            if step.option not in {"background", "await"}:
+                OPTION_MAP[step.option](state, step.arg)
+        elif step.kind == COMMAND:
+            command_as_list = shlex.split(step.text)
+            if command_as_list and command_as_list[0] in ["alias", "export"]:
+                state.add_command(step.text)
+            elif command_as_list and command_as_list[0] == "cd":
+                run_command(step.text, capture=True)
+            elif outputs is not None:
+                # Keep the captured outputs in step with the session
+                outputs.pop(step.text)
+
+
+def compile_python_blocks(steps):
+    """Compile the code in all ```python blocks ahead of playback, so that syntax
+    errors are reported before the session starts. Returns a dict mapping the
+    index of each block's opening fence to its compiled commands.
+    """
+    compiled_blocks = {}
+    compiler = None
+    for step in steps:
+        if step.shell_name != "python":
+            continue
+        from codeop import CommandCompiler
+
+        from doitlive.python_consoles import compile_commands
+
+        # Share the compiler between blocks so that __future__ imports carry over
+        compiler = compiler or CommandCompiler()
+        try:
+            compiled_blocks[step.index] = compile_commands(step.lines, compiler)
+        except SyntaxError as error:
+            lineno = step.lineno + (error.lineno or 1)
+            raise SessionError(
+                f"Invalid syntax in python code block on line {lineno} "
+                f"of session file: {error.msg}"
+            ) from error
+    return compiled_blocks
+
+
+def get_setup_commands(steps):
+    """Return the commands of a session's #doitlive setup directives."""
+    return [
+        step.arg.strip()
+        for step in steps
+        if step.kind == DIRECTIVE and step.option == "setup"
+    ]
+
+
+def get_workdir(steps):
+    """Return the fixture directory of a session's #doitlive workdir
+    directive, or None. If there are several, the last one wins.
+    """
+    workdir = None
+    for step in steps:
+        if step.kind == DIRECTIVE and step.option == "workdir":
+            workdir = step.arg.strip()
+    return workdir
+
+
+def start_setup(steps, shell):
+    """Start running a session's setup commands in the background, if it has
+    any. Returns the `doitlive.jobs.Setup`, or None.
+    """
+    setup_commands = get_setup_commands(steps)
+    if not setup_commands:
+        return None
+    from doitlive.jobs import Setup
+
+    setup = Setup(setup_commands, shell=shell or default_shell())
+    setup.start()
+    return setup
+
+
+def finish_setup(setup):
+    def progress(done, total):
+        echo(f"\rSetting up... {done}/{total}", nl=False)
+
+    progress(0, len(setup.commands))
+    try:
+        setup.wait(progress=progress)
+    finally:
+        echo()
+
+
+def has_ipython_block(steps):
+    return any(step.shell_name == "ipython" for step in steps)
+
+
+def estimate_session(steps, speed=1, runtimes=None):
+    """Walk the steps of a session and tally the work of playing it, section
+    by section. A
+    section is either a run of shell commands or a single code block.
+    ``runtimes`` maps shell commands to how long they take to run.
+
+    Returns a list of dicts with each section's name, first and last line
+    numbers, and its number of typed commands, key presses, and seconds of
+    known command runtime.
+    """
+    runtimes = runtimes or {}
+    state = SessionState(
+        shell=None,
+        prompt_template="default",
+        speed=speed,
+        test_mode=False,
+        commentecho=False,
+    )
+    sections = []
+
+    def tally(name, start, end, typed, runtime=0.0):
+        if sections and name == "shell" and sections[-1]["name"] == "shell":
+            section = sections[-1]
+        else:
+            section = {
+                "name": name,
+                "start": start,
+                "commands": 0,
+                "keystrokes": 0,
+                "runtime": 0.0,
+            }
+            sections.append(section)
+        section["end"] = end
+        section["commands"] += len(typed)
+        section["keystrokes"] += sum(
+            keystrokes_for(text, state["speed"]) for text in typed
+        )
+        section["runtime"] += runtime
+
+    for step in steps:
+        if step.kind == DIRECTIVE:
+            OPTION_MAP[step.option](state, step.arg)
+        elif step.kind == CODE:
+            if step.shell_name == "repl":
+                opener = step.command
+                name = f"repl block ({opener})"
+            else:
+                opener, name = step.shell_name, f"{step.shell_name} block"
+            # Up to the closing fence
+            tally(name, step.lineno, step.end - 1, [opener, *step.lines])
+            # RETURN to leave the block
+            sections[-1]["keystrokes"] += 1
+        elif step.kind == COMMAND:
+            runtime = runtimes.get(step.text, 0.0)
+            tally("shell", step.lineno, step.lineno, [step.text], runtime)
+    return sections
+
+
+# Words that aren't executables when they start a command
+SHELL_BUILTINS = frozenset(
+    """
+    . : [ [[ ]] ! { } alias bg bind break builtin caller cd command compgen
+    complete continue declare dirs disown echo enable eval exec exit export
+    false fc fg getopts hash help history jobs kill let local logout popd
+    printf pushd pwd read readonly return set shift shopt source suspend test
+    time times trap true type typeset ulimit umask unalias unset wait
+    if then else elif fi case esac for select while until do done function
+    """.split()
+)
+# Keywords that may be followed by a command
+SHELL_COMMAND_KEYWORDS = frozenset(
+    "! { } if then else elif fi while until do done esac time command exec".split()
+)
+# Keywords followed by words that aren't commands (up to the next separator)
+SHELL_LIST_KEYWORDS = frozenset("for select case function".split())
+COMMAND_SEPARATORS = frozenset(["|", "||", "|&", "&", "&&", ";", ";;", "(", ")"])
+ASSIGNMENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+
+def command_executables(command):
+    """Return the names of the programs a shell command line runs: the first
+    word of each command in its pipelines and lists.
+    """
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    executables = []
+    expect_command = True
+    skip_next = False
+    for token in lexer:
+        if skip_next:
+            skip_next = False
+        elif token in COMMAND_SEPARATORS:
+            expect_command = True
+        elif set(token) <= set(lexer.punctuation_chars):
+            # A redirection; the next word is a file name
+            skip_next = True
+        elif not expect_command:
+            continue
+        elif token in SHELL_COMMAND_KEYWORDS:
+            continue
+        elif token in SHELL_LIST_KEYWORDS:
+            expect_command = False
+        elif ASSIGNMENT_RE.match(token):
+            continue
+        else:
+            executables.append(token)
+            expect_command = False
+    return executables
+
+
+def check_session(commands):
+    """Check a session for problems that would come up while playing it:
+    missing programs, invalid code blocks and invalid directives.
+
+    Returns the number of commands checked and a list of (line number, problem).
+    """
+    state = SessionState(
+        shell=None,
+        prompt_template="default",
+        speed=1,
+        test_mode=False,
+        commentecho=False,
+    )
+    problems = []
+    try:
+        steps = parse_session(commands)
+    except SessionError as error:
+        # Check the steps before the unmatched code block
+        steps = parse_session(commands, strict=False)
+        problems.append((steps.pop().lineno, str(error)))
+    # Programs used by the session => the line numbers they are used on
+    programs = {}
+    num_commands = 0
+    background_names = set()
+    background_name = None
+    # The session's aliases and environment variables, by name
+    aliases = {}
+    variables = {}
+
+    def define(definitions, definition):
+        name, _, value = definition.partition("=")
+        try:
+            # Unquote the value, as the shell would
+            value = " ".join(shlex.split(value))
+        except ValueError:
+            pass
+        definitions[name.strip()] = value
+
+    def use(lineno, command):
+        try:
+            names = command_executables(command)
+        except ValueError as error:
+            problems.append((lineno, f"Invalid command: {error}"))
+            return
+        expanded = set()
+        for name in names:
+            if name in aliases and name not in expanded:
+                # Check what the alias runs instead
+                expanded.add(name)
+                try:
+                    names.extend(command_executables(aliases[name]))
+                except ValueError:
+                    pass
+                continue
+            if "$" in name:
+                name = os.path.expandvars(
+                    string.Template(name).safe_substitute(variables)
+                )
+                if "$" in name:
+                    continue
+            if name in SHELL_BUILTINS or os.sep in name:
+                continue
+            programs.setdefault(name, []).append(lineno)
+
+    def check_prompt(lineno, template):
+        try:
+            compile_prompt(THEMES.get(template) or template)
+        except ConfigurationError as error:
+            problems.append((lineno, f'Invalid prompt template "{template}": {error}'))
+
+    for step in steps:
+        lineno = step.lineno
+        if step.kind == DIRECTIVE:
+            option, arg = step.option, step.arg.strip()
+            if option in ("alias", "env") and "=" not in arg:
+                problems.append(
+                    (lineno, f'Invalid {option} "{arg}": must be <name>=<value>')
+                )
+                continue
+            try:
+                OPTION_MAP[option](state, arg)
+            except (SessionError, ValueError) as error:
+                problems.append((lineno, f"Invalid {option}: {error}"))
+                continue
+            if option == "alias":
+                define(aliases, arg)
+            elif option == "env":
+                define(variables, arg)
+            elif option == "unalias":
+                aliases.pop(arg, None)
+            elif option == "unset":
+                variables.pop(arg, None)
+            elif option == "speed" and state["speed"] < 1:
+                problems.append((lineno, f"Invalid speed: {arg}"))
+            elif option == "prompt":
+                check_prompt(lineno, arg)
+            elif option == "setup":
+                use(lineno, arg)
+            elif option == "workdir" and not os.path.isdir(arg):
+                problems.append((lineno, f"Directory not found: {arg}"))
+            elif option == "background":
+                background_name = arg
+            elif option == "await" and arg not in background_names:
+                problems.append((lineno, f'No background job named "{arg}"'))
+            elif option == "shell":
+                if os.sep not in arg:
+                    programs.setdefault(arg, []).append(lineno)
+                elif not os.access(arg, os.X_OK):
+                    problems.append((lineno, f"Shell not found: {arg}"))
+            continue
+        if step.kind == COMMENT:
+            match = DIRECTIVE_RE.match(step.text)
+            if match:
+                option = match.group("option")
+                problems.append((lineno, f'Unknown directive "{option}"'))
+            continue
+        num_commands += 1
+        if background_name:
+            if step.kind == CODE:
+                problems.append((lineno, "Code blocks can't be run in the background"))
+            elif step.is_definition:
+                problems.append(
+                    (lineno, "alias and export commands can't be run in the background")
+                )
+            else:
+                background_names.add(background_name)
+            background_name = None
+        if step.kind == CODE:
+            if step.shell_name == "repl":
+                use(lineno, step.command)
+                if step.prompt:
+                    try:
+                        re.compile(step.prompt)
+                    except re.error as error:
+                        problems.append(
+                            (
+                                lineno,
+                                f'Invalid repl prompt pattern "{step.prompt}": {error}',
+                            )
+                        )
+            elif step.shell_name == "ipython" and not importlib.util.find_spec(
+                "IPython"
+            ):
+                problems.append((lineno, "IPython is not installed"))
+            continue
+        command = step.text
+        if command.startswith("alias ") and "=" in command:
+            define(aliases, command[len("alias ") :])
+        elif command.startswith("export ") and "=" in command:
+            define(variables, command[len("export ") :])
+        use(lineno, command)
+
+    try:
+        compile_python_blocks(steps)
+    except SessionError as error:
+        problems.append((None, str(error)))
+
+    for name, path in find_executables(programs).items():
+        if path is None:
+            for lineno in programs[name]:
+                problems.append((lineno, f"Command not found: {name}"))
+    problems.sort(key=lambda problem: problem[0] or 0)
+    return num_commands, problems
 
 
 def stealthmode(state, is_run):
@@ -141,114 +681,330 @@ def stealthmode(state, is_run):
     return 1
 
 
-def run(
-    commands,
-    shell=None,
-    prompt_template="default",
-    speed=1,
-    quiet=False,
-    test_mode=False,
-    commentecho=False,
-):
-    """Main function for "magic-running" a list of commands."""
-    if not quiet:
-        secho("We'll do it live!", fg="red", bold=True)
-        secho(
-            "STARTING SESSION: Press Ctrl-C at any time to exit.",
-            fg="yellow",
-            bold=True,
+def start_job(jobs, name, command, state):
+    jobs.start(
+        name,
+        command,
+        shell=state["shell"] or default_shell(),
+        aliases=state["aliases"],
+        envvars=state["envvars"],
+        extra_commands=state["extra_commands"],
+    )
+    secho(f"[{name}] running in the background", dim=True)
+
+
+def await_job(jobs, name):
+    """Show the output of a background job, waiting for it to finish if
+    it is still running. Returns the job's exit status.
+    """
+    try:
+        if jobs is None:
+            raise SessionError(f'No background job named "{name}".')
+        job = jobs.get(name)
+    except SessionError as error:
+        # Carry on with the session, and fail like the shell's wait does
+        # for an unknown job
+        secho(str(error), fg="red")
+        return 127
+    status = job.follow(lambda data: echo(data, nl=False))
+    if status:
+        secho(f"[{name}] exited with status {status}", fg="red")
+    return status
+
+
+class StepRunner:
+    """Runs the steps of a session (see `doitlive.session`), shared by `run`
+    and `run_dry`.
+
+    With ``typing``, commands and code are magic-typed before they run, and
+    the presenter can navigate between them or switch to stealthmode. Without
+    it, they are echoed and run as fast as possible, and `run_step` returns
+    the exit status of each command, code block and awaited job.
+
+    If ``outputs`` (a `doitlive.outputs.CapturedOutputs`) is given, the
+    captured outputs are shown instead of running the commands.
+    """
+
+    def __init__(self, state, compiled_blocks, typing=True, outputs=None):
+        self.state = state
+        self.compiled_blocks = compiled_blocks
+        self.typing = typing
+        self.outputs = outputs
+        self.python_player = None
+        # Background jobs, and the name for the next command if it is to be one
+        self.jobs = None
+        self.background_name = None
+
+    def close(self):
+        if self.jobs:
+            self.jobs.reap()
+
+    def type(self, text):
+        """Show ``text`` being entered. Returns True if the presenter switched
+        to stealthmode.
+        """
+        if not self.typing:
+            secho(f"$ {text}", bold=True)
+            return False
+        return magictype(
+            text,
+            prompt_template=self.state["prompt_template"],
+            speed=self.state["speed"],
+            navigate=True,
         )
-        click.pause()
 
-    click.clear()
-    state = SessionState(
-        shell=shell,
-        prompt_template=prompt_template,
-        speed=speed,
-        test_mode=test_mode,
-        commentecho=commentecho,
-    )
+    def start_job(self, name, command):
+        if self.jobs is None:
+            from doitlive.jobs import BackgroundJobs
 
-    i = 0
-    while i < len(commands):
-        command = commands[i].strip()
-        i += 1
-        if not command:
-            continue
-        is_comment = command.startswith("#")
-        if not is_comment:
-            command_as_list = shlex.split(command)
-        else:
-            command_as_list = None
-        shell_match = SHELL_RE.match(command)
-        if is_comment:
+            self.jobs = BackgroundJobs()
+        start_job(self.jobs, name, command, self.state)
+
+    def run_step(self, step):
+        """Run a step. Returns an exit status, or None if the step has none
+        or it was typed.
+        """
+        state = self.state
+        if step.kind == DIRECTIVE:
             # Parse comment magic
-            match = OPTION_RE.match(command)
-            if match:
-                option, arg = match.group("option"), match.group("arg")
-                func = OPTION_MAP[option]
-                func(state, arg)
-            elif state.commentecho():
-                comment = command.lstrip("#")
+            if step.option == "background":
+                self.background_name = step.arg.strip()
+            elif step.option == "await":
+                return await_job(self.jobs, step.arg.strip())
+            else:
+                OPTION_MAP[step.option](state, step.arg)
+            return None
+        if step.kind == COMMENT:
+            if state.commentecho():
+                comment = step.text.lstrip("#")
                 secho(comment, fg="yellow", bold=True)
-            continue
+            return None
+        # Only the next command can be run in the background
+        job_name, self.background_name = self.background_name, None
         # Handle 'export' and 'alias' commands by storing them in SessionState
-        elif command_as_list and command_as_list[0] in ["alias", "export"]:
-            magictype(
-                command, prompt_template=state["prompt_template"], speed=state["speed"]
-            )
+        if step.is_definition:
+            self.type(step.text)
             # Store the raw commands instead of using add_envvar and add_alias
             # to avoid having to parse the command ourselves
-            state.add_command(command)
+            state.add_command(step.text)
+            return 0
+        if step.kind == CODE:
+            return self.run_code_block(step)
+        return self.run_command(step.text, job_name)
+
+    def run_code_block(self, step):
+        state = self.state
+        # Handle ```repl:<command> by running the command under a pseudo-terminal
+        if step.shell_name == "repl":
+            self.type(step.command)
+            from doitlive.repl import ReplPlayer
+
+            player = ReplPlayer(
+                step.command, speed=state["speed"], prompt_pattern=step.prompt
+            )
+            if not self.typing:
+                return player.run(step.lines)
+            player.play(step.lines)
+            return None
         # Handle ```python and ```ipython by running "player" consoles
-        elif shell_match:
-            shell_name = shell_match.groups()[0].strip()
-            py_commands = []
-            more = True
-            while more:  # slurp up all the python code
-                try:
-                    py_command = commands[i].rstrip()
-                except IndexError as error:
-                    raise SessionError(
-                        f"Unmatched {shell_name} code block in session file."
-                    ) from error
-                i += 1
-                if py_command.startswith("```"):
-                    i += 1
-                    more = False
-                else:
-                    py_commands.append(py_command)
-            # Run the player console
-            magictype(
-                shell_name,
-                prompt_template=state["prompt_template"],
-                speed=state["speed"],
+        self.type(step.shell_name)
+        if step.shell_name == "ipython":
+            if not self.typing:
+                from doitlive.ipython import run_ipython_commands
+
+                return 0 if run_ipython_commands(step.lines) else 1
+            from doitlive.ipython import start_ipython_player
+
+            # dedent all the commands to account for IPython's autoindentation
+            ipy_commands = [textwrap.dedent(cmd) for cmd in step.lines]
+            start_ipython_player(ipy_commands, speed=state["speed"])
+            return None
+        from doitlive.python_consoles import PythonPlayer
+
+        self.python_player = self.python_player or PythonPlayer()
+        compiled = self.compiled_blocks[step.index]
+        if not self.typing:
+            ok = self.python_player.run(compiled, fresh=state["fresh_python"])
+            return 0 if ok else 1
+        self.python_player.play(
+            step.lines,
+            speed=state["speed"],
+            fresh=state["fresh_python"],
+            compiled=compiled,
+        )
+        return None
+
+    def run_command(self, command, job_name=None):
+        """Run a shell command, or start it as the background job ``job_name``."""
+        state = self.state
+        if not self.typing:
+            self.type(command)
+            if job_name:
+                self.start_job(job_name, command)
+                return 0
+            status, _ = run_command(
+                command,
+                shell=state["shell"],
+                aliases=state["aliases"],
+                envvars=state["envvars"],
+                extra_commands=state["extra_commands"],
+                capture=True,
             )
+            return status
+        while True:
+            # goto_stealthmode determines when to switch to stealthmode
+            if job_name and self.outputs is None:
+                goto_stealthmode = self.type(command)
+                if not goto_stealthmode:
+                    self.start_job(job_name, command)
+            elif self.outputs is None:
+                goto_stealthmode = magicrun(command, navigate=True, **state)
+            else:
+                goto_stealthmode = self.type(command)
+                if not goto_stealthmode:
+                    captured = self.outputs.pop(command)
+                    if captured:
+                        echo(captured[1], nl=False)
+            # stealthmode allows user to type live commands outside of
+            # automated script, after which the command is typed again
+            if not stealthmode(state, goto_stealthmode):
+                return None
 
-            if shell_name == "ipython":
-                from doitlive.ipython import start_ipython_player
 
-                # dedent all the commands to account for IPython's autoindentation
-                ipy_commands = [textwrap.dedent(cmd) for cmd in py_commands]
-                start_ipython_player(ipy_commands, speed=state["speed"])
-            else:
-                start_python_player(py_commands, speed=state["speed"])
-        else:
-            # goto_stealthmode determines when to switch to stealthmode
-            goto_stealthmode = magicrun(command, **state)
-            # stealthmode allows user to type live commands outside of automated script
-            i -= stealthmode(state, goto_stealthmode)
+def run(
+    commands,
+    shell=None,
+    prompt_template="default",
+    speed=1,
+    quiet=False,
+    test_mode=False,
+    commentecho=False,
+    outputs=None,
+    start=0,
+):
+    """Main function for "magic-running" a list of commands.
+
+    If ``outputs`` (a `doitlive.outputs.CapturedOutputs`) is given, the
+    captured outputs are shown instead of running the commands. If ``start``
+    is given, playing starts at that index; see `replay_state`.
+    """
+    steps = parse_session(commands)
+    # The step to start at
+    first = step_position(steps, start)
+    compiled_blocks = compile_python_blocks(steps)
+    has_ipython = has_ipython_block(steps)
+    if has_ipython:
+        from doitlive.ipython import prewarm_ipython
+
+        # Load IPython while the presenter gets going
+        prewarm_ipython()
+    try:
+        # Likewise, setup commands run while the start screen is shown. Those
+        # before ``start`` have already run.
+        setup = start_setup(steps[first:], shell)
+        if not quiet:
+            secho("We'll do it live!", fg="red", bold=True)
+            secho(
+                "STARTING SESSION: Press Ctrl-C at any time to exit.",
+                fg="yellow",
+                bold=True,
+            )
+            try:
+                click.pause()
+            except BaseException:
+                if setup:
+                    setup.cancel()
+                raise
+        if setup:
+            finish_setup(setup)
+
+        click.clear()
+        state = SessionState(
+            shell=shell,
+            prompt_template=prompt_template,
+            speed=speed,
+            test_mode=test_mode,
+            commentecho=commentecho,
+        )
+        replay_state(steps[:first], state, outputs=outputs)
+        # The positions of the commands and code blocks, which the presenter
+        # can move between with the arrow keys
+        targets = [k for k, step in enumerate(steps) if step.kind in (COMMAND, CODE)]
+        target_index = {k: n for n, k in enumerate(targets)}
+
+        runner = StepRunner(state, compiled_blocks, outputs=outputs)
+        try:
+            k = first
+            while k < len(steps):
+                k += 1
+                try:
+                    runner.run_step(steps[k - 1])
+                except Navigation as navigation:
+                    # Moving forward skips the command. Moving back plays the
+                    # previous command (or code block) again.
+                    if navigation.offset < 0:
+                        k = targets[max(target_index[k - 1] - 1, 0)]
+        finally:
+            runner.close()
+    finally:
+        if has_ipython:
+            from doitlive.ipython import stop_ipython_player
+
+            stop_ipython_player()
     echo_prompt(state["prompt_template"])
     wait_for(RETURNS)
     if not quiet:
         secho("FINISHED SESSION", fg="yellow", bold=True)
 
 
+def run_dry(commands, shell=None):
+    """Run all of a session's commands as fast as possible, without typing
+    them, and stop at the first one that fails.
+
+    Returns a list with the line number, command, exit status and runtime
+    (in seconds) of each command that was run.
+    """
+    steps = parse_session(commands)
+    compiled_blocks = compile_python_blocks(steps)
+    setup = start_setup(steps, shell)
+    if setup:
+        finish_setup(setup)
+    state = SessionState(
+        shell=shell,
+        prompt_template="default",
+        speed=1,
+        test_mode=TESTING,
+        commentecho=False,
+    )
+    results = []
+    runner = StepRunner(state, compiled_blocks, typing=False)
+    try:
+        for step in steps:
+            started = time.monotonic()
+            status = runner.run_step(step)
+            if status is None:
+                continue
+            results.append((step.lineno, step.text, status, time.monotonic() - started))
+            if status != 0:
+                break
+    finally:
+        runner.close()
+    return results
+
+
+def echo_dry_run_results(results):
+    row = "{:>6}  {:>6}  {:>8}  {}"
+    secho(row.format("Line", "Status", "Time", "Command"), bold=True)
+    for lineno, command, status, seconds in results:
+        line = row.format(lineno, status, f"{seconds:.2f}s", command)
+        secho(line, fg="green" if status == 0 else "red")
+
+
 # Les CLI
 # #######
 
 
-@click.version_option(importlib.metadata.version("doitlive"), "--version", "-v")
+@click.version_option(None, "--version", "-v", package_name="doitlive")
 @click.group(cls=DYMGroup, context_settings={"help_option_names": ("-h", "--help")})
 def cli():
     """doitlive: A tool for "live" presentations in the terminal
@@ -266,7 +1022,10 @@ def cli():
 
     Example: doitlive play --help
     """
-    pass
+    try:
+        config.activate(config.load_config())
+    except ConfigurationError as error:
+        raise click.ClickException(str(error)) from error
 
 
 def preview_themes():
@@ -319,6 +1078,9 @@ def completion():
 
         eval (doitlive completion)
     """
+    import click_completion
+
+    click_completion.init()
     shell = env.get("SHELL", None)
     if env.get("SHELL", None):
         echo(
@@ -344,12 +1106,47 @@ QUIET_OPTION = click.option(
     show_default=False,
 )
 
+
+def config_default(name, fallback):
+    """Return a callable that gets the default value for an option from the
+    config file.
+    """
+    return lambda: config.active.default(name, fallback)
+
+
+def default_shell():
+    return (
+        env.get("DOITLIVE_INTERPRETER")
+        or config.active.default("shell")
+        or get_default_shell()
+    )
+
+
+class ThemeChoice(click.Choice):
+    """A choice of prompt theme, including the themes defined in the config
+    file, which is loaded after the options are defined.
+    """
+
+    def __init__(self):
+        super().__init__(tuple(THEMES))
+
+    @staticmethod
+    def _current():
+        return click.Choice(tuple(THEMES))
+
+    def convert(self, value, param, ctx):
+        return self._current().convert(value, param, ctx)
+
+    def shell_complete(self, ctx, param, incomplete):
+        return self._current().shell_complete(ctx, param, incomplete)
+
+
 ECHO_OPTION = click.option(
     "--commentecho",
     "-e",
-    help="Echo non-magic comments.",
+    help="Echo non-magic comments. [default: from config file, or off]",
     is_flag=True,
-    default=False,
+    default=config_default("commentecho", False),
     show_default=False,
 )
 
@@ -357,8 +1154,11 @@ SHELL_OPTION = click.option(
     "--shell",
     "-S",
     metavar="<shell>",
-    default=get_default_shell,
-    help=("The shell to use. [default: $DOITLIVE_INTERPRETER or $SHELL or /bin/bash]"),
+    default=default_shell,
+    help=(
+        "The shell to use. [default: $DOITLIVE_INTERPRETER or the config file's "
+        "shell or $SHELL or /bin/bash]"
+    ),
     show_default=False,
 )
 
@@ -367,19 +1167,19 @@ SPEED_OPTION = click.option(
     "-s",
     metavar="<int>",
     type=click.IntRange(1),
-    default=1,
-    help="Typing speed.",
-    show_default=True,
+    default=config_default("speed", 1),
+    help="Typing speed. [default: from config file, or 1]",
+    show_default=False,
 )
 
 PROMPT_OPTION = click.option(
     "--prompt",
     "-p",
     metavar="<prompt_theme>",
-    default="default",
-    type=click.Choice(THEMES.keys()),
-    help="Prompt theme.",
-    show_default=True,
+    default=config_default("prompt", "default"),
+    type=ThemeChoice(),
+    help='Prompt theme. [default: from config file, or "default"]',
+    show_default=False,
 )
 
 ALIAS_OPTION = click.option(
@@ -405,19 +1205,321 @@ player_command = _compose(
 recorder_command = _compose(SHELL_OPTION, PROMPT_OPTION, ALIAS_OPTION, ENVVAR_OPTION)
 
 
+def load_outputs(session_file):
+    path = outputs_path(session_file)
+    if not os.path.exists(path):
+        raise click.ClickException(
+            f"No captured outputs found for {session_file}. Record the session "
+            'with "doitlive record --capture" to capture them.'
+        )
+    try:
+        return CapturedOutputs(read_outputs(path))
+    except SessionError as error:
+        raise click.ClickException(str(error)) from error
+
+
 @player_command
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    help='Show the outputs captured by "doitlive record --capture" '
+    "instead of running commands.",
+)
+@click.option(
+    "--broadcast",
+    metavar="<address>",
+    help='Mirror the session to "doitlive watch" clients. '
+    "<address> is unix:<path> or tcp:<host>:<port>.",
+)
+@click.option(
+    "--profile",
+    metavar="<directory>",
+    type=click.Path(file_okay=False),
+    help="Profile doitlive's CPU and memory use while playing, and write "
+    "the reports to <directory>.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Run all commands without typing them, stopping at the first failure, "
+    "and report the exit status and runtime of each.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    default=False,
+    help="Watch the session file and play it again from the first changed "
+    "step whenever it changes.",
+)
 @click.argument("session_file", type=click.File("r", encoding="utf-8"))
 @cli.command()
-def play(quiet, session_file, shell, speed, prompt, commentecho):
+def play(
+    quiet,
+    session_file,
+    shell,
+    speed,
+    prompt,
+    commentecho,
+    offline,
+    broadcast,
+    profile,
+    dry_run,
+    watch,
+):
     """Play a session file."""
-    run(
-        session_file.readlines(),
-        shell=shell,
-        speed=speed,
-        quiet=quiet,
-        test_mode=TESTING,
-        prompt_template=prompt,
-        commentecho=commentecho,
+    commands = session_file.readlines()
+    if dry_run and offline:
+        raise click.UsageError("--dry-run and --offline are mutually exclusive.")
+    if watch and dry_run:
+        raise click.UsageError("--watch and --dry-run are mutually exclusive.")
+    if watch and session_file.name == "-":
+        raise click.UsageError("--watch can't watch standard input.")
+    # Resolved before a workdir directive changes the working directory
+    session_path = os.path.abspath(session_file.name)
+    outputs = load_outputs(session_path) if offline else None
+    with contextlib.ExitStack() as stack:
+        workdir = get_workdir(parse_session(commands, strict=False))
+        if workdir:
+            from doitlive.workdir import sandbox
+
+            try:
+                stack.enter_context(sandbox(workdir))
+            except (SessionError, OSError) as error:
+                raise click.ClickException(str(error)) from error
+        if dry_run:
+            play_dry(commands, shell=shell)
+            return
+        if profile:
+            from doitlive.profiling import profiling
+
+            stack.callback(echo, f"Profiling reports written to {profile}")
+            stack.enter_context(profiling(profile))
+        if broadcast:
+            from doitlive.broadcast import broadcasting
+
+            try:
+                stack.enter_context(broadcasting(broadcast))
+            except SessionError as error:
+                raise click.ClickException(str(error)) from error
+            echo(f"Broadcasting on {broadcast}")
+        options = dict(
+            shell=shell,
+            speed=speed,
+            quiet=quiet,
+            test_mode=TESTING,
+            prompt_template=prompt,
+            commentecho=commentecho,
+        )
+        if watch:
+            play_watch(session_path, commands, offline=offline, **options)
+        else:
+            run(commands, outputs=outputs, **options)
+
+
+def play_watch(path, commands, offline=False, **options):
+    """Play a session, then play it again from the first changed step each
+    time the session file changes, until the presenter presses Ctrl-C.
+    """
+    from doitlive.watcher import FileWatcher
+
+    cwd = os.getcwd()
+    steps = parse_session(commands, strict=False)
+    start = 0
+    with FileWatcher(path) as watcher:
+        while True:
+            # Directives and cd commands before ``start`` are replayed from here
+            os.chdir(cwd)
+            outputs = load_outputs(path) if offline else None
+            try:
+                run(commands, outputs=outputs, start=start, **options)
+            except click.Abort:
+                echo()
+            except SessionError as error:
+                secho(str(error), fg="red")
+            # Only show the start screen the first time
+            options["quiet"] = True
+            name = click.format_filename(path, shorten=True)
+            secho(f"Watching {name} for changes. Press Ctrl-C to exit.", dim=True)
+            point = None
+            while point is None:
+                try:
+                    watcher.wait()
+                except KeyboardInterrupt:
+                    echo()
+                    return
+                try:
+                    with open(path, "r", encoding="utf-8") as fp:
+                        new = fp.readlines()
+                except OSError:  # The file is being replaced
+                    continue
+                point = restart_point(commands, new, steps)
+            commands = new
+            start, steps = point
+
+
+def play_dry(commands, shell=None):
+    try:
+        results = run_dry(commands, shell=shell)
+    except SessionError as error:
+        raise click.ClickException(str(error)) from error
+    echo()
+    echo_dry_run_results(results)
+    failed = [result for result in results if result[2] != 0]
+    if failed:
+        lineno, command, status, _ = failed[0]
+        raise click.ClickException(
+            f'"{command}" (line {lineno}) failed with exit status {status}.'
+        )
+
+
+@click.argument("address")
+@cli.command()
+def watch(address):
+    """Watch a session broadcast with "doitlive play --broadcast".
+
+    <address> is unix:<path> or tcp:<host>:<port>.
+    """
+    from doitlive.broadcast import watch as watch_session
+
+    try:
+        watch_session(address)
+    except SessionError as error:
+        raise click.ClickException(str(error)) from error
+    except KeyboardInterrupt:
+        pass
+
+
+@click.argument("session_file", type=click.File("r", encoding="utf-8"))
+@cli.command()
+def check(session_file):
+    """Check a session file for problems before playing it.
+
+    \b
+    Checks that the programs used by the session are installed, and that
+    its code blocks and comment directives are valid.
+    """
+    num_commands, problems = check_session(session_file.readlines())
+    for lineno, problem in problems:
+        location = f"{session_file.name}:{lineno}" if lineno else session_file.name
+        secho(f"{location}: {problem}", fg="red")
+    if problems:
+        raise click.ClickException(
+            f"Found {len(problems)} problem(s) in {session_file.name}."
+        )
+    secho(f"Checked {num_commands} commands. No problems found.", fg="green")
+
+
+CALIBRATION_TEXT = "the quick brown fox jumps over the lazy dog"
+
+
+def calibrate():
+    """Measure the presenter's typing rate. Returns a timing record."""
+    echo("Type the following text, then press RETURN:")
+    secho(CALIBRATION_TEXT, bold=True)
+    _, key_times = recordtype("> ")
+    return to_deltas(key_times)
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+@SPEED_OPTION
+@click.option(
+    "--timing",
+    "timing_file",
+    metavar="<file>",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Timing file to take the typing rate from. "
+    "Defaults to <session_file>.timing, if it exists.",
+)
+@click.option(
+    "--calibrate",
+    "do_calibrate",
+    is_flag=True,
+    default=False,
+    help="Measure your typing rate before estimating.",
+)
+@click.argument("session_file", type=click.File("r", encoding="utf-8"))
+@cli.command()
+def estimate(session_file, speed, timing_file, do_calibrate):
+    """Estimate how long a session takes to play.
+
+    \b
+    The estimate is based on the number of key presses needed to type each
+    command, your typing rate and the runtime of commands captured with
+    "doitlive record --capture".
+    """
+    records = None
+    if do_calibrate:
+        records = [calibrate()]
+        source = "calibration"
+    else:
+        timing_file = timing_file or timing_path(session_file.name)
+        if os.path.exists(timing_file):
+            try:
+                records = read_timing(timing_file)
+            except SessionError as error:
+                raise click.ClickException(str(error)) from error
+            source = os.path.basename(timing_file)
+    stats = timing_stats(records) if records else None
+    if stats and stats["keys_per_second"]:
+        keys_per_second = stats["keys_per_second"]
+        think_time = stats["mean_think_time"]
+    else:
+        keys_per_second, think_time = DEFAULT_KEYS_PER_SECOND, DEFAULT_THINK_TIME
+        source = "default"
+
+    runtimes = {}
+    outputs_file = outputs_path(session_file.name)
+    if os.path.exists(outputs_file):
+        try:
+            runtimes = command_runtimes(read_outputs(outputs_file))
+        except SessionError as error:
+            raise click.ClickException(str(error)) from error
+
+    try:
+        sections = estimate_session(
+            parse_session(session_file.readlines()), speed=speed, runtimes=runtimes
+        )
+    except SessionError as error:
+        raise click.ClickException(str(error)) from error
+
+    echo(
+        f"Typing at {keys_per_second:.1f} keys/s with a {think_time:.1f}s pause "
+        f"before each command ({source})."
+    )
+    if not runtimes:
+        echo('No command runtimes captured; use "doitlive record --capture".')
+    echo()
+    row = "{:<10} {:<24} {:>8} {:>10} {:>8}"
+    secho(row.format("Lines", "Section", "Commands", "Keystrokes", "Time"), bold=True)
+    total = 0.0
+    for section in sections:
+        seconds = estimate_time(section, keys_per_second, think_time)
+        total += seconds
+        lines = f"{section['start']}-{section['end']}"
+        echo(
+            row.format(
+                lines,
+                section["name"],
+                section["commands"],
+                section["keystrokes"],
+                format_duration(seconds),
+            )
+        )
+    secho(
+        row.format(
+            "",
+            "Total",
+            sum(section["commands"] for section in sections),
+            sum(section["keystrokes"] for section in sections),
+            format_duration(total),
+        ),
+        bold=True,
     )
 
 
@@ -464,12 +1566,40 @@ def echo_rec_buffer(commands):
         echo("No commands in buffer.")
 
 
-def run_recorder(shell, prompt, aliases=None, envvars=None):
+def run_recorder(
+    shell, prompt, aliases=None, envvars=None, journal=None, timing=None, outputs=None
+):
+    """Run the recorder. Returns the list of recorded commands. If ``timing``
+    is a list, the typing timing of each recorded shell command is appended
+    to it (see doitlive.timing). Likewise, if ``outputs`` is a list, the
+    captured output of each shell command is appended to it (see doitlive.outputs).
+    """
     commands = []
+    # Timing of the key presses and captured output for each item in
+    # commands (None if not applicable)
+    command_timings = []
+    command_outputs = []
+
+    def add(*texts, deltas=None, output=None, journaled=False):
+        for text in texts:
+            commands.append(text)
+            command_timings.append(deltas)
+            command_outputs.append(output)
+            if journal and not journaled:
+                journal.add(text)
+
     prefix = "(" + style("REC", fg="red") + ") "
     while True:
         formatted_prompt = prefix + format_prompt(THEMES[prompt]) + " "
-        command = click.prompt(formatted_prompt, prompt_suffix="").strip()
+        if timing is None:
+            command = click.prompt(formatted_prompt, prompt_suffix="").strip()
+            deltas = None
+        else:
+            command, key_times = recordtype(formatted_prompt)
+            command = command.strip()
+            deltas = to_deltas(key_times)
+            if not command:
+                continue
 
         if command == STOP_COMMAND:
             break
@@ -478,27 +1608,43 @@ def run_recorder(shell, prompt, aliases=None, envvars=None):
         elif command == UNDO_COMMAND:
             if commands and click.confirm(f'Remove command? "{commands[-1].strip()}"'):
                 commands.pop()
+                command_timings.pop()
+                command_outputs.pop()
+                if journal:
+                    journal.undo()
                 secho("Removed command.", bold=True)
                 echo_rec_buffer(commands)
             else:
                 echo("No commands in buffer. Doing nothing.")
         elif command == "python":
-            commands.append("```python\n")
-            console = PythonRecorderConsole()
+            from doitlive.python_consoles import PythonRecorderConsole
+
+            add(PYTHON_FENCE)
+            # Journal each line as it is entered, rather than once the
+            # console exits
+            console = PythonRecorderConsole(on_input=journal and journal.add)
             console.interact()
-            commands.extend(console.commands)
-            commands.append("```\n\n")
+            add(*console.commands, journaled=True)
+            add(CLOSING_FENCE)
         elif command in HELP_COMMANDS:
             print_recorder_instructions()
         else:
-            commands.append(command + "\n\n")
-            run_command(
+            started = time.monotonic()
+            result = run_command(
                 command,
                 shell=shell,
                 aliases=aliases,
                 envvars=envvars,
                 test_mode=TESTING,
+                capture=outputs is not None,
             )
+            duration = time.monotonic() - started
+            output = (command, *result, duration) if outputs is not None else None
+            add(command + "\n\n", deltas=deltas, output=output)
+    if timing is not None:
+        timing.extend(deltas for deltas in command_timings if deltas is not None)
+    if outputs is not None:
+        outputs.extend(output for output in command_outputs if output is not None)
     return commands
 
 
@@ -520,23 +1666,98 @@ def print_recorder_instructions():
     echo()
 
 
+def write_session_file(session_file, shell, prompt, aliases, envvars, commands):
+    with open(session_file, "w", encoding="utf-8") as fp:
+        fp.write(HEADER_TEMPLATE.format(shell=shell, prompt=prompt))
+        write_directives(fp, "alias", aliases)
+        write_directives(fp, "env", envvars)
+        fp.write("\n")
+        fp.write("".join(commands))
+        fp.write("\n")
+
+
+def recover_session(session_file):
+    path = journal_path(session_file)
+    if not os.path.exists(path):
+        raise click.ClickException(f"No journal found for {session_file}.")
+    try:
+        header, commands = read_journal(path)
+    except SessionError as error:
+        raise click.ClickException(str(error)) from error
+    filename = click.format_filename(session_file)
+    secho(f"Recovered {len(commands)} commands from journal.", fg="yellow", bold=True)
+    secho(f"Writing to {filename}...", fg="cyan")
+    write_session_file(
+        session_file,
+        shell=header["shell"],
+        prompt=header["prompt"],
+        aliases=header["aliases"],
+        envvars=header["envvars"],
+        commands=commands,
+    )
+    os.remove(path)
+    play_cmd = style(f"doitlive play {filename}", bold=True)
+    echo(f"Done. Run {play_cmd} to play back your session.")
+
+
+def echo_timing_stats(records):
+    stats = timing_stats(records)
+    echo(
+        "Typing: {keystrokes} keystrokes at {keys_per_second:.1f} keys/s, "
+        "{mean_think_time:.1f}s average pause before each command.".format(**stats)
+    )
+
+
 @recorder_command
+@click.option(
+    "--capture",
+    is_flag=True,
+    default=False,
+    help="Also capture command outputs to a <session_file>.outputs.gz file, "
+    "for playing back with --offline.",
+)
+@click.option(
+    "--timing",
+    "record_timing",
+    is_flag=True,
+    default=False,
+    help="Also record typing timing to a <session_file>.timing file.",
+)
+@click.option(
+    "--recover",
+    is_flag=True,
+    default=False,
+    help="Recover the session file from the journal of an interrupted recording.",
+)
 @click.argument(
     "session_file", default="session.sh", type=click.Path(dir_okay=False, writable=True)
 )
 @cli.command()
-def record(session_file, shell, prompt, alias, envvar):
+def record(session_file, shell, prompt, alias, envvar, recover, record_timing, capture):
     """Record a session file. If no argument is passed, commands are written to
     ./session.sh.
 
     When you are finished recording, run the "stop" command.
+
+    Commands are also written to a journal file as they are entered. If a
+    recording is interrupted, run "doitlive record --recover" to recover it.
     """
+    if recover:
+        recover_session(session_file)
+        return
     if os.path.exists(session_file):
         click.confirm(
             f'File "{session_file}" already exists. Overwrite?',
             abort=True,
             default=False,
         )
+    if os.path.exists(journal_path(session_file)):
+        click.confirm(
+            f'Found the journal of an interrupted recording of "{session_file}" '
+            '(run "doitlive record --recover" to recover it). Discard it?',
+            abort=True,
+            default=False,
+        )
 
     secho("We'll do it live!", fg="red", bold=True)
     filename = click.format_filename(session_file)
@@ -549,19 +1770,34 @@ def record(session_file, shell, prompt, alias, envvar):
     cwd = os.getcwd()  # Save cwd
 
     # Run the recorder
-    commands = run_recorder(shell, prompt, aliases=alias, envvars=envvar)
+    journal = RecorderJournal(journal_path(session_file))
+    journal.open(shell, prompt, aliases=alias, envvars=envvar)
+    timing = [] if record_timing else None
+    outputs = [] if capture else None
+    try:
+        commands = run_recorder(
+            shell,
+            prompt,
+            aliases=alias,
+            envvars=envvar,
+            journal=journal,
+            timing=timing,
+            outputs=outputs,
+        )
+    finally:
+        journal.close()
 
     os.chdir(cwd)  # Reset cwd
 
     secho("FINISHED RECORDING SESSION", fg="yellow", bold=True)
     secho(f"Writing to {filename}...", fg="cyan")
-    with open(session_file, "w", encoding="utf-8") as fp:
-        fp.write(HEADER_TEMPLATE.format(shell=shell, prompt=prompt))
-        write_directives(fp, "alias", alias)
-        write_directives(fp, "env", envvar)
-        fp.write("\n")
-        fp.write("".join(commands))
-        fp.write("\n")
+    write_session_file(session_file, shell, prompt, alias, envvar, commands)
+    journal.remove()
+    if timing is not None:
+        write_timing(timing_path(session_file), timing)
+        echo_timing_stats(timing)
+    if outputs is not None:
+        write_outputs(outputs_path(session_file), outputs)
 
     play_cmd = style(f"doitlive play {filename}", bold=True)
     echo(f"Done. Run {play_cmd} to play back your session.")
@@ -0,0 +1,176 @@
+"""User configuration, read from ``~/.config/doitlive/config.toml``.
+
+The config file sets defaults for command-line options and defines custom
+prompt themes:
+
+.. code-block:: toml
+
+    [defaults]
+    speed = 2
+    shell = "/bin/zsh"
+    commentecho = true
+    prompt = "mine"
+
+    [themes]
+    mine = "{user.cyan} {dir.bold} $"
+
+The parsed and compiled config is cached on disk, keyed by the config file's
+modification time, so that it is only parsed again when it changes.
+"""
+
+import json
+import os
+import sys
+
+from doitlive.exceptions import ConfigurationError
+from doitlive.styling import THEMES, CompiledPrompt, add_theme, parse_prompt
+
+# Bump when the format of the cache changes
+CACHE_VERSION = 1
+# Map of option names => their type
+DEFAULT_TYPES = {"speed": int, "shell": str, "commentecho": bool, "prompt": str}
+BUILTIN_THEMES = dict(THEMES)
+
+
+def config_path():
+    if os.environ.get("DOITLIVE_CONFIG"):
+        return os.environ["DOITLIVE_CONFIG"]
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(
+        os.path.expanduser("~"), ".config"
+    )
+    return os.path.join(config_home, "doitlive", "config.toml")
+
+
+def cache_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "doitlive", "config.json")
+
+
+class Config:
+    """Defaults for command-line options, and custom prompt themes (by name)
+    as `doitlive.styling.CompiledPrompt` objects.
+    """
+
+    def __init__(self, defaults=None, themes=None):
+        self.defaults = defaults or {}
+        self.themes = themes or {}
+
+    def default(self, name, fallback=None):
+        return self.defaults.get(name, fallback)
+
+
+def _check_type(name, value, expected):
+    # bool is a subclass of int, but `speed = true` is a mistake
+    if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+        raise ConfigurationError(
+            f'"{name}" must be a {expected.__name__}, not {value!r}.'
+        )
+
+
+def parse_config(data):
+    """Validate the contents of a config file and compile its themes.
+
+    Returns a dict of the defaults and of the themes' templates and parsed
+    parts, which can be stored as JSON.
+    """
+    unknown = set(data) - {"defaults", "themes"}
+    if unknown:
+        raise ConfigurationError(f'Unknown section "{sorted(unknown)[0]}".')
+    defaults = data.get("defaults", {})
+    themes = data.get("themes", {})
+    _check_type("defaults", defaults, dict)
+    _check_type("themes", themes, dict)
+
+    compiled = {}
+    for name, template in themes.items():
+        _check_type(f"themes.{name}", template, str)
+        try:
+            compiled[name] = {"template": template, "parts": parse_prompt(template)}
+        except ConfigurationError as error:
+            raise ConfigurationError(f'Theme "{name}": {error}') from error
+    for name, value in defaults.items():
+        if name not in DEFAULT_TYPES:
+            raise ConfigurationError(f'Unknown default "{name}".')
+        _check_type(f"defaults.{name}", value, DEFAULT_TYPES[name])
+    if defaults.get("speed", 1) < 1:
+        raise ConfigurationError('"defaults.speed" must be at least 1.')
+    prompt = defaults.get("prompt")
+    if prompt is not None and prompt not in BUILTIN_THEMES and prompt not in themes:
+        raise ConfigurationError(f'"defaults.prompt": unknown theme "{prompt}".')
+    return {"defaults": defaults, "themes": compiled}
+
+
+def _read_toml(path):
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:
+        import tomli as tomllib
+    with open(path, "rb") as fp:
+        try:
+            return tomllib.load(fp)
+        except tomllib.TOMLDecodeError as error:
+            raise ConfigurationError(str(error)) from error
+
+
+def _read_cache(path, key):
+    try:
+        with open(path, encoding="utf-8") as fp:
+            cached = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != CACHE_VERSION or cached.get("key") != key:
+        return None
+    return cached["config"]
+
+
+def _write_cache(path, key, config):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump({"version": CACHE_VERSION, "key": key, "config": config}, fp)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # The cache is only an optimization
+
+
+def load_config(path=None, cache=None):
+    """Load the config file at ``path``, using the cached result if the file
+    hasn't changed since it was cached. Returns an empty Config if there is
+    no config file.
+    """
+    path = path or config_path()
+    cache = cache or cache_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return Config()
+    key = [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+    parsed = _read_cache(cache, key)
+    if parsed is None:
+        try:
+            parsed = parse_config(_read_toml(path))
+        except (ConfigurationError, OSError) as error:
+            raise ConfigurationError(f"Invalid config file {path}: {error}") from error
+        _write_cache(cache, key, parsed)
+    themes = {
+        name: CompiledPrompt(theme["template"], theme["parts"])
+        for name, theme in parsed["themes"].items()
+    }
+    return Config(parsed["defaults"], themes)
+
+
+# The config in use, set when the CLI starts
+active = Config()
+
+
+def activate(config):
+    """Use ``config`` for defaults, and make its themes available."""
+    global active
+    active = config
+    THEMES.clear()
+    THEMES.update(BUILTIN_THEMES)
+    for name, compiled in config.themes.items():
+        add_theme(name, compiled)
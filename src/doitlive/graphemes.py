@@ -0,0 +1,108 @@
+"""Splitting of commands into grapheme clusters (user-perceived characters),
+so that typing never splits a character made of several code points, such as
+a letter with combining accents or an emoji ZWJ sequence.
+
+Implements the parts of the Unicode text segmentation rules (UAX #29) that
+matter for commands typed on a single line.
+"""
+
+import functools
+import unicodedata
+from itertools import pairwise
+
+ZWJ = "\u200d"
+VS16 = "\ufe0f"  # Requests emoji presentation
+# Number of typing plans cached, for sessions with many commands
+PLAN_CACHE_SIZE = 1024
+
+
+def _is_regional_indicator(char):
+    return "\U0001f1e6" <= char <= "\U0001f1ff"
+
+
+def _extends(char):
+    """Whether ``char`` belongs to the grapheme cluster before it."""
+    return (
+        # Combining marks, including variation selectors
+        unicodedata.category(char) in {"Mn", "Me", "Mc"}
+        or char == ZWJ
+        # Emoji skin tone modifiers
+        or "\U0001f3fb" <= char <= "\U0001f3ff"
+        # Tags, used by subdivision flags
+        or "\U000e0020" <= char <= "\U000e007f"
+    )
+
+
+def grapheme_boundaries(text):
+    """Return the indices at which the grapheme clusters of ``text`` start,
+    followed by ``len(text)``.
+    """
+    boundaries = [0]
+    previous = None
+    # Number of regional indicators in a row; they pair up into flags
+    regional_indicators = 0
+    for i, char in enumerate(text):
+        is_regional_indicator = _is_regional_indicator(char)
+        joined = (
+            _extends(char)
+            or previous == ZWJ
+            or (is_regional_indicator and regional_indicators % 2 == 1)
+        )
+        if i and not joined:
+            boundaries.append(i)
+        regional_indicators = regional_indicators + 1 if is_regional_indicator else 0
+        previous = char
+    if text:
+        boundaries.append(len(text))
+    return boundaries
+
+
+def cluster_width(cluster):
+    """Return the number of terminal columns a grapheme cluster takes up."""
+    base = cluster[0]
+    if (
+        VS16 in cluster
+        or _is_regional_indicator(base)
+        or unicodedata.east_asian_width(base) in {"W", "F"}
+    ):
+        return 2
+    if unicodedata.category(base) in {"Mn", "Me", "Cf"}:
+        return 0
+    return 1
+
+
+class TypingPlan:
+    """A command split into grapheme clusters, for typing it key press by
+    key press. Positions are counted in clusters.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.boundaries = grapheme_boundaries(text)
+        self.widths = [
+            cluster_width(text[start:end]) for start, end in pairwise(self.boundaries)
+        ]
+
+    def __len__(self):
+        return len(self.widths)
+
+    def chunk(self, position, speed):
+        """Return the text typed by a key press at ``position``, ``speed``
+        clusters at a time, and the position after it.
+        """
+        end = min(position + speed, len(self.widths))
+        return self.text[self.boundaries[position] : self.boundaries[end]], end
+
+    def typed(self, position):
+        """Return the text typed before ``position``."""
+        return self.text[: self.boundaries[position]]
+
+    def erase(self, position):
+        """Return what to echo to erase the cluster before ``position``."""
+        width = self.widths[position - 1]
+        return "\b" * width + " " * width + "\b" * width
+
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def typing_plan(text):
+    return TypingPlan(text)
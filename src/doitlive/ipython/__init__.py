@@ -1,9 +1,63 @@
+import textwrap
+import threading
+
+_prewarm_thread = None
+
+
+def _prewarm():
+    try:
+        from doitlive.ipython.app import PlayerTerminalIPythonApp
+    except ImportError:
+        # start_ipython_player will report the error when the block is reached
+        return
+    PlayerTerminalIPythonApp.instance()
+
+
+def prewarm_ipython():
+    """Import IPython and construct the player app in a background thread, so
+    that switching into an ipython block later on does not stall the session.
+    """
+    global _prewarm_thread
+    if _prewarm_thread is None:
+        _prewarm_thread = threading.Thread(target=_prewarm, daemon=True)
+        _prewarm_thread.start()
+    return _prewarm_thread
+
+
 def start_ipython_player(commands, speed):
+    if _prewarm_thread is not None:
+        _prewarm_thread.join()
     try:
         from doitlive.ipython.app import PlayerTerminalIPythonApp
     except ImportError as error:
         raise RuntimeError("ipython blocks require IPython to be installed") from error
 
-    PlayerTerminalIPythonApp.commands = commands
-    PlayerTerminalIPythonApp.speed = speed
-    PlayerTerminalIPythonApp.launch_instance()
+    PlayerTerminalIPythonApp.instance().play(commands, speed=speed)
+
+
+def run_ipython_commands(commands):
+    """Run the commands of an ipython block without typing them. Returns
+    whether they ran without errors.
+    """
+    try:
+        from IPython.core.interactiveshell import InteractiveShell
+    except ImportError as error:
+        raise RuntimeError("ipython blocks require IPython to be installed") from error
+
+    result = InteractiveShell.instance().run_cell(textwrap.dedent("\n".join(commands)))
+    return result.success
+
+
+def stop_ipython_player():
+    """Discard the IPython player (and its user namespace) at the end of a session."""
+    global _prewarm_thread
+    if _prewarm_thread is not None:
+        _prewarm_thread.join()
+        _prewarm_thread = None
+    try:
+        from doitlive.ipython.app import PlayerTerminalIPythonApp
+    except ImportError:
+        return
+    if PlayerTerminalIPythonApp.initialized():
+        PlayerTerminalIPythonApp.instance().end_session()
+        PlayerTerminalIPythonApp.clear_instance()
@@ -1,7 +1,5 @@
 """doitlive IPython support."""
 
-import itertools as it
-
 from click import Abort
 from IPython.terminal.interactiveshell import TerminalInteractiveShell
 from IPython.terminal.ipapp import TerminalIPythonApp
@@ -36,6 +34,13 @@ class DoitliveTerminalInteractiveShell(TerminalInteractiveShell):
     """A magic IPython terminal shell."""
 
     def __init__(self, commands, speed=1, *args, **kwargs):
+        self.load_commands(commands, speed=speed)
+        super().__init__(*args, **kwargs)
+
+    def load_commands(self, commands, speed=1):
+        """Load the commands for the next ipython block. The user namespace
+        is left untouched, so state carries over from previous blocks.
+        """
         self.commands = commands or []
         self.speed = speed
 
@@ -44,14 +49,21 @@ class DoitliveTerminalInteractiveShell(TerminalInteractiveShell):
         # Index of current character in current command
         self.current_command_pos = 0
 
-        super().__init__(*args, **kwargs)
-
     def next_keys(self, key_presses):
-        return list(
-            it.chain.from_iterable(
-                [self._next_keys(key_press) for key_press in key_presses]
-            )
-        )
+        keys = []
+        for key_press in key_presses:
+            for key in self._next_keys(key_press):
+                # Merge consecutive chunks of text into a single paste so that
+                # prompt_toolkit only redraws once for all of them
+                if (
+                    key.key == Keys.BracketedPaste
+                    and keys
+                    and keys[-1].key == Keys.BracketedPaste
+                ):
+                    keys[-1] = KeyPress(Keys.BracketedPaste, keys[-1].data + key.data)
+                else:
+                    keys.append(key)
+        return keys
 
     def _next_keys(self, key_press):
         """Handles the magic typing when a key is pressed"""
@@ -70,7 +82,9 @@ class DoitliveTerminalInteractiveShell(TerminalInteractiveShell):
         if self.current_command_pos < len(self.current_command()):
             current_keys = self.current_command_keys()
             self.advance()
-            return [KeyPress(k) for k in current_keys]
+            # Insert the whole chunk at once, like a bracketed paste, rather than
+            # as one key press (and one redraw) per character
+            return [KeyPress(Keys.BracketedPaste, current_keys)]
 
         # Command is finished, wait for Enter
         if key_press.key != Keys.Enter:
@@ -93,6 +107,22 @@ class DoitliveTerminalInteractiveShell(TerminalInteractiveShell):
             [self.speed, len(self.current_command()) - self.current_command_pos]
         )
 
+    # Override TerminalInteractiveShell
+    # Unlike the parent implementation, this doesn't run the at-exit
+    # operations (which clear the user namespace), so that the shell can be
+    # reused for subsequent ipython blocks. See PlayerTerminalIPythonApp.end_session.
+    def mainloop(self):
+        while True:
+            try:
+                self.interact()
+                break
+            except KeyboardInterrupt as e:
+                print(f"\n{type(e).__name__} escaped interact()\n")
+            finally:
+                if hasattr(self, "_eventloop"):
+                    self._eventloop.stop()
+                self.restore_term_title()
+
     # Override TerminalInteractiveShell
     # Much of this is copy-and-pasted from the parent class implementation
     # due to lack of hooks
@@ -135,6 +165,26 @@ class PlayerTerminalIPythonApp(TerminalIPythonApp):
     commands = tuple()
     speed = 1
 
+    def play(self, commands, speed=1):
+        """Play a block of commands. The shell (and its user namespace) is
+        created for the first block and reused for the rest of the session.
+        """
+        if self.shell is None:
+            self.commands = commands
+            self.speed = speed
+            self.initialize()
+        else:
+            self.shell.load_commands(commands, speed=speed)
+        self.start()
+
+    def end_session(self):
+        """Run the shell's at-exit operations and discard it."""
+        if self.shell is not None:
+            if hasattr(self.shell, "_atexit_once"):
+                self.shell._atexit_once()
+            DoitliveTerminalInteractiveShell.clear_instance()
+            self.shell = None
+
     # Ignore command line args, since this will be run from the doitlive CLI
     def parse_command_line(self, argv=None):
         return None
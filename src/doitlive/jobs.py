@@ -0,0 +1,225 @@
+"""Commands that run outside of the typed session: ``#doitlive setup``
+commands, which run before the session starts, and ``#doitlive background``
+jobs, which run while the session continues.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from tempfile import NamedTemporaryFile
+
+from doitlive.exceptions import SessionError
+from doitlive.keyboard import write_script
+
+# Maximum number of setup commands run at once
+SETUP_WORKERS = 4
+# Seconds to wait for background jobs to exit after being terminated
+REAP_TIMEOUT = 2
+
+
+def start_in_shell(command, shell):
+    """Start running ``command`` without a terminal. Returns the process."""
+    return subprocess.Popen(
+        [shell, "-c", command],
+        # Keep commands from reading the presenter's key presses
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def run_in_shell(command, shell):
+    """Run ``command`` without a terminal. Returns (returncode, output)."""
+    proc = start_in_shell(command, shell)
+    output, _ = proc.communicate()
+    return proc.returncode, output
+
+
+class Setup:
+    """Runs a session's setup commands concurrently, in a bounded pool of
+    worker threads.
+    """
+
+    def __init__(self, commands, shell, max_workers=SETUP_WORKERS):
+        self.commands = commands
+        self.shell = shell
+        self.max_workers = max_workers
+        self._pool = None
+        self._futures = {}
+        self._procs = []
+        # Guards _procs and _cancelled, so that no command starts after cancel
+        # has stopped the running ones
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(self.commands)),
+            thread_name_prefix="doitlive-setup",
+        )
+        self._futures = {
+            self._pool.submit(self._run, command): command for command in self.commands
+        }
+
+    def _run(self, command):
+        with self._lock:
+            if self._cancelled:
+                return None, b""
+            proc = start_in_shell(command, self.shell)
+            self._procs.append(proc)
+        output, _ = proc.communicate()
+        return proc.returncode, output
+
+    def wait(self, progress=None):
+        """Wait for all setup commands to finish. ``progress`` is called with
+        the number of finished commands and the total each time one finishes.
+
+        Raises a SessionError as soon as a command fails.
+        """
+        pending = set(self._futures)
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    returncode, output = future.result()
+                    if returncode != 0:
+                        command = self._futures[future]
+                        output = output.decode("utf-8", errors="replace").rstrip()
+                        raise SessionError(
+                            f'Setup command "{command}" failed with exit status '
+                            f"{returncode}.\n{output}".rstrip()
+                        )
+                if progress:
+                    progress(len(self._futures) - len(pending), len(self._futures))
+        finally:
+            if pending:
+                self.cancel()
+            else:
+                self._pool.shutdown(wait=False)
+
+    def cancel(self):
+        """Stop all setup commands that haven't finished."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._cancelled = True
+            procs = list(self._procs)
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+
+
+class BackgroundJob:
+    """A command running in the background. Its output is collected in a
+    buffer until it is awaited.
+    """
+
+    def __init__(
+        self, name, command, shell, aliases=None, envvars=None, extra_commands=None
+    ):
+        self.name = name
+        self.command = command
+        self.output = bytearray()
+        self.returncode = None
+        self._changed = threading.Condition()
+        # The script is removed once the job has finished
+        with NamedTemporaryFile("w", delete=False) as fp:
+            write_script(fp, command, shell, aliases, envvars, extra_commands)
+        self._script = fp.name
+        self.proc = subprocess.Popen(
+            [shell, self._script],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            # Put the job in its own process group, so that it doesn't get the
+            # presenter's Ctrl-C and so that all of its processes can be stopped
+            start_new_session=True,
+        )
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        fd = self.proc.stdout.fileno()
+        while True:
+            data = os.read(fd, 4096)
+            if not data:
+                break
+            with self._changed:
+                self.output += data
+                self._changed.notify_all()
+        self.proc.stdout.close()
+        returncode = self.proc.wait()
+        os.remove(self._script)
+        with self._changed:
+            self.returncode = returncode
+            self._changed.notify_all()
+
+    @property
+    def done(self):
+        return self.returncode is not None
+
+    def follow(self, write):
+        """Pass the job's output so far to ``write``, then keep passing its
+        output on as it arrives until the job finishes. Returns the job's exit
+        status.
+        """
+        position = 0
+        while True:
+            with self._changed:
+                while len(self.output) == position and not self.done:
+                    self._changed.wait()
+                chunk = bytes(self.output[position:])
+                done = self.done
+            position += len(chunk)
+            if chunk:
+                write(chunk)
+            elif done:
+                return self.returncode
+
+    def stop(self, timeout=REAP_TIMEOUT):
+        """Stop the job (and any processes it started) if it is still running."""
+        if self.proc.poll() is None or self._reader.is_alive():
+            self._signal(signal.SIGTERM)
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self._signal(signal.SIGKILL)
+                self.proc.wait()
+        self._reader.join(timeout)
+
+    def _signal(self, signum):
+        if not hasattr(os, "killpg"):  # Windows
+            self.proc.terminate()
+            return
+        try:
+            os.killpg(self.proc.pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+class BackgroundJobs:
+    """The background jobs of a session, by name."""
+
+    def __init__(self):
+        self.jobs = {}
+
+    def start(self, name, command, **kwargs):
+        if name in self.jobs:
+            # Reusing a name replaces the earlier job
+            self.jobs.pop(name).stop()
+        job = BackgroundJob(name, command, **kwargs)
+        self.jobs[name] = job
+        return job
+
+    def get(self, name):
+        try:
+            return self.jobs[name]
+        except KeyError as error:
+            raise SessionError(f'No background job named "{name}".') from error
+
+    def reap(self):
+        """Stop all jobs that are still running."""
+        for job in self.jobs.values():
+            job.stop()
+        self.jobs.clear()
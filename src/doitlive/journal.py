@@ -0,0 +1,102 @@
+"""Write-ahead journal for the recorder. Each command is appended to the
+journal as soon as it is entered, so that an interrupted recording can be
+recovered with ``doitlive record --recover``.
+"""
+
+import json
+import os
+
+from doitlive.exceptions import SessionError
+
+JOURNAL_SUFFIX = ".journal"
+# The fences around the python blocks the recorder writes
+PYTHON_FENCE = "```python\n"
+CLOSING_FENCE = "```\n\n"
+
+
+def journal_path(session_file):
+    return os.path.abspath(session_file) + JOURNAL_SUFFIX
+
+
+class RecorderJournal:
+    """Append-only log of the commands in the recorder's buffer. Undoing a
+    command is recorded as a tombstone rather than by rewriting the journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fp = None
+
+    def open(self, shell, prompt, aliases=None, envvars=None):
+        self._fp = open(self.path, "w", encoding="utf-8")
+        header = {
+            "shell": shell,
+            "prompt": prompt,
+            "aliases": list(aliases or []),
+            "envvars": list(envvars or []),
+        }
+        self._write(header)
+
+    def add(self, text):
+        self._write(["add", text])
+
+    def undo(self):
+        self._write(["undo"])
+
+    def _write(self, entry):
+        self._fp.write(json.dumps(entry) + "\n")
+        # Entries are written at most once per line the presenter enters, so
+        # each one is synced to survive e.g. a power loss, not just flushed
+        # to survive the process being killed
+        self.sync()
+
+    def sync(self):
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+    def close(self):
+        if self._fp is not None:
+            self.sync()
+            self._fp.close()
+            self._fp = None
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+def read_journal(path):
+    """Replay a recorder journal. Returns the header (a dict with the
+    shell, prompt, aliases and envvars of the recording) and the list of
+    recorded commands. A python block that was being recorded when the
+    recorder was interrupted is closed.
+    """
+    try:
+        with open(path, encoding="utf-8") as fp:
+            lines = fp.readlines()
+    except OSError as error:
+        raise SessionError(f"Could not read journal {path}: {error}") from error
+    try:
+        header = json.loads(lines[0])
+    except (IndexError, ValueError) as error:
+        raise SessionError(f"Journal {path} is empty or corrupt.") from error
+    commands = []
+    for line in lines[1:]:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # The last entry may be incomplete if the recorder was interrupted
+            break
+        if entry[0] == "add":
+            commands.append(entry[1])
+        elif entry[0] == "undo" and commands:
+            commands.pop()
+    in_python_block = False
+    for command in commands:
+        if command == PYTHON_FENCE:
+            in_python_block = True
+        elif command == CLOSING_FENCE:
+            in_python_block = False
+    if in_python_block:
+        commands.append(CLOSING_FENCE)
+    return header, commands
@@ -1,14 +1,19 @@
 import os
+import select
 import shlex
 import signal
 import subprocess
+import sys
+import time
 from tempfile import NamedTemporaryFile
 
 import click
 from click import getchar
 
-from doitlive.styling import echo, echo_prompt
-from doitlive.termutils import get_default_shell, raw_mode
+from doitlive.graphemes import typing_plan
+from doitlive.styling import echo, echo_prompt, prefetch_prompt
+from doitlive.termutils import get_default_shell, raw_mode, run_tee
+from doitlive.version_control import may_change_vcs_state
 
 env = os.environ
 
@@ -19,11 +24,162 @@ CTRLL = "\x0c"
 CTRLZ = "\x1a"
 TAB = "\x09"
 RETURNS = {"\r", "\n"}
+UP = "\x1b[A"
+DOWN = "\x1b[B"
+RIGHT = "\x1b[C"
+LEFT = "\x1b[D"
+HOME = "\x1b[H"
+END = "\x1b[F"
+
+WINDOWS = os.name == "nt"
+# Seconds to wait for the rest of an escape sequence after an ESC. If nothing
+# follows, the Escape key was pressed.
+ESCAPE_TIMEOUT = 0.05
+
+# Map of the other sequences terminals send for some keys => the key
+KEY_ALIASES = {
+    # Application cursor mode
+    "\x1bOA": UP,
+    "\x1bOB": DOWN,
+    "\x1bOC": RIGHT,
+    "\x1bOD": LEFT,
+    "\x1bOH": HOME,
+    "\x1bOF": END,
+    "\x1b[1~": HOME,
+    "\x1b[7~": HOME,
+    "\x1b[4~": END,
+    "\x1b[8~": END,
+}
+if WINDOWS:
+    # click.getchar returns a prefix and a scan code for special keys
+    for prefix in ("\x00", "\xe0"):
+        KEY_ALIASES.update(
+            {
+                prefix + "H": UP,
+                prefix + "P": DOWN,
+                prefix + "M": RIGHT,
+                prefix + "K": LEFT,
+                prefix + "G": HOME,
+                prefix + "O": END,
+            }
+        )
+
+
+class Navigation(Exception):
+    """Raised by magictype when the presenter moves ``offset`` commands
+    back or forward in the session.
+    """
+
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset
+
+
+def _input_pending(timeout):
+    """Whether there is input to read within ``timeout`` seconds."""
+    if WINDOWS:
+        import msvcrt
+
+        deadline = time.monotonic() + timeout
+        while not msvcrt.kbhit():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+    try:
+        fd = sys.stdin.fileno()
+    except (AttributeError, ValueError, OSError):
+        # Not a real stream (e.g. in tests): reading never waits for a person
+        return True
+    if not os.isatty(fd):
+        return True
+    return bool(select.select([fd], [], [], timeout)[0])
+
+
+def _split_key(data):
+    """Return the length of the first key in ``data``, or 0 if ``data``
+    ends in the middle of an escape sequence.
+    """
+    if WINDOWS and data[0] in "\x00\xe0":
+        return 2 if len(data) > 1 else 0
+    if data[0] != ESC:
+        return 1
+    if len(data) == 1:
+        return 0
+    if data[1] == "[":
+        # CSI: parameter and intermediate bytes, then a final byte
+        for i in range(2, len(data)):
+            if "@" <= data[i] <= "~":
+                return i + 1
+            if not " " <= data[i] <= "?":  # Malformed
+                return 1
+        return 0
+    if data[1] == "O":  # SS3
+        return 3 if len(data) > 2 else 0
+    # The Escape key, followed by another key
+    return 1
+
+
+def _normalize_key(key):
+    if key in KEY_ALIASES:
+        return KEY_ALIASES[key]
+    if key.startswith("\x1b[") and key[-1] in "ABCDHF":
+        # Drop modifiers, e.g. Ctrl+Up is \x1b[1;5A
+        return "\x1b[" + key[-1]
+    return key
+
+
+class KeyDecoder:
+    """Splits what is read with ``read`` into key presses, decoding the
+    escape sequences sent by arrow and function keys. Input is buffered
+    between calls, so several keys read at once are returned one by one.
+    """
+
+    def __init__(self, read=None, pending=_input_pending, timeout=ESCAPE_TIMEOUT):
+        self.read = read or (lambda: getchar())
+        self.pending = pending
+        self.timeout = timeout
+        self.buffer = ""
+
+    def read_key(self):
+        """Return the next key pressed, or "" at the end of the input."""
+        while True:
+            length = _split_key(self.buffer) if self.buffer else 0
+            if not length and self.buffer and not self.pending(self.timeout):
+                # Nothing completed the sequence, so the ESC was a key press
+                length = 1
+            if not length:
+                data = self.read()
+                if data:
+                    self.buffer += data
+                    continue
+                if not self.buffer:
+                    return ""
+                length = 1
+            key, self.buffer = self.buffer[:length], self.buffer[length:]
+            return _normalize_key(key)
+
+
+_decoder = KeyDecoder()
+
+
+def read_key():
+    """Wait for a key press and return it. Special keys (e.g. arrow keys)
+    are returned as one string; see ``UP``, ``DOWN``, etc.
+    """
+    return _decoder.read_key()
+
+
+def is_special_key(key):
+    """Whether ``key`` is a special key such as an arrow or function key,
+    as opposed to a character.
+    """
+    return len(key) > 1 and (key[0] == ESC or (WINDOWS and key[0] in "\x00\xe0"))
 
 
 def wait_for(chars):
     while True:
-        in_char = getchar()
+        in_char = read_key()
         if in_char in {ESC, CTRLC}:
             echo(carriage_return=True)
             raise click.Abort()
@@ -32,17 +188,23 @@ def wait_for(chars):
             return in_char
 
 
-def magictype(text, prompt_template="default", speed=1):
+def magictype(text, prompt_template="default", speed=1, navigate=False):
     """Echo each character in ``text`` as keyboard characters are pressed.
-    Characters are echo'd ``speed`` characters at a time.
+    Characters are echo'd ``speed`` characters at a time. Characters made up
+    of several code points (e.g. emoji sequences) are typed as one.
+
+    The right arrow types the rest of ``text`` and the left arrow erases.
+    If ``navigate`` is True, the up and down arrows raise `Navigation` to
+    move to the previous or next command.
     """
     echo_prompt(prompt_template)
+    plan = typing_plan(text)
+    length = len(plan)
     cursor_position = 0
     return_to_regular_type = False
     with raw_mode():
         while True:
-            char = text[cursor_position : cursor_position + speed]
-            in_char = getchar()
+            in_char = read_key()
             if in_char in {ESC, CTRLC}:
                 echo(carriage_return=True)
                 raise click.Abort()
@@ -54,13 +216,22 @@ def magictype(text, prompt_template="default", speed=1):
             elif in_char == TAB:
                 return_to_regular_type = True
                 break
-            elif in_char == BACKSPACE:
+            elif in_char in {BACKSPACE, LEFT}:
                 if cursor_position > 0:
-                    echo("\b \b", nl=False)
+                    echo(plan.erase(cursor_position), nl=False)
                     cursor_position -= 1
+            elif in_char in {RIGHT, END}:
+                if cursor_position < length:
+                    chunk, cursor_position = plan.chunk(cursor_position, length)
+                    echo(chunk, nl=False)
+            elif in_char in {UP, DOWN} and navigate:
+                echo("\r", nl=True)
+                raise Navigation(-1 if in_char == UP else 1)
+            elif is_special_key(in_char):
+                continue
             elif in_char in RETURNS:
                 # Only return at end of command
-                if cursor_position >= len(text):
+                if cursor_position >= length:
                     echo("\r", nl=True)
                     break
             elif in_char == CTRLZ and hasattr(signal, "SIGTSTP"):
@@ -70,12 +241,11 @@ def magictype(text, prompt_template="default", speed=1):
                 # and resume where we left off
                 click.clear()
                 echo_prompt(prompt_template)
-                echo(text[:cursor_position], nl=False)
+                echo(plan.typed(cursor_position), nl=False)
             else:
-                if cursor_position < len(text):
-                    echo(char, nl=False)
-                    increment = min([speed, len(text) - cursor_position])
-                    cursor_position += increment
+                if cursor_position < length:
+                    chunk, cursor_position = plan.chunk(cursor_position, speed)
+                    echo(chunk, nl=False)
     return return_to_regular_type
 
 
@@ -87,9 +257,39 @@ def write_commands(fp, command, args):
     return None
 
 
+def write_script(fp, cmd, shell, aliases=None, envvars=None, extra_commands=None):
+    """Write a script to ``fp`` that runs ``cmd`` in a shell context."""
+    fp.write(f"#!{shell}\n")
+    fp.write("# -*- coding: utf-8 -*-\n")
+    # Make aliases work in bash:
+    if "bash" in shell:
+        fp.write("shopt -s expand_aliases\n")
+
+    # Write envvars and aliases
+    write_commands(fp, "export", envvars)
+    write_commands(fp, "alias", aliases)
+    if extra_commands:
+        for command in extra_commands:
+            line = f"{command}\n"
+            fp.write(line)
+
+    cmd_line = cmd + "\n"
+    fp.write(cmd_line)
+    fp.flush()
+
+
 def run_command(
-    cmd, shell=None, aliases=None, envvars=None, extra_commands=None, test_mode=False
+    cmd,
+    shell=None,
+    aliases=None,
+    envvars=None,
+    extra_commands=None,
+    test_mode=False,
+    capture=False,
 ):
+    """Run ``cmd`` in a shell context. If ``capture`` is True, the command's
+    output is captured as well as echoed, and (returncode, output) is returned.
+    """
     shell = shell or get_default_shell()
     command_as_list = shlex.split(cmd)
     if len(command_as_list) and command_as_list[0] == "cd":
@@ -105,33 +305,24 @@ def run_command(
         try:
             os.chdir(os.path.expandvars(os.path.expanduser(directory)))
         except OSError:
-            echo(f"No such file or directory: {directory}")
+            message = f"No such file or directory: {directory}"
+            echo(message)
+            if capture:
+                return 1, (message + "\n").encode("utf-8")
         else:
             os.environ["OLDPWD"] = cwd
+            if capture:
+                return 0, b""
 
     else:
         # Need to make a temporary command file so that $ENV are used correctly
         # and that shell built-ins, e.g. "source" work
         with NamedTemporaryFile("w") as fp:
-            fp.write(f"#!{shell}\n")
-            fp.write("# -*- coding: utf-8 -*-\n")
-            # Make aliases work in bash:
-            if "bash" in shell:
-                fp.write("shopt -s expand_aliases\n")
-
-            # Write envvars and aliases
-            write_commands(fp, "export", envvars)
-            write_commands(fp, "alias", aliases)
-            if extra_commands:
-                for command in extra_commands:
-                    line = f"{command}\n"
-                    fp.write(line)
-
-            cmd_line = cmd + "\n"
-            fp.write(cmd_line)
-            fp.flush()
+            write_script(fp, cmd, shell, aliases, envvars, extra_commands)
             try:
-                if test_mode:
+                if capture:
+                    return run_tee([shell, fp.name])
+                elif test_mode:
                     output = subprocess.check_output([shell, fp.name])
                     echo(output)
                 else:
@@ -152,7 +343,7 @@ def regulartype(prompt_template="default"):
     cursor_position = 0
     with raw_mode():
         while True:
-            in_char = getchar()
+            in_char = read_key()
             if in_char in {ESC, CTRLC}:
                 echo(carriage_return=True)
                 raise click.Abort()
@@ -172,6 +363,8 @@ def regulartype(prompt_template="default"):
             elif in_char in RETURNS:
                 echo("\r", nl=True)
                 return command_string
+            elif is_special_key(in_char):
+                continue
             elif in_char == CTRLZ and hasattr(signal, "SIGTSTP"):
                 # Background process
                 os.kill(0, signal.SIGTSTP)
@@ -185,6 +378,47 @@ def regulartype(prompt_template="default"):
                 cursor_position += 1
 
 
+def recordtype(prompt):
+    """Echo each character typed, like regulartype, and record when each key
+    is pressed. Used by the recorder to capture the presenter's typing cadence.
+
+    Returns: (command_string, key_times) | key_times starts with the time the
+                                         | prompt was shown, followed by the
+                                         | time of each key press.
+    """
+    echo(prompt, nl=False)
+    command_string = ""
+    key_times = [time.monotonic()]
+    with raw_mode():
+        while True:
+            in_char = read_key()
+            key_times.append(time.monotonic())
+            if not in_char or in_char in {ESC, CTRLC}:
+                echo(carriage_return=True)
+                raise click.Abort()
+            elif in_char == BACKSPACE:
+                if command_string:
+                    echo("\b \b", nl=False)
+                    command_string = command_string[:-1]
+            elif in_char in RETURNS:
+                echo("\r", nl=True)
+                return command_string, key_times
+            elif is_special_key(in_char):
+                continue
+            else:
+                echo(in_char, nl=False)
+                command_string += in_char
+
+
+def prefetch_next_prompt(command, prompt_template, aliases=None):
+    """Render the prompt shown after ``command`` while it runs, unless the
+    command may change it. A ``cd`` changes the working directory, and a
+    script may change the branch; echo_prompt checks for both itself.
+    """
+    if not may_change_vcs_state(command, aliases):
+        prefetch_prompt(prompt_template)
+
+
 def regularrun(
     shell,
     prompt_template="default",
@@ -194,6 +428,7 @@ def regularrun(
     speed=1,
     test_mode=False,
     commentecho=False,
+    fresh_python=False,
 ):
     """Allow user to run their own live commands until CTRL-Z is pressed again."""
     loop_again = True
@@ -201,6 +436,7 @@ def regularrun(
     if command_string == TAB:
         loop_again = False
         return loop_again
+    prefetch_next_prompt(command_string, prompt_template, aliases)
     run_command(
         command_string,
         shell,
@@ -222,13 +458,16 @@ def magicrun(
     speed=1,
     test_mode=False,
     commentecho=False,
+    fresh_python=False,
+    navigate=False,
 ):
     """Echo out each character in ``text`` as keyboard characters are pressed,
     wait for a RETURN keypress, then run the ``text`` in a shell context.
     """
-    goto_regulartype = magictype(text, prompt_template, speed)
+    goto_regulartype = magictype(text, prompt_template, speed, navigate=navigate)
     if goto_regulartype:
         return goto_regulartype
+    prefetch_next_prompt(text, prompt_template, aliases)
     run_command(
         text,
         shell,
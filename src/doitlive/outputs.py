@@ -0,0 +1,80 @@
+"""Storage of command outputs captured by the recorder, which allows
+sessions to be played back offline without running any commands.
+
+An outputs file is a gzipped file of JSON lines, one per captured command,
+with the command, its exit status, its (terminal) output, and how long it
+took to run in seconds.
+"""
+
+import gzip
+import json
+from collections import defaultdict, deque
+
+from doitlive.exceptions import SessionError
+
+OUTPUTS_SUFFIX = ".outputs.gz"
+
+
+def outputs_path(session_file):
+    return session_file + OUTPUTS_SUFFIX
+
+
+def write_outputs(path, outputs):
+    """Write a list of (command, returncode, output, duration) tuples to ``path``."""
+    with gzip.open(path, "wt", encoding="utf-8") as fp:
+        for command, returncode, output, duration in outputs:
+            entry = {
+                "command": command,
+                "status": returncode,
+                # surrogateescape (and JSON's \\u escapes) preserve output
+                # that isn't valid UTF-8
+                "output": output.decode("utf-8", errors="surrogateescape"),
+                "duration": round(duration, 3),
+            }
+            fp.write(json.dumps(entry) + "\n")
+
+
+def read_outputs(path):
+    """Read the (command, returncode, output, duration) tuples written by
+    write_outputs.
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as fp:
+            entries = [json.loads(line) for line in fp]
+    except (OSError, EOFError, ValueError) as error:
+        raise SessionError(f"Could not read outputs file {path}: {error}") from error
+    return [
+        (
+            entry["command"],
+            entry["status"],
+            entry["output"].encode("utf-8", errors="surrogateescape"),
+            entry.get("duration", 0.0),
+        )
+        for entry in entries
+    ]
+
+
+class CapturedOutputs:
+    """Captured outputs, looked up by command in the order they were recorded."""
+
+    def __init__(self, outputs):
+        self._outputs = defaultdict(deque)
+        for command, returncode, output, _ in outputs:
+            self._outputs[command].append((returncode, output))
+
+    def pop(self, command):
+        """Return the (returncode, output) of the next recorded run of
+        ``command``, or None if it wasn't captured.
+        """
+        runs = self._outputs.get(command)
+        if not runs:
+            return None
+        return runs.popleft()
+
+
+def command_runtimes(outputs):
+    """Return a dict mapping each captured command to its mean runtime."""
+    durations = defaultdict(list)
+    for command, _, _, duration in outputs:
+        durations[command].append(duration)
+    return {command: sum(values) / len(values) for command, values in durations.items()}
@@ -0,0 +1,66 @@
+"""Profiling of doitlive itself, for ``doitlive play --profile``."""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Number of entries shown in the text reports
+TOP_N = 30
+PSTATS_FILE = "profile.pstats"
+PROFILE_REPORT_FILE = "profile.txt"
+MEMORY_REPORT_FILE = "memory.txt"
+
+
+@contextmanager
+def profiling(directory, top=TOP_N):
+    """Profile the code run during the context, writing the reports to
+    ``directory``:
+
+    - profile.pstats: cProfile statistics, to load with `pstats` or snakeviz
+    - profile.txt: the ``top`` functions by cumulative time
+    - memory.txt: the ``top`` lines by memory allocated (from tracemalloc)
+
+    The profiler measures the main thread's CPU time, so time spent waiting
+    for key presses (or for commands to finish running) doesn't count, and
+    neither does work done meanwhile by other threads (e.g. setup commands
+    or broadcasting).
+    """
+    os.makedirs(directory, exist_ok=True)
+    profile = cProfile.Profile(time.thread_time)
+    tracemalloc.start()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        write_reports(directory, profile, snapshot, top=top)
+
+
+def write_reports(directory, profile, snapshot, top=TOP_N):
+    profile.dump_stats(os.path.join(directory, PSTATS_FILE))
+    report = io.StringIO()
+    stats = pstats.Stats(profile, stream=report)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    with open(os.path.join(directory, PROFILE_REPORT_FILE), "w") as fp:
+        fp.write(report.getvalue())
+
+    snapshot = snapshot.filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        )
+    )
+    memory_stats = snapshot.statistics("lineno")
+    total = sum(stat.size for stat in memory_stats)
+    with open(os.path.join(directory, MEMORY_REPORT_FILE), "w") as fp:
+        fp.write(
+            f"Top {top} lines by memory allocated (total {total / 1024:.1f} KiB)\n\n"
+        )
+        for stat in memory_stats[:top]:
+            fp.write(f"{stat}\n")
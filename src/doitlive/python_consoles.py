@@ -3,7 +3,9 @@ of canned Python statements.
 """
 
 import sys
+import traceback
 from code import InteractiveConsole
+from codeop import CommandCompiler
 
 from doitlive.keyboard import RETURNS, magictype, wait_for
 from doitlive.styling import echo_prompt
@@ -12,16 +14,30 @@ from doitlive.styling import echo_prompt
 class PythonPlayerConsole(InteractiveConsole):
     """A magic python console."""
 
-    def __init__(self, commands=None, speed=1, *args, **kwargs):
+    def __init__(self, commands=None, speed=1, compiled=None, *args, **kwargs):
         self.commands = commands or []
         self.speed = speed
+        # Precompiled code for each command (see compile_commands)
+        self.compiled = compiled
         InteractiveConsole.__init__(self, *args, **kwargs)
 
+    def run_command(self, index, command):
+        """Execute a command. Returns True if more input is required to complete
+        the statement, like `code.InteractiveConsole.push`.
+        """
+        if self.compiled is None:
+            return self.push(command)
+        code = self.compiled[index]
+        if code is None:
+            return True
+        self.runcode(code)
+        return False
+
     def run_commands(self):
         """Automatically type and execute all commands."""
         more = 0
         prompt = sys.ps1
-        for command in self.commands:
+        for index, command in enumerate(self.commands):
             try:
                 prompt = sys.ps2 if more else sys.ps1
                 try:
@@ -32,7 +48,7 @@ class PythonPlayerConsole(InteractiveConsole):
                 else:
                     if command.strip() == "exit()":
                         return
-                    more = self.push(command)
+                    more = self.run_command(index, command)
             except KeyboardInterrupt:
                 self.write("\nKeyboardInterrupt\n")
                 self.resetbuffer()
@@ -59,20 +75,103 @@ class PythonPlayerConsole(InteractiveConsole):
         self.run_commands()
 
 
-def start_python_player(commands, speed=1):
-    PythonPlayerConsole(commands=commands, speed=speed).interact()
+def compile_commands(commands, compiler=None):
+    """Group ``commands`` into complete statements and compile them, the same
+    way `code.InteractiveConsole.push` would. Returns a list with an item for
+    each command: the code object for the statement the command completes,
+    or None if the statement needs more input.
+
+    Raises a SyntaxError (with ``lineno`` relative to ``commands``) if a
+    statement is invalid.
+    """
+    compiler = compiler or CommandCompiler()
+    compiled = []
+    buffer = []
+    start = 0
+    for index, command in enumerate(commands):
+        if not buffer:
+            start = index
+        buffer.append(command)
+        try:
+            code = compiler("\n".join(buffer), "<console>", "single")
+        except SyntaxError as error:
+            error.lineno = start + (error.lineno or 1)
+            raise
+        except (OverflowError, ValueError) as error:
+            raise SyntaxError(
+                str(error), ("<console>", index + 1, 0, command)
+            ) from error
+        compiled.append(code)
+        if code is not None:
+            buffer = []
+    return compiled
+
+
+def start_python_player(commands, speed=1, locals=None, compiled=None):
+    PythonPlayerConsole(
+        commands=commands, speed=speed, compiled=compiled, locals=locals
+    ).interact()
+
+
+def new_namespace():
+    """Return a new namespace for a Python console, equivalent to the
+    default namespace used by `code.InteractiveConsole`.
+    """
+    return {"__name__": "__console__", "__doc__": None}
+
+
+class PythonPlayer:
+    """Plays the python blocks of a session. By default, all blocks share
+    a single namespace, so that imports and variables carry over from one
+    block to the next.
+    """
+
+    def __init__(self):
+        self.namespace = None
+
+    def play(self, commands, speed=1, fresh=False, compiled=None):
+        if fresh or self.namespace is None:
+            self.namespace = new_namespace()
+        start_python_player(
+            commands, speed=speed, locals=self.namespace, compiled=compiled
+        )
+
+    def run(self, compiled, fresh=False):
+        """Run a block's precompiled commands (see compile_commands) without
+        typing them. Returns False if a command raised an exception, after
+        printing its traceback.
+        """
+        if fresh or self.namespace is None:
+            self.namespace = new_namespace()
+        for code in compiled:
+            if code is None:
+                continue
+            try:
+                exec(code, self.namespace)
+            except SystemExit:
+                # exit() ends the block, as in the player
+                return True
+            except Exception:
+                traceback.print_exc()
+                return False
+        return True
 
 
 class PythonRecorderConsole(InteractiveConsole):
-    """An interactive Python console that stores user input in a list."""
+    """An interactive Python console that stores user input in a list.
+    ``on_input`` is called with each line as it is entered.
+    """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, on_input=None, **kwargs):
         self.commands = []
+        self.on_input = on_input
         InteractiveConsole.__init__(self, *args, **kwargs)
 
     def raw_input(self, *args, **kwargs):
         ret = InteractiveConsole.raw_input(self, *args, **kwargs)
         self.commands.append(ret + "\n")
+        if self.on_input:
+            self.on_input(ret + "\n")
         if ret.strip() == "exit()":
             raise EOFError()
         return ret
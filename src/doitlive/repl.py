@@ -0,0 +1,206 @@
+"""Player for ```repl:<command> blocks, which magic-types lines into
+any interactive interpreter (node, psql, sqlite3, redis-cli, ...). The
+interpreter is started once per block under a pseudo-terminal.
+"""
+
+import os
+import re
+import select
+import shlex
+import subprocess
+import time
+
+from click import secho
+from click.termui import strip_ansi
+
+from doitlive.exceptions import SessionError
+from doitlive.keyboard import RETURNS, magictype, wait_for
+from doitlive.styling import echo, echo_prompt
+
+# Patterns that match the prompts of some common interpreters, keyed by
+# executable name
+PROMPT_PATTERNS = {
+    "node": r"(>|\.\.\.) $",
+    "psql": r"[=\-^(!'\"*][#>] $",
+    "sqlite3": r"(sqlite|   \.\.\.)> $",
+    "redis-cli": r"> $",
+    "mysql": r"(mysql|\s+->)> ?$",
+}
+DEFAULT_PROMPT_PATTERN = r"[>$#%] ?$"
+
+# Seconds to wait for more output before giving up on seeing a prompt
+REPL_TIMEOUT = 30
+# Seconds of quiet after something that looks like a prompt before
+# the interpreter is considered ready for input
+PROMPT_SETTLE_TIME = 0.05
+
+
+def _prompt_template(prompt):
+    # Use the interpreter's own prompt as the template for magictype
+    return prompt.rstrip().replace("{", "{{").replace("}", "}}")
+
+
+class ReplPlayer:
+    """Plays a block of lines in an interpreter running under a pseudo-terminal."""
+
+    def __init__(self, command, speed=1, prompt_pattern=None, timeout=REPL_TIMEOUT):
+        self.command = command
+        self.argv = shlex.split(command)
+        self.speed = speed
+        name = os.path.basename(self.argv[0])
+        pattern = prompt_pattern or PROMPT_PATTERNS.get(name, DEFAULT_PROMPT_PATTERN)
+        try:
+            self.prompt_re = re.compile(pattern)
+        except re.error as error:
+            raise SessionError(
+                f'Invalid prompt pattern "{pattern}" for repl block: {error}'
+            ) from error
+        self.timeout = timeout
+        self.proc = None
+        self.fd = None
+
+    def start(self):
+        try:
+            # Not available on Windows
+            import fcntl
+            import pty
+            import termios
+        except ImportError as error:
+            raise SessionError(
+                "repl blocks are not supported on this platform."
+            ) from error
+
+        def set_controlling_terminal():
+            # Make the pseudo-terminal the interpreter's controlling terminal,
+            # so that job control and signals work as in a real terminal
+            os.setsid()
+            fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+        master, slave = pty.openpty()
+        # Keep line editors from emitting fancy escape sequences
+        env = dict(os.environ, TERM="dumb")
+        try:
+            self.proc = subprocess.Popen(
+                self.argv,
+                stdin=slave,
+                stdout=slave,
+                stderr=slave,
+                env=env,
+                preexec_fn=set_controlling_terminal,
+            )
+        except OSError as error:
+            os.close(master)
+            raise SessionError(
+                f'Could not start "{self.command}" for repl block: {error}'
+            ) from error
+        finally:
+            os.close(slave)
+        self.fd = master
+
+    def stop(self):
+        if self.proc is not None:
+            try:
+                os.write(self.fd, b"\x04")  # EOF
+                self.proc.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.terminate()
+                try:
+                    self.proc.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    self.proc.kill()
+                    self.proc.wait()
+            self.proc = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return ""
+        try:
+            data = os.read(self.fd, 4096)
+        except OSError:  # The interpreter exited
+            data = b""
+        if not data:
+            raise EOFError()
+        return data.decode("utf-8", errors="replace")
+
+    def read_until_prompt(self, sent=None):
+        """Echo the interpreter's output until it shows a prompt, which is
+        returned rather than echoed. If ``sent`` is given, the interpreter's
+        echo of that line is skipped.
+
+        Raises a SessionError if the interpreter shows no output that matches
+        the prompt pattern for ``timeout`` seconds, rather than waiting that
+        long for each line of the block.
+        """
+        buffer = ""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                data = self._read(max(0, deadline - time.monotonic()))
+            except EOFError:
+                echo(buffer, nl=False)
+                return ""
+            if data:
+                deadline = time.monotonic() + self.timeout
+            elif time.monotonic() >= deadline:
+                echo(buffer, nl=False)
+                raise SessionError(
+                    f'No prompt from "{self.command}" matched '
+                    f'"{self.prompt_re.pattern}". Set the pattern for its prompt '
+                    f"with ```repl[prompt=<regex>]:{self.command}"
+                )
+            buffer += data
+            if sent is not None and "\n" in buffer:
+                first, rest = buffer.split("\n", 1)
+                if strip_ansi(first).strip().endswith(sent.strip()):
+                    buffer = rest
+                sent = None
+            # Echo complete lines, holding back the last one in case it's the prompt
+            lines_end = buffer.rfind("\n") + 1
+            if lines_end and sent is None:
+                echo(buffer[:lines_end], nl=False)
+                buffer = buffer[lines_end:]
+            if (
+                sent is None
+                and self.prompt_re.search(strip_ansi(buffer))
+                and not select.select([self.fd], [], [], PROMPT_SETTLE_TIME)[0]
+            ):
+                return buffer
+
+    def play(self, lines):
+        self.start()
+        try:
+            prompt = self.read_until_prompt()
+            for line in lines:
+                magictype(
+                    line, prompt_template=_prompt_template(prompt), speed=self.speed
+                )
+                os.write(self.fd, (line + "\r").encode("utf-8"))
+                prompt = self.read_until_prompt(sent=line)
+                if self.proc.poll() is not None:  # The interpreter exited
+                    return
+            echo_prompt(_prompt_template(prompt))
+            wait_for(RETURNS)
+        finally:
+            self.stop()
+
+    def run(self, lines):
+        """Feed the lines to the interpreter's standard input, without typing
+        them, and echo its output. Returns the interpreter's exit status.
+        """
+        try:
+            proc = subprocess.run(
+                self.argv,
+                input="".join(line + "\n" for line in lines).encode("utf-8"),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+        except OSError as error:
+            # Fail like a shell does for a missing command
+            secho(f"{self.argv[0]}: {error.strerror}", fg="red")
+            return 127
+        echo(proc.stdout, nl=False)
+        return proc.returncode
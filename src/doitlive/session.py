@@ -0,0 +1,155 @@
+"""Parsing of session files.
+
+A session is parsed once into a list of `Step` objects: shell commands,
+comments, comment directives (``#doitlive <option>: <arg>``) and code
+blocks, each with the index of the line it starts on. Playing, dry-running,
+checking and estimating a session all walk these steps.
+"""
+
+import re
+
+from doitlive.exceptions import SessionError
+
+OPTION_RE = re.compile(
+    r"^#\s?doitlive\s+"
+    r"(?P<option>prompt|shell|alias|env|speed"
+    r"|unalias|unset|commentecho|python|setup|background|await|workdir)"
+    r":\s*(?P<arg>.+)$"
+)
+# Any directive, including unknown ones
+DIRECTIVE_RE = re.compile(r"^#\s?doitlive\s+(?P<option>[\w-]+):")
+SHELL_RE = re.compile(r"```(python|ipython)")
+# The optional [prompt=<regex>] matches the interpreter's prompt
+REPL_RE = re.compile(r"```repl(?:\[prompt=(?P<prompt>.+?)\])?:\s*(?P<command>.+)$")
+
+# Kinds of steps
+COMMAND = "command"
+COMMENT = "comment"
+DIRECTIVE = "directive"
+CODE = "code"
+
+
+class Step:
+    """A step of a session. ``kind`` is one of COMMAND, COMMENT, DIRECTIVE
+    and CODE. ``index`` is the index of the step's first line, ``end`` the
+    index of the line after it, and ``text`` its first line, stripped.
+
+    Directives have an ``option`` and an ``arg``. Code blocks have a
+    ``shell_name`` (python, ipython or repl), their ``lines`` of code, and
+    whether they are ``closed``; repl blocks also have the ``command`` that
+    starts the interpreter and its ``prompt`` pattern, or None.
+    """
+
+    def __init__(
+        self,
+        kind,
+        index,
+        end,
+        text,
+        option=None,
+        arg=None,
+        shell_name=None,
+        lines=None,
+        closed=True,
+        command=None,
+        prompt=None,
+    ):
+        self.kind = kind
+        self.index = index
+        self.end = end
+        self.text = text
+        self.option = option
+        self.arg = arg
+        self.shell_name = shell_name
+        self.lines = lines
+        self.closed = closed
+        self.command = command
+        self.prompt = prompt
+
+    def __repr__(self):
+        return f"<Step {self.kind} line {self.lineno}: {self.text!r}>"
+
+    @property
+    def lineno(self):
+        return self.index + 1
+
+    @property
+    def is_definition(self):
+        """Whether the step is an ``alias`` or ``export`` command."""
+        return self.kind == COMMAND and self.text.split(maxsplit=1)[0] in (
+            "alias",
+            "export",
+        )
+
+
+def read_code_block(lines, i):
+    """Read the lines of a code block whose opening fence is just before
+    index ``i``. Returns the lines, the index to continue from and whether
+    the block is closed.
+    """
+    code = []
+    while i < len(lines):
+        line = lines[i].rstrip()
+        i += 1
+        if line.startswith("```"):
+            # Skip the blank line after the closing fence
+            return code, i + 1, True
+        code.append(line)
+    return code, i, False
+
+
+def parse_session(lines, start=0, strict=True):
+    """Parse the lines of a session, from index ``start`` on, into a list of
+    Steps. A code block that isn't closed raises a SessionError, or is the
+    last step if ``strict`` is False.
+    """
+    steps = []
+    i = start
+    while i < len(lines):
+        index = i
+        text = lines[i].strip()
+        i += 1
+        if not text:
+            continue
+        if text.startswith("#"):
+            match = OPTION_RE.match(text)
+            if match:
+                option, arg = match.group("option"), match.group("arg")
+                steps.append(Step(DIRECTIVE, index, i, text, option=option, arg=arg))
+            else:
+                steps.append(Step(COMMENT, index, i, text))
+            continue
+        shell_match = SHELL_RE.match(text)
+        repl_match = REPL_RE.match(text)
+        if not (shell_match or repl_match):
+            steps.append(Step(COMMAND, index, i, text))
+            continue
+        code, i, closed = read_code_block(lines, i)
+        if shell_match:
+            step = Step(
+                CODE,
+                index,
+                i,
+                text,
+                shell_name=shell_match.group(1),
+                lines=code,
+                closed=closed,
+            )
+        else:
+            step = Step(
+                CODE,
+                index,
+                i,
+                text,
+                shell_name="repl",
+                lines=code,
+                closed=closed,
+                command=repl_match.group("command").strip(),
+                prompt=repl_match.group("prompt"),
+            )
+        if not closed and strict:
+            raise SessionError(
+                f"Unmatched {step.shell_name} code block in session file."
+            )
+        steps.append(step)
+    return steps
@@ -1,9 +1,12 @@
 """Functions and classes for styling sessions."""
 
 import datetime as dt
+import functools
 import getpass
 import os
+import re
 import socket
+import string
 from collections import OrderedDict
 
 import click
@@ -18,6 +21,7 @@ from doitlive.version_control import (
     get_current_hg_branch,
     get_current_hg_id,
     get_current_vcs_branch,
+    vcs_state,
 )
 
 env = os.environ
@@ -58,14 +62,59 @@ THEMES = OrderedDict(
 )
 
 
+# Number of styled strings cached; prompts style the same few values over
+# and over
+STYLE_CACHE_SIZE = 512
+RESET_ALL = click.termui._ansi_reset_all  # pylint: disable=W0212
+
+
+def sgr_code(**styles):
+    """Return the ANSI escape sequence (SGR code) for the given click.style
+    arguments.
+    """
+    return style("", reset=False, **styles)
+
+
+# Escape sequences of the 256-color palette, for the ``color<n>`` styles
+PALETTE_CODES = tuple(sgr_code(fg=n) for n in range(256))
+COLOR_ATTRIBUTE_RE = re.compile(r"^(?:color(\d{1,3})|rgb_([0-9a-fA-F]{6}))$")
+
+
+def color_code(name):
+    """Return the escape sequence for a ``color<n>`` (256-color) or
+    ``rgb_<rrggbb>`` (truecolor) style, or None if ``name`` isn't one.
+    """
+    match = COLOR_ATTRIBUTE_RE.match(name)
+    if not match:
+        return None
+    if match.group(1) is not None:
+        number = int(match.group(1))
+        return PALETTE_CODES[number] if number < len(PALETTE_CODES) else None
+    rgb = bytes.fromhex(match.group(2))
+    return sgr_code(fg=tuple(rgb))
+
+
+@functools.lru_cache(maxsize=STYLE_CACHE_SIZE)
+def apply_style(value, code):
+    """Wrap ``value`` in the escape sequence ``code`` and a reset, like
+    click.style does.
+    """
+    return TermString(code + value + RESET_ALL)
+
+
 class Style:
-    """Descriptor that adds ANSI styling to a string when accessed."""
+    """Descriptor that adds ANSI styling to a string when accessed. The
+    escape sequence is computed once, when the descriptor is created.
+    """
 
     def __init__(self, **kwargs):
         self.kwargs = kwargs
+        self.code = sgr_code(**kwargs)
 
     def __get__(self, instance, owner):
-        return TermString(style(instance, **self.kwargs))
+        if instance is None:
+            return self
+        return apply_style(instance, self.code)
 
 
 class TermString(str):
@@ -102,6 +151,16 @@ class TermString(str):
     dim = Style(dim=True)
     inverse = Style(reverse=True)
 
+    def __getattr__(self, name):
+        # 256-color and truecolor styles, e.g. {user.color208} or
+        # {user.rgb_ff8700}
+        code = color_code(name)
+        if code is None:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            )
+        return apply_style(self, code)
+
     def _bracketed(self, left, right):
         if strip_ansi(self):
             return TermString("".join([left, self, right]))
@@ -150,11 +209,10 @@ class ANSICode:
     """
 
     def __init__(self, **styles):
-        self.styles = styles
+        self.code = sgr_code(**styles)
 
     def __get__(self, instance, owner):
-        reset = self.styles.pop("reset", False)
-        return style("", reset=reset, **self.styles)
+        return self.code
 
 
 class TTY:
@@ -168,7 +226,7 @@ class TTY:
     BLACK = ANSICode(fg="black")
     YELLOW = ANSICode(fg="yellow")
     CYAN = ANSICode(fg="cyan")
-    RESET = click.termui._ansi_reset_all  # pylint: disable=W0212
+    RESET = RESET_ALL
     BOLD = ANSICode(bold=True)
     BLINK = ANSICode(blink=True)
     UNDERLINE = ANSICode(underline=True)
@@ -184,10 +242,7 @@ def _branch_to_term_string(branch_string):
 
 
 def format_prompt(prompt):
-    try:
-        return prompt.format(**get_prompt_state())
-    except KeyError as error:
-        raise ConfigurationError("Invalid variable in prompt template.") from error
+    return compile_prompt(prompt).render()
 
 
 def echo(
@@ -210,35 +265,174 @@ def make_prompt_formatter(template):
     return lambda: format_prompt(tpl)
 
 
+# The next prompt, rendered in a worker thread while a command runs:
+# (template, working directory, future)
+_prefetched = None
+_prefetch_pool = None
+
+
+def prefetch_prompt(template):
+    """Start rendering the prompt for ``template`` in a worker thread, so that
+    echo_prompt can show it as soon as the running command exits.
+    """
+    global _prefetched, _prefetch_pool
+    if "{now" in (THEMES.get(template) or template):
+        # The time would be out of date by the time the prompt is shown
+        return
+    if _prefetch_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        _prefetch_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="doitlive-prompt"
+        )
+    future = _prefetch_pool.submit(make_prompt_formatter(template))
+    _prefetched = (template, os.getcwd(), vcs_state(), future)
+
+
+def invalidate_prompt():
+    """Discard the prefetched prompt, e.g. when it may be out of date."""
+    global _prefetched
+    _prefetched = None
+
+
+def render_prompt(template):
+    """Return the prompt for ``template``, using the prefetched prompt if it
+    was rendered for the same template and working directory, and the
+    repository's branch hasn't changed since.
+    """
+    global _prefetched
+    prefetched, _prefetched = _prefetched, None
+    if prefetched and prefetched[:3] == (template, os.getcwd(), vcs_state()):
+        try:
+            return prefetched[3].result()
+        except ConfigurationError:
+            pass  # Raised again below
+    return make_prompt_formatter(template)()
+
+
 def echo_prompt(template):
-    prompt = make_prompt_formatter(template)()
+    prompt = render_prompt(template)
     echo(prompt + " ", nl=False)
 
 
-def get_prompt_state():
+def _cwd():
     full_cwd = os.getcwd()
-    home = env.get("HOME", "")
-    cwd_raw = full_cwd.replace(home, "~")
-    dir_raw = "~" if full_cwd == home else os.path.split(full_cwd)[-1]
-    return {
-        "user": TermString(getpass.getuser()),
-        "cwd": TermString(cwd_raw),
-        "dir": TermString(dir_raw),
-        "hostname": TermString(socket.gethostname()),
-        "git_branch": _branch_to_term_string(get_current_git_branch()),
-        "hg_id": TermString(get_current_hg_id()),
-        "hg_branch": _branch_to_term_string(get_current_hg_branch()),
-        "hg_bookmark": TermString(get_current_hg_bookmark()),
-        "vcs_branch": _branch_to_term_string(get_current_vcs_branch()),
-        # Symbols
-        "r_angle": R_ANGLE,
-        "r_angle_double": R_ANGLE_DOUBLE,
-        "r_arrow": R_ARROW,
-        "dollar": DOLLAR,
-        "percent": PERCENT,
-        "now": dt.datetime.now(),
-        "new_line": NEW_LINE,
-        "nl": NEW_LINE,
-        # ANSI values object
-        "TTY": TTY,
-    }
+    return TermString(full_cwd.replace(env.get("HOME", ""), "~"))
+
+
+def _dir():
+    full_cwd = os.getcwd()
+    if full_cwd == env.get("HOME", ""):
+        return TermString("~")
+    return TermString(os.path.split(full_cwd)[-1])
+
+
+# Map of prompt variables => function that returns their value
+PROMPT_VARIABLES = {
+    "user": lambda: TermString(getpass.getuser()),
+    "cwd": _cwd,
+    "dir": _dir,
+    "hostname": lambda: TermString(socket.gethostname()),
+    "git_branch": lambda: _branch_to_term_string(get_current_git_branch()),
+    "hg_id": lambda: TermString(get_current_hg_id()),
+    "hg_branch": lambda: _branch_to_term_string(get_current_hg_branch()),
+    "hg_bookmark": lambda: TermString(get_current_hg_bookmark()),
+    "vcs_branch": lambda: _branch_to_term_string(get_current_vcs_branch()),
+    # Symbols
+    "r_angle": lambda: R_ANGLE,
+    "r_angle_double": lambda: R_ANGLE_DOUBLE,
+    "r_arrow": lambda: R_ARROW,
+    "dollar": lambda: DOLLAR,
+    "percent": lambda: PERCENT,
+    "now": dt.datetime.now,
+    "new_line": lambda: NEW_LINE,
+    "nl": lambda: NEW_LINE,
+    # ANSI values object
+    "TTY": lambda: TTY,
+}
+
+
+class PromptState(dict):
+    """The variables available to prompt templates. Each one is only
+    computed if the template uses it, so that e.g. git is only run for
+    prompts that show the branch.
+    """
+
+    def __missing__(self, key):
+        value = self[key] = PROMPT_VARIABLES[key]()
+        return value
+
+
+# Prompt variables that aren't TermStrings, so can't be styled
+UNSTYLED_VARIABLES = {"now", "TTY"}
+_formatter = string.Formatter()
+
+
+def parse_prompt(template):
+    """Parse and validate a prompt template. Returns a list of
+    [literal text, field name, format spec, conversion] parts, as
+    `string.Formatter.parse` does.
+    """
+    try:
+        parts = [list(part) for part in _formatter.parse(template)]
+    except ValueError as error:
+        raise ConfigurationError(f"Invalid prompt template: {error}") from error
+    for _, field_name, _, _ in parts:
+        if field_name is None:
+            continue
+        name, _, attributes = field_name.partition(".")
+        if name not in PROMPT_VARIABLES:
+            raise ConfigurationError("Invalid variable in prompt template.")
+        if name in UNSTYLED_VARIABLES or not attributes:
+            continue
+        for attribute in attributes.split("."):
+            if not hasattr(TermString, attribute) and color_code(attribute) is None:
+                raise ConfigurationError(
+                    f'Invalid style "{attribute}" in prompt template.'
+                )
+    return parts
+
+
+class CompiledPrompt:
+    """A prompt template that has been parsed and validated, ready to be
+    rendered any number of times.
+    """
+
+    def __init__(self, template, parts=None):
+        self.template = template
+        self.parts = parse_prompt(template) if parts is None else parts
+
+    def render(self):
+        state = PromptState()
+        rendered = []
+        for literal, field_name, format_spec, conversion in self.parts:
+            rendered.append(literal)
+            if field_name is not None:
+                value, _ = _formatter.get_field(field_name, (), state)
+                value = _formatter.convert_field(value, conversion)
+                rendered.append(_formatter.format_field(value, format_spec))
+        return "".join(rendered)
+
+
+# Map of prompt templates => their CompiledPrompt
+_compiled_prompts = {}
+
+
+def compile_prompt(template):
+    """Return the CompiledPrompt for ``template``, compiling it the first
+    time. Raises a ConfigurationError if the template is invalid.
+    """
+    compiled = _compiled_prompts.get(template)
+    if compiled is None:
+        compiled = _compiled_prompts[template] = CompiledPrompt(template)
+    return compiled
+
+
+def add_theme(name, compiled):
+    """Add a prompt theme, given its CompiledPrompt."""
+    THEMES[name] = compiled.template
+    _compiled_prompts[compiled.template] = compiled
+
+
+def get_prompt_state():
+    return {key: get_value() for key, get_value in PROMPT_VARIABLES.items()}
@@ -1,7 +1,12 @@
+import functools
 import os
+import shutil
+import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
+import click
 from click._compat import isatty
 
 WIN = sys.platform.startswith("win")
@@ -57,3 +62,97 @@ def raw_mode():
 
 def get_default_shell():
     return env.get("DOITLIVE_INTERPRETER") or env.get("SHELL") or "/bin/bash"
+
+
+@functools.cache
+def _list_directory(directory):
+    try:
+        return frozenset(entry.name for entry in os.scandir(directory))
+    except OSError:
+        return frozenset()
+
+
+def find_executables(names, path=None):
+    """Look up each of ``names`` on ``path`` (defaults to $PATH). Returns a
+    dict mapping each name to the executable's full path, or None if it
+    isn't found. The directories on the path are listed concurrently, and
+    the listings are cached, so that checking many names is cheap.
+    """
+    path = path if path is not None else env.get("PATH", os.defpath)
+    if WIN:
+        # Account for PATHEXT
+        return {name: shutil.which(name, path=path) for name in names}
+    directories = [directory for directory in path.split(os.pathsep) if directory]
+    with ThreadPoolExecutor() as pool:
+        listings = list(pool.map(_list_directory, directories))
+    found = {}
+    for name in names:
+        found[name] = None
+        for directory, listing in zip(directories, listings, strict=True):
+            if name in listing:
+                full_path = os.path.join(directory, name)
+                if os.access(full_path, os.X_OK) and not os.path.isdir(full_path):
+                    found[name] = full_path
+                    break
+    return found
+
+
+def _copy_window_size(fd, source=None):
+    """Give the pseudo-terminal ``fd`` the same size as the real terminal
+    (``source``, stdout by default).
+    """
+    import fcntl
+    import termios
+
+    try:
+        if source is None:
+            source = sys.stdout.fileno()
+        size = fcntl.ioctl(source, termios.TIOCGWINSZ, b"\0" * 8)
+        fcntl.ioctl(fd, termios.TIOCSWINSZ, size)
+    except (OSError, ValueError):
+        pass
+
+
+def run_tee(args):
+    """Run a command, echoing its output as it is produced and also capturing
+    it. Output goes through a pseudo-terminal so that the command behaves as it
+    would in a real terminal; stdout and stderr are merged, as a terminal shows them.
+
+    Note: Pipes are used instead of a pseudo-terminal on Windows.
+
+    Returns: (returncode, output)
+    """
+    if WIN:
+        proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        click.echo(proc.stdout, nl=False)
+        return proc.returncode, proc.stdout
+
+    import pty
+
+    master, slave = pty.openpty()
+    _copy_window_size(master)
+    try:
+        proc = subprocess.Popen(args, stdout=slave, stderr=slave)
+    finally:
+        os.close(slave)
+    output = bytearray()
+    try:
+        while True:
+            try:
+                data = os.read(master, 4096)
+            except KeyboardInterrupt:
+                # The command got the interrupt too; keep reading until it exits
+                continue
+            except OSError:  # EIO: the command closed the terminal
+                break
+            if not data:
+                break
+            click.echo(data, nl=False)
+            output += data
+    finally:
+        os.close(master)
+    while True:
+        try:
+            return proc.wait(), bytes(output)
+        except KeyboardInterrupt:
+            continue
@@ -0,0 +1,127 @@
+"""Compact storage of the recorder's keystroke timing.
+
+A timing file holds one record per command typed at the recorder's prompt.
+Each record is a list of delays in milliseconds: the "think time" between the
+prompt being shown and the first key press, followed by the delay before each
+subsequent key press (including RETURN). Records are stored as unsigned
+LEB128 varints, each prefixed with its length.
+"""
+
+from doitlive.exceptions import SessionError
+
+TIMING_SUFFIX = ".timing"
+MAGIC = b"DLT1"
+
+# Typing assumptions used by estimates when there is no timing to go by
+DEFAULT_KEYS_PER_SECOND = 5.0
+DEFAULT_THINK_TIME = 1.0
+
+
+def timing_path(session_file):
+    return session_file + TIMING_SUFFIX
+
+
+def to_deltas(key_times):
+    """Convert absolute key press times (in seconds) to delays in milliseconds."""
+    return [
+        round((later - earlier) * 1000)
+        for earlier, later in zip(key_times, key_times[1:], strict=False)
+    ]
+
+
+def encode_varint(value):
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def decode_varint(data, pos):
+    """Decode a varint from ``data`` at ``pos``. Returns the value and the
+    position after it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        try:
+            byte = data[pos]
+        except IndexError as error:
+            raise SessionError("Timing file is truncated.") from error
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_timing(records):
+    data = bytearray(MAGIC)
+    for record in records:
+        data += encode_varint(len(record))
+        for delay in record:
+            data += encode_varint(delay)
+    return bytes(data)
+
+
+def decode_timing(data):
+    if not data.startswith(MAGIC):
+        raise SessionError("Not a doitlive timing file.")
+    records = []
+    pos = len(MAGIC)
+    while pos < len(data):
+        length, pos = decode_varint(data, pos)
+        record = []
+        for _ in range(length):
+            delay, pos = decode_varint(data, pos)
+            record.append(delay)
+        records.append(record)
+    return records
+
+
+def write_timing(path, records):
+    with open(path, "wb") as fp:
+        fp.write(encode_timing(records))
+
+
+def read_timing(path):
+    with open(path, "rb") as fp:
+        return decode_timing(fp.read())
+
+
+def timing_stats(records):
+    """Summarize timing records. Times are in seconds."""
+    keystrokes = sum(len(record) for record in records)
+    # Time spent typing (from the first to the last key press of each command)
+    typing_time = sum(sum(record[1:]) for record in records) / 1000
+    intervals = sum(len(record) - 1 for record in records if record)
+    think_times = [record[0] / 1000 for record in records if record]
+    return {
+        "commands": len(records),
+        "keystrokes": keystrokes,
+        "typing_time": typing_time,
+        "keys_per_second": intervals / typing_time if typing_time else 0.0,
+        "mean_think_time": (
+            sum(think_times) / len(think_times) if think_times else 0.0
+        ),
+        "total_time": typing_time + sum(think_times),
+    }
+
+
+def keystrokes_for(text, speed=1):
+    """Number of key presses needed to magic-type ``text`` at ``speed``
+    characters per key press, including the final RETURN.
+    """
+    return -(-len(text) // speed) + 1
+
+
+def estimate_time(section, keys_per_second, think_time):
+    """Estimate the seconds needed to play a section (see
+    doitlive.cli.estimate_session) at the given typing rate.
+    """
+    typing_time = section["keystrokes"] / keys_per_second if keys_per_second else 0
+    return section["commands"] * think_time + typing_time + section["runtime"]
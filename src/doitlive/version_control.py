@@ -3,8 +3,14 @@ git or mercurial repository in the working directory
 """
 
 import os
+import re
 import subprocess
 
+# Matches commands that may change what the prompt shows about the repository
+VCS_COMMAND_RE = re.compile(r"\b(?:git|hg)\b")
+# Matches the words of a command that may be aliases
+ALIAS_NAME_RE = re.compile(r"[^\s;&|()<>'\"`]+")
+
 
 def get_current_git_branch():
     command = ["git", "symbolic-ref", "--short", "-q", "HEAD"]
@@ -17,25 +23,40 @@ def get_current_git_branch():
     return ""
 
 
-# We'll avoid shelling out to hg for speed.
-def find_hg_root():
-    def get_parent_dir(directory):
-        return os.path.abspath(os.path.join(directory, os.pardir))
-
+def _find_in_parents(name):
+    """Return the path of ``name`` in the working directory or the nearest
+    parent directory that contains it, or "".
+    """
     cwd = os.getcwd()
     while True:
-        pardir = get_parent_dir(cwd)
+        path = os.path.join(cwd, name)
+        if os.path.exists(path):
+            return path
+        pardir = os.path.dirname(cwd)
+        if cwd == pardir:
+            return ""
+        cwd = pardir
 
-        hgroot = os.path.join(cwd, ".hg")
-        if os.path.isdir(hgroot):
-            return hgroot
 
-        if cwd == pardir:
-            break
+# We'll avoid shelling out to hg for speed.
+def find_hg_root():
+    hgroot = _find_in_parents(".hg")
+    return hgroot if os.path.isdir(hgroot) else ""
 
-        cwd = pardir
 
-    return ""
+def find_git_dir():
+    """Return the git directory of the repository in the working directory,
+    or "". Worktrees and submodules have a .git file that points to it.
+    """
+    git = _find_in_parents(".git")
+    if not os.path.isfile(git):
+        return git
+    try:
+        with open(git) as f:
+            gitdir = f.read().strip().removeprefix("gitdir:").strip()
+    except OSError:
+        return ""
+    return os.path.join(os.path.dirname(git), gitdir)
 
 
 def get_current_hg_branch():
@@ -73,3 +94,55 @@ def get_current_hg_id():
 
 def get_current_vcs_branch():
     return get_current_git_branch() + get_current_hg_id()
+
+
+def _alias_values(aliases):
+    """Return a dict of alias names => values from alias definitions
+    (``<name>=<value>``), with the quotes around the values removed.
+    """
+    values = {}
+    for alias in aliases or ():
+        name, _, value = alias.partition("=")
+        values[name.strip()] = value.strip().strip("'\"")
+    return values
+
+
+def may_change_vcs_state(command, aliases=None):
+    """Whether running ``command`` may change the current branch or
+    bookmark, e.g. ``git checkout`` or an alias for it. Errs on the side of
+    True.
+    """
+    values = _alias_values(aliases)
+    pending = [command]
+    seen = set()
+    while pending:
+        text = pending.pop()
+        if VCS_COMMAND_RE.search(text):
+            return True
+        for word in ALIAS_NAME_RE.findall(text):
+            if word in values and word not in seen:
+                seen.add(word)
+                pending.append(values[word])
+    return False
+
+
+def vcs_state():
+    """Return the modification times of the files that record the current
+    git branch and hg branch and bookmark. Commands that change the branch
+    (including scripts that run git) change the result.
+    """
+    paths = []
+    gitdir = find_git_dir()
+    if gitdir:
+        paths.append(os.path.join(gitdir, "HEAD"))
+    hgroot = find_hg_root()
+    if hgroot:
+        paths.append(os.path.join(hgroot, "branch"))
+        paths.append(os.path.join(hgroot, "bookmarks.current"))
+    state = []
+    for path in paths:
+        try:
+            state.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            state.append((path, None))
+    return tuple(state)
@@ -0,0 +1,126 @@
+"""Watching of session files for changes, for ``doitlive play --watch``.
+Uses inotify on Linux and polls the file's modification time elsewhere.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# Seconds between checks when polling
+POLL_INTERVAL = 0.5
+# Seconds to wait for more events after a change, since editors often save
+# a file in several steps
+SETTLE_TIME = 0.05
+
+# From sys/inotify.h
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+# struct inotify_event, not including the name that follows it
+EVENT = struct.Struct("iIII")
+
+
+def _inotify():
+    """Return libc if it supports inotify, or None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """Waits for a file to change. The file's directory is watched rather
+    than the file itself, so that changes are noticed when an editor
+    replaces the file instead of writing to it.
+    """
+
+    def __init__(self, path, interval=POLL_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self._name = os.fsencode(os.path.basename(self.path))
+        self._stat = self._get_stat()
+        self._fd = None
+        libc = _inotify()
+        if libc:
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd >= 0:
+                watch = libc.inotify_add_watch(
+                    fd,
+                    os.fsencode(os.path.dirname(self.path)),
+                    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO,
+                )
+                if watch >= 0:
+                    self._fd = fd
+                else:
+                    os.close(fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def wait(self, timeout=None):
+        """Wait until the file changes. Returns False if ``timeout`` (in
+        seconds) passes first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._fd is not None:
+            return self._wait_inotify(deadline)
+        return self._poll(deadline)
+
+    def _wait_inotify(self, deadline):
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if ready and self._read_events():
+                # Let the editor finish saving
+                while select.select([self._fd], [], [], SETTLE_TIME)[0]:
+                    self._read_events()
+                return True
+
+    def _read_events(self):
+        """Read the pending events. Returns whether any were for the file."""
+        data = os.read(self._fd, 64 * 1024)
+        changed = False
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            changed = changed or name == self._name
+        return changed
+
+    def _get_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:  # The file is being replaced
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _poll(self, deadline):
+        while True:
+            stat = self._get_stat()
+            if stat is not None and stat != self._stat:
+                self._stat = stat
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval)
@@ -0,0 +1,89 @@
+"""Throwaway working directories for ``#doitlive workdir``. A fixture
+directory is cloned into a fresh temporary directory before each run of a
+session, so that sessions that change files can be rehearsed repeatedly.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from doitlive.exceptions import SessionError
+
+# ioctl that makes a file share (copy-on-write) the data of another file on
+# filesystems that support it (btrfs, XFS, bcachefs, ...); from linux/fs.h
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """Clone ``src`` to ``dst`` without copying its data. Returns False if the
+    filesystem doesn't support it.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    with open(src, "rb") as src_fp, open(dst, "wb") as dst_fp:
+        try:
+            fcntl.ioctl(dst_fp.fileno(), FICLONE, src_fp.fileno())
+        except OSError:
+            return False
+    return True
+
+
+def clone_file(src, dst):
+    """Copy a file, sharing its data with the original if the filesystem
+    supports copy-on-write, and copying it otherwise.
+    """
+    if not _reflink(src, dst):
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def clone_tree(src, dst):
+    """Copy the directory ``src`` to ``dst`` (which must not exist), cloning
+    files with clone_file. Files are cloned concurrently.
+    """
+    files = []
+    for root, dirs, filenames in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target)
+        for name in dirs[:]:
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                # Copy symlinks to directories as symlinks (os.walk doesn't
+                # follow them)
+                os.symlink(os.readlink(path), os.path.join(target, name))
+                dirs.remove(name)
+        for name in filenames:
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), os.path.join(target, name))
+            else:
+                files.append((path, os.path.join(target, name)))
+    with ThreadPoolExecutor() as pool:
+        # Consume the results to raise any errors
+        list(pool.map(lambda paths: clone_file(*paths), files))
+    for root, _, _ in os.walk(src):
+        shutil.copystat(root, os.path.join(dst, os.path.relpath(root, src)))
+
+
+@contextmanager
+def sandbox(fixture):
+    """Clone ``fixture`` into a temporary directory and change into it for
+    the duration of the context. The directory is removed afterwards.
+    """
+    if not os.path.isdir(fixture):
+        raise SessionError(f"Working directory fixture not found: {fixture}")
+    cwd = os.getcwd()
+    tmpdir = tempfile.mkdtemp(prefix="doitlive-")
+    try:
+        workdir = os.path.join(tmpdir, os.path.basename(os.path.abspath(fixture)))
+        clone_tree(fixture, workdir)
+        os.chdir(workdir)
+        yield workdir
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -8,3 +8,14 @@ import doitlive
 def runner():
     doitlive.cli.TESTING = True
     return CliRunner()
+
+
+@pytest.fixture(autouse=True)
+def config_file(tmp_path, monkeypatch):
+    """Keep tests from reading the user's config file or writing to their
+    cache.
+    """
+    path = tmp_path / "config.toml"
+    monkeypatch.setenv("DOITLIVE_CONFIG", str(path))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return path
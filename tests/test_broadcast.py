@@ -0,0 +1,163 @@
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from doitlive.broadcast import (
+    Broadcaster,
+    TerminalTee,
+    parse_address,
+    watch,
+)
+from doitlive.cli import cli
+from doitlive.exceptions import SessionError
+
+pytestmark = pytest.mark.skipif(
+    sys.platform.startswith("win"), reason="broadcasting is not supported on Windows"
+)
+
+
+@pytest.fixture
+def address(tmp_path):
+    return f"unix:{tmp_path / 'doitlive.sock'}"
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def connect(address):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(parse_address(address)[1])
+    return sock
+
+
+def read_all(sock):
+    data = b""
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return data
+        data += chunk
+
+
+@pytest.mark.parametrize(
+    ("address", "expected"),
+    [
+        ("unix:/tmp/doitlive.sock", (socket.AF_UNIX, "/tmp/doitlive.sock")),
+        ("tcp:0.0.0.0:8000", (socket.AF_INET, ("0.0.0.0", 8000))),
+        ("tcp::8000", (socket.AF_INET, ("localhost", 8000))),
+    ],
+)
+def test_parse_address(address, expected):
+    assert parse_address(address) == expected
+
+
+@pytest.mark.parametrize("address", ["/tmp/doitlive.sock", "unix:", "tcp:host"])
+def test_parse_invalid_address(address):
+    with pytest.raises(SessionError):
+        parse_address(address)
+
+
+class TestBroadcaster:
+    def test_fans_out_to_clients(self, address):
+        broadcaster = Broadcaster(address)
+        broadcaster.start()
+        clients = [connect(address), connect(address)]
+        wait_until(lambda: len(broadcaster.clients) == 2)
+        broadcaster.publish(b"$ echo foo\r\n")
+        broadcaster.publish(b"foo\r\n")
+        broadcaster.stop()
+        for client in clients:
+            with client:
+                assert read_all(client) == b"$ echo foo\r\nfoo\r\n"
+        assert not os.path.exists(parse_address(address)[1])
+
+    def test_drops_slow_clients(self, address):
+        broadcaster = Broadcaster(address, queue_size=2)
+        broadcaster.start()
+        with connect(address) as slow, connect(address) as fast:
+            fast.setblocking(False)
+            wait_until(lambda: len(broadcaster.clients) == 2)
+            chunk = b"x" * 65536
+            for _ in range(200):
+                broadcaster.publish(chunk)
+                try:
+                    while fast.recv(1 << 20):
+                        pass
+                except BlockingIOError:
+                    pass
+            # The presenter was never blocked, and the slow client was dropped
+            wait_until(lambda: len(broadcaster.clients) <= 1)
+            broadcaster.stop()
+            slow.settimeout(5)
+            received = len(read_all(slow))
+            assert received < 200 * len(chunk)
+
+    def test_address_in_use(self, tmp_path):
+        with socket.socket() as sock:
+            sock.bind(("localhost", 0))
+            sock.listen()
+            port = sock.getsockname()[1]
+            with pytest.raises(SessionError):
+                Broadcaster(f"tcp:localhost:{port}").start()
+
+
+def test_terminal_tee():
+    received = []
+    tee = TerminalTee(received.append)
+    tee.start()
+    try:
+        assert os.isatty(1)
+        os.write(1, b"from doitlive\n")
+        subprocess.call(["echo", "from a command"])
+    finally:
+        tee.stop()
+    output = b"".join(received)
+    assert b"from doitlive\n" in output
+    assert b"from a command\n" in output
+
+
+def test_watch(address):
+    broadcaster = Broadcaster(address)
+    broadcaster.start()
+    out = io.BytesIO()
+    thread = threading.Thread(target=watch, args=(address, out))
+    thread.start()
+    wait_until(lambda: broadcaster.clients)
+    broadcaster.publish(b"hello")
+    broadcaster.stop()
+    thread.join(timeout=5)
+    assert out.getvalue() == b"hello"
+
+
+def test_watch_no_session(runner, address):
+    result = runner.invoke(cli, ["watch", address])
+    assert result.exit_code == 1
+    assert "Could not connect" in result.output
+
+
+def test_play_broadcast(runner, address):
+    session = os.path.join(os.path.dirname(__file__), "sessions", "basic.session")
+    user_input = "\n" + "x" * len('echo "Hello"') + "\n\n"
+    result = runner.invoke(
+        cli, ["play", session, "--broadcast", address], input=user_input
+    )
+    assert result.exit_code == 0, result.output
+    assert "Broadcasting on" in result.output
+    assert not os.path.exists(parse_address(address)[1])
+
+
+def test_play_broadcast_invalid_address(runner):
+    session = os.path.join(os.path.dirname(__file__), "sessions", "basic.session")
+    result = runner.invoke(cli, ["play", session, "--broadcast", "nowhere"])
+    assert result.exit_code == 1
+    assert "Invalid broadcast address" in result.output
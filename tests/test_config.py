@@ -0,0 +1,176 @@
+import os
+
+import click
+import pytest
+
+from doitlive import config, styling
+from doitlive.cli import ThemeChoice, cli, default_shell
+from doitlive.exceptions import ConfigurationError
+
+CONFIG = """
+[defaults]
+speed = 2
+commentecho = true
+prompt = "mine"
+
+[themes]
+mine = "{user.cyan} MINE $"
+"""
+
+
+@pytest.fixture(autouse=True)
+def reset_config():
+    yield
+    config.activate(config.Config())
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return str(tmp_path / "cache" / "doitlive" / "config.json")
+
+
+def test_missing_config(config_file):
+    loaded = config.load_config()
+    assert loaded.defaults == {}
+    assert loaded.themes == {}
+
+
+def test_load_config(config_file):
+    config_file.write_text(CONFIG)
+    loaded = config.load_config()
+    assert loaded.defaults == {"speed": 2, "commentecho": True, "prompt": "mine"}
+    assert loaded.default("speed") == 2
+    assert loaded.default("shell", "/bin/sh") == "/bin/sh"
+    assert loaded.themes["mine"].template == "{user.cyan} MINE $"
+    assert loaded.themes["mine"].render().endswith(" MINE $")
+
+
+def test_config_path(monkeypatch, tmp_path):
+    monkeypatch.delenv("DOITLIVE_CONFIG")
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.config_path() == os.path.join(
+        str(tmp_path), "doitlive", "config.toml"
+    )
+
+
+@pytest.mark.parametrize(
+    ("contents", "message"),
+    [
+        ("speed = 2", 'Unknown section "speed"'),
+        ("[defaults]\nspeed = 0", "must be at least 1"),
+        ("[defaults]\nspeed = true", "must be a int"),
+        ('[defaults]\nshell = ["zsh"]', "must be a str"),
+        ('[defaults]\ncommentecho = "yes"', "must be a bool"),
+        ("[defaults]\ncolor = true", 'Unknown default "color"'),
+        ('[defaults]\nprompt = "nope"', 'unknown theme "nope"'),
+        ('[themes]\nbad = "{user.blurple}"', 'Theme "bad": Invalid style'),
+        ('[themes]\nbad = "{nope}"', 'Theme "bad": Invalid variable'),
+        ("[themes]\nbad = 1", "must be a str"),
+        ("[defaults\n", "Invalid config file"),
+    ],
+)
+def test_invalid_config(config_file, contents, message):
+    config_file.write_text(contents)
+    with pytest.raises(ConfigurationError, match=message):
+        config.load_config()
+
+
+def test_config_cached(config_file, cache, monkeypatch):
+    config_file.write_text(CONFIG)
+    config.load_config()
+    assert os.path.exists(cache)
+
+    def fail(path):
+        raise AssertionError("Config file parsed again")
+
+    monkeypatch.setattr(config, "_read_toml", fail)
+    loaded = config.load_config()
+    assert loaded.default("speed") == 2
+    assert loaded.themes["mine"].render().endswith(" MINE $")
+
+
+def test_cache_invalidated(config_file, cache):
+    config_file.write_text(CONFIG)
+    config.load_config()
+    config_file.write_text(CONFIG.replace("speed = 2", "speed = 3"))
+    # Make sure the modification time changes
+    stat = os.stat(config_file)
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert config.load_config().default("speed") == 3
+
+
+def test_unwritable_cache(config_file, tmp_path):
+    config_file.write_text(CONFIG)
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    cache = str(blocker / "config.json")
+    assert config.load_config(cache=cache).default("speed") == 2
+
+
+def test_activate():
+    config.activate(config.load_config())
+    assert "mine" not in styling.THEMES
+    config.activate(
+        config.Config(themes={"mine": styling.CompiledPrompt("{user} MINE $")})
+    )
+    assert styling.THEMES["mine"] == "{user} MINE $"
+    assert styling.compile_prompt("{user} MINE $") is config.active.themes["mine"]
+    config.activate(config.Config())
+    assert "mine" not in styling.THEMES
+    assert "default" in styling.THEMES
+
+
+class TestCLI:
+    def test_themes_list(self, runner, config_file):
+        config_file.write_text(CONFIG)
+        result = runner.invoke(cli, ["themes", "--list"])
+        assert result.exit_code == 0
+        assert "mine" in result.output.split()
+
+    def test_defaults_used(self, runner, config_file, tmp_path):
+        config_file.write_text(CONFIG)
+        session = tmp_path / "session.sh"
+        session.write_text("# A comment\necho hello\n")
+        # Typing speed is 2
+        user_input = "\n" + "x" * (len("echo hello") // 2) + "\n\n\n"
+        result = runner.invoke(cli, ["play", str(session)], input=user_input)
+        assert result.exit_code == 0, result.output
+        assert " MINE $" in result.output
+        assert "A comment" in result.output
+        assert "hello" in result.output
+
+    def test_options_override_defaults(self, runner, config_file, tmp_path):
+        config_file.write_text(CONFIG)
+        session = tmp_path / "session.sh"
+        session.write_text("# A comment\necho hello\n")
+        user_input = "\n" + "x" * len("echo hello") + "\n\n\n"
+        result = runner.invoke(
+            cli, ["play", "-s", "1", "-p", "default", str(session)], input=user_input
+        )
+        assert result.exit_code == 0, result.output
+        assert " MINE $" not in result.output
+
+    def test_shell_default(self, runner, config_file, monkeypatch):
+        monkeypatch.delenv("DOITLIVE_INTERPRETER", raising=False)
+        config_file.write_text('[defaults]\nshell = "/bin/sh"\n')
+        config.activate(config.load_config())
+        assert default_shell() == "/bin/sh"
+        monkeypatch.setenv("DOITLIVE_INTERPRETER", "/bin/zsh")
+        assert default_shell() == "/bin/zsh"
+
+    def test_theme_choice(self, config_file):
+        choice = ThemeChoice()
+        config_file.write_text(CONFIG)
+        config.activate(config.load_config())
+        assert choice.convert("mine", None, None) == "mine"
+        completions = choice.shell_complete(None, None, "mi")
+        assert "mine" in [item.value for item in completions]
+        config.activate(config.Config())
+        with pytest.raises(click.BadParameter):
+            choice.convert("mine", None, None)
+
+    def test_invalid_config(self, runner, config_file):
+        config_file.write_text("[defaults]\nspeed = 0\n")
+        result = runner.invoke(cli, ["themes", "--list"])
+        assert result.exit_code == 1
+        assert "must be at least 1" in result.output
@@ -1,14 +1,24 @@
 import getpass
 import importlib.metadata
+import io
 import os
+import pkgutil
+import pstats
 import random
 import subprocess
+import sys
+import time
 from contextlib import contextmanager
 
 import pytest
 
 import doitlive
-from doitlive.cli import cli
+from doitlive.cli import cli, command_executables, restart_point
+from doitlive.journal import RecorderJournal
+from doitlive.keyboard import write_script
+from doitlive.outputs import read_outputs
+from doitlive.session import parse_session
+from doitlive.timing import read_timing, write_timing
 
 # Check if git is installed
 git_available = None
@@ -81,6 +91,29 @@ class TestPlayer:
         result = run_session(runner, "basic.session", "echo" + doitlive.ESC)
         assert result.exit_code > 0
 
+    def test_arrow_keys_dont_abort(self, runner):
+        user_input = "ec" + doitlive.keyboard.LEFT + doitlive.keyboard.HOME + "c"
+        user_input += "\x1b[C" + "\n\n"
+        result = run_session(runner, "basic.session", user_input)
+        assert result.exit_code == 0, result.output
+        assert "Hello" in result.output
+
+    def test_navigation(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("echo one\n#doitlive speed: 2\necho two\necho three\n")
+            up, down = doitlive.keyboard.UP, doitlive.keyboard.DOWN
+            user_input = "\n" + "x" * len("echo one") + "\n"
+            # Go back to the first command and run it again
+            user_input += "ech" + up + "x" * len("echo one") + "\n"
+            # Skip the second command, and type the rest of the third at once
+            user_input += down + "x" + doitlive.keyboard.RIGHT + "\n\n"
+            result = runner.invoke(cli, ["play", "session.sh"], input=user_input)
+        assert result.exit_code == 0, result.output
+        assert result.output.count("one") == 4
+        assert "two" not in result.output
+        assert result.output.count("three") == 2
+
     def test_pwd(self, runner):
         user_input = random_string(3)
         result = run_session(runner, "pwd.session", user_input)
@@ -155,6 +188,185 @@ class TestPlayer:
         assert result.exit_code == 0
         assert "foo" in result.output
 
+    def test_python_blocks_share_namespace(self, runner):
+        user_input = 'python\nx = "foo" * 2\n\npython\nprint(x + "bar")\n'
+        result = run_session(runner, "python_shared.session", user_input)
+        assert result.exit_code == 0
+        assert "foofoobar" in result.output
+
+    def test_python_fresh_namespace(self, runner):
+        user_input = 'python\nx = "foo" * 2\n\npython\nprint(x + "bar")\n'
+        result = run_session(runner, "python_fresh.session", user_input)
+        assert result.exit_code == 0
+        assert "foofoobar" not in result.output
+        assert "NameError" in result.output
+
+    def test_python_syntax_error_is_reported_before_playback(self, runner):
+        result = run_session(runner, "python_syntax_error.session", "")
+        assert result.exit_code != 0
+        assert isinstance(result.exception, doitlive.SessionError)
+        assert "line 5" in str(result.exception)
+        assert "We'll do it live!" not in result.output
+
+    def test_setup(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write(
+                    "#doitlive setup: sleep 0.2 && echo ready > a\n"
+                    "#doitlive setup: echo ready > b\n"
+                    "cat a b\n"
+                )
+            user_input = "\n" + random_string(len("cat a b")) + "\n\n"
+            result = runner.invoke(cli, ["play", "session.sh"], input=user_input)
+        assert result.exit_code == 0, result.output
+        assert "Setting up... 2/2" in result.output
+        assert result.output.count("ready") == 2
+
+    def test_setup_failure(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("#doitlive setup: echo oops; exit 4\necho foo\n")
+            result = runner.invoke(cli, ["play", "session.sh"], input="\n")
+        assert isinstance(result.exception, doitlive.SessionError)
+        assert 'Setup command "echo oops; exit 4" failed with exit status 4' in str(
+            result.exception
+        )
+        assert "oops" in str(result.exception)
+
+    def test_workdir(self, runner):
+        with runner.isolated_filesystem():
+            os.mkdir("fixture")
+            with open(os.path.join("fixture", "notes.txt"), "w") as fp:
+                fp.write("original\n")
+            with open("session.sh", "w") as fp:
+                fp.write(
+                    "#doitlive setup: echo setup >> notes.txt\n"
+                    "#doitlive workdir: fixture\n"
+                    "echo changed >> notes.txt && cat notes.txt && pwd\n"
+                )
+            cwd = os.getcwd()
+            command = "echo changed >> notes.txt && cat notes.txt && pwd"
+            for _ in range(2):
+                user_input = "\n" + random_string(len(command)) + "\n\n"
+                result = runner.invoke(cli, ["play", "session.sh"], input=user_input)
+                assert result.exit_code == 0, result.output
+                # Each run starts from a fresh copy of the fixture
+                assert result.output.count("original") == 1
+                assert result.output.count("setup") == 1
+                assert result.output.count("changed") == 2
+                assert os.getcwd() == cwd
+            with open(os.path.join("fixture", "notes.txt")) as fp:
+                assert fp.read() == "original\n"
+        workdir = [line for line in result.output.splitlines() if "doitlive-" in line]
+        assert workdir
+        assert not os.path.exists(os.path.dirname(workdir[-1].strip()))
+
+    def test_workdir_not_found(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("#doitlive workdir: missing\necho foo\n")
+            result = runner.invoke(cli, ["play", "session.sh"], input="\n")
+        assert result.exit_code == 1
+        assert "Working directory fixture not found: missing" in result.output
+
+    def test_background_job(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write(
+                    "#doitlive background: build\n"
+                    "sleep 0.3; echo built; exit 2\n"
+                    "echo meanwhile\n"
+                    "#doitlive await: build\n"
+                    "echo after\n"
+                )
+            commands = ["sleep 0.3; echo built; exit 2", "echo meanwhile", "echo after"]
+            user_input = "\n" + "\n".join(random_string(len(c)) for c in commands)
+            result = runner.invoke(
+                cli, ["play", "session.sh"], input=user_input + "\n\n"
+            )
+        assert result.exit_code == 0, result.output
+        assert "[build] running in the background" in result.output
+        # The session continued while the job ran, and the job's output was
+        # shown when it was awaited
+        output = result.output
+        awaited = output.index("\nbuilt\n[build] exited with status 2\n")
+        assert output.index("\nmeanwhile\n") < awaited < output.index("\nafter\n")
+
+    def test_background_definition(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("#doitlive background: b\nexport A=1\necho foo\n")
+            commands = ["export A=1", "echo foo"]
+            user_input = "\n" + "\n".join(random_string(len(c)) for c in commands)
+            result = runner.invoke(
+                cli, ["play", "session.sh"], input=user_input + "\n\n"
+            )
+        assert result.exit_code == 0, result.output
+        # Neither the export nor the next command is run in the background
+        assert "running in the background" not in result.output
+        assert "\nfoo\n" in result.output
+
+    def test_background_jobs_reaped(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("#doitlive background: server\nsleep 30 && touch late\n")
+            user_input = "\n" + random_string(len("sleep 30 && touch late")) + "\n\n"
+            started = time.monotonic()
+            result = runner.invoke(cli, ["play", "session.sh"], input=user_input)
+            assert result.exit_code == 0, result.output
+            assert time.monotonic() - started < 10
+            time.sleep(0.1)
+            assert not os.path.exists("late")
+
+    def test_await_unknown_job(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("#doitlive await: nope\necho foo\n")
+            user_input = "\n" + random_string(len("echo foo")) + "\n\n"
+            result = runner.invoke(cli, ["play", "session.sh"], input=user_input)
+        assert result.exit_code == 0, result.output
+        assert 'No background job named "nope"' in result.output
+
+    def test_profile(self, runner, tmp_path):
+        profile_dir = tmp_path / "profile"
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("sleep 1\n")
+            user_input = "\n" + random_string(len("sleep 1")) + "\n\n"
+            result = runner.invoke(
+                cli,
+                ["play", "session.sh", "--profile", str(profile_dir)],
+                input=user_input,
+            )
+        assert result.exit_code == 0, result.output
+        assert "Profiling reports written to" in result.output
+        stats = pstats.Stats(str(profile_dir / "profile.pstats"))
+        # Only doitlive's own CPU time is measured, not the time spent
+        # waiting for the command to run
+        assert stats.total_tt < 0.5
+        assert "cumulative" in (profile_dir / "profile.txt").read_text()
+        assert "memory allocated" in (profile_dir / "memory.txt").read_text()
+
+    def test_repl_session(self, runner):
+        user_input = "sh\n" + random_string(len("echo $((40 + 2))")) + "\n\n"
+        result = run_session(runner, "repl.session", user_input)
+        assert result.exit_code == 0
+        assert "echo $((40 + 2))" in result.output
+        assert "42" in result.output
+
+    def test_repl_prompt_pattern(self, runner, tmp_path):
+        session = tmp_path / "session.sh"
+        session.write_text(
+            "```repl[prompt=READY: $]:env PS1='READY: ' sh\necho $((40 + 2))\n```\n"
+        )
+        command = "env PS1='READY: ' sh"
+        user_input = "\n" + random_string(len(command)) + "\n"
+        user_input += random_string(len("echo $((40 + 2))")) + "\n\n\n"
+        result = runner.invoke(cli, ["play", str(session)], input=user_input)
+        assert result.exit_code == 0, result.output
+        assert "READY:" in result.output
+        assert "42" in result.output
+
     def test_alias(self, runner):
         user_input = random_string(len("foo"))
         result = run_session(runner, "alias_comment.session", user_input)
@@ -234,6 +446,50 @@ def test_version(runner):
     assert result.output == result2.output
 
 
+# Generous budget (in microseconds) so that slow CI machines don't flake
+IMPORT_TIME_BUDGET = 500_000
+
+
+def import_times(module):
+    """Return a dict of module name => cumulative import time (in microseconds)
+    for importing ``module`` in a fresh interpreter.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_is_lazy():
+    times = import_times("doitlive")
+    assert times["doitlive"] < IMPORT_TIME_BUDGET
+    for module in ("doitlive.cli", "click", "click_completion"):
+        assert module not in times
+
+
+def test_submodules_listed():
+    package = os.path.dirname(doitlive.__file__)
+    submodules = {module.name for module in pkgutil.iter_modules([package])}
+    assert submodules == doitlive._SUBMODULES
+    assert doitlive.workdir.sandbox
+
+
+def test_cli_import_time():
+    times = import_times("doitlive.cli")
+    assert times["doitlive.cli"] < IMPORT_TIME_BUDGET
+    for module in ("click_completion", "code", "doitlive.python_consoles"):
+        assert module not in times
+
+
 def test_bad_format_prompt():
     with pytest.raises(doitlive.ConfigurationError):
         doitlive.format_prompt("{notfound}")
@@ -268,6 +524,415 @@ def test_get_git_branch(runner):
         assert branch == default_branch_name.strip()
 
 
+class TestDryRun:
+    def dry_run(self, runner, content, args=None):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write(content)
+            return runner.invoke(
+                cli, ["play", "session.sh", "--dry-run"] + (args or [])
+            )
+
+    def test_dry_run(self, runner):
+        result = self.dry_run(
+            runner,
+            "#doitlive env: GREETING=hi\n"
+            "echo $GREETING\n"
+            "export NAME=doitlive\n"
+            "echo $NAME\n"
+            "```python\nx = 21\nprint(x * 2)\n```\n\n"
+            "```repl:sh\necho $((40 + 2))\n```\n",
+        )
+        assert result.exit_code == 0, result.output
+        assert "hi" in result.output
+        assert "doitlive" in result.output
+        assert result.output.count("42") == 2
+        rows = result.output.splitlines()[-5:]
+        assert [row.split()[:2] for row in rows] == [
+            ["2", "0"],
+            ["3", "0"],
+            ["4", "0"],
+            ["5", "0"],
+            ["10", "0"],
+        ]
+
+    def test_stops_at_first_failure(self, runner):
+        result = self.dry_run(runner, "echo foo\nsh -c 'exit 3'\necho never\n")
+        assert result.exit_code == 1
+        assert "never" not in result.output
+        assert "(line 2) failed with exit status 3" in result.output
+
+    def test_background_job(self, runner):
+        result = self.dry_run(
+            runner,
+            "#doitlive background: build\n"
+            "sleep 0.2; echo built\n"
+            "echo meanwhile\n"
+            "#doitlive await: build\n"
+            "#doitlive background: failing\n"
+            "exit 5\n"
+            "#doitlive await: failing\n"
+            "echo never\n",
+        )
+        assert result.exit_code == 1
+        assert "built" in result.output
+        assert "never" not in result.output
+        assert '"#doitlive await: failing" (line 7) failed with exit status 5' in (
+            result.output
+        )
+
+    def test_background_definition(self, runner):
+        result = self.dry_run(
+            runner,
+            "#doitlive background: b\nexport A=1\necho $A\n#doitlive await: b\n",
+        )
+        assert "running in the background" not in result.output
+        # The export isn't a job, and the name doesn't carry over to the echo
+        assert "1\n" in result.output
+        assert 'No background job named "b"' in result.output
+        assert '"#doitlive await: b" (line 4) failed with exit status 127' in (
+            result.output
+        )
+
+    def test_missing_repl_interpreter(self, runner):
+        result = self.dry_run(
+            runner, "```repl:doitlive-missing-repl\n1 + 1\n```\n\necho never\n"
+        )
+        assert result.exit_code == 1
+        assert "Traceback" not in result.output
+        assert "doitlive-missing-repl: No such file or directory" in result.output
+        assert "(line 1) failed with exit status 127" in result.output
+        assert "never" not in result.output
+
+    def test_python_exception(self, runner):
+        result = self.dry_run(runner, "```python\n1 / 0\n```\n\necho never\n")
+        assert result.exit_code == 1
+        assert "ZeroDivisionError" in result.output
+        assert "never" not in result.output
+
+    def test_python_namespace(self, runner):
+        session = os.path.join(HERE, "sessions", "python_shared.session")
+        result = runner.invoke(cli, ["play", session, "--dry-run"])
+        assert result.exit_code == 0, result.output
+
+    def test_no_input_needed(self, runner):
+        session = os.path.join(HERE, "sessions", "basic.session")
+        result = runner.invoke(cli, ["play", session, "--dry-run"], input="")
+        assert result.exit_code == 0, result.output
+        assert "Hello" in result.output
+
+    def test_offline_not_allowed(self, runner):
+        result = self.dry_run(runner, "echo foo\n", ["--offline"])
+        assert result.exit_code == 2
+
+
+class TestCheck:
+    def check(self, runner, content):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write(content)
+            return runner.invoke(cli, ["check", "session.sh"])
+
+    def test_valid_session(self, runner):
+        session = os.path.join(HERE, "sessions", "python.session")
+        result = runner.invoke(cli, ["check", session])
+        assert result.exit_code == 0, result.output
+        assert "No problems found" in result.output
+
+    def test_command_not_found(self, runner):
+        result = self.check(
+            runner, "echo foo\nFOO=1 ls | nosuchcmd1 && cat x 2>&1 > /dev/null\n"
+        )
+        assert result.exit_code == 1
+        assert "session.sh:2: Command not found: nosuchcmd1" in result.output
+        assert "Found 1 problem(s)" in result.output
+
+    def test_workdir_not_found(self, runner):
+        result = self.check(runner, "#doitlive workdir: missing\necho foo\n")
+        assert result.exit_code == 1
+        assert "session.sh:1: Directory not found: missing" in result.output
+
+    def test_aliases_and_envvars(self, runner):
+        result = self.check(
+            runner,
+            '#doitlive alias: ok="echo 42"\n'
+            "#doitlive alias: bad=nosuchcmd1 --flag\n"
+            "export PROG=nosuchcmd2\n"
+            "ok\nbad\n$PROG\n"
+            "#doitlive unalias: ok\nok\n",
+        )
+        assert result.exit_code == 1
+        assert "session.sh:5: Command not found: nosuchcmd1" in result.output
+        assert "session.sh:6: Command not found: nosuchcmd2" in result.output
+        assert "session.sh:8: Command not found: ok" in result.output
+        assert ":4:" not in result.output
+
+    def test_invalid_directives(self, runner):
+        result = self.check(
+            runner,
+            "#doitlive speed: fast\n"
+            "#doitlive prompt: {nope}\n"
+            "#doitlive python: stale\n"
+            "#doitlive env: NOVALUE\n"
+            "#doitlive spede: 2\n"
+            "#doitlive shell: nosuchshell\n",
+        )
+        assert result.exit_code == 1
+        for lineno in range(1, 7):
+            assert f"session.sh:{lineno}:" in result.output
+        assert "Found 6 problem(s)" in result.output
+
+    def test_background_jobs(self, runner):
+        result = self.check(
+            runner,
+            "#doitlive await: early\n"
+            "#doitlive background: early\n"
+            "sleep 1\n"
+            "#doitlive await: early\n"
+            "#doitlive background: block\n"
+            "```python\nx = 1\n```\n\n"
+            "#doitlive await: block\n",
+        )
+        assert result.exit_code == 1
+        assert 'session.sh:1: No background job named "early"' in result.output
+        assert "session.sh:6: Code blocks can't be run in the background" in (
+            result.output
+        )
+        assert 'session.sh:10: No background job named "block"' in result.output
+        assert "Found 3 problem(s)" in result.output
+
+    def test_background_definitions(self, runner):
+        result = self.check(
+            runner,
+            "#doitlive background: a\nalias g=git\n"
+            "#doitlive background: e\nexport A=1\n"
+            "#doitlive await: e\n",
+        )
+        assert result.exit_code == 1
+        assert "session.sh:2: alias and export commands can't be run" in result.output
+        assert "session.sh:4: alias and export commands can't be run" in result.output
+        assert 'session.sh:5: No background job named "e"' in result.output
+
+    def test_invalid_code_blocks(self, runner):
+        result = self.check(runner, "```python\nprint(1 +)\n```\n\n```python\n")
+        assert result.exit_code == 1
+        assert "session.sh:5: Unmatched python code block" in result.output
+
+    def test_python_syntax_error(self, runner):
+        session = os.path.join(HERE, "sessions", "python_syntax_error.session")
+        result = runner.invoke(cli, ["check", session])
+        assert result.exit_code == 1
+        assert "Invalid syntax in python code block on line 5" in result.output
+
+    @pytest.mark.parametrize(
+        ("command", "expected"),
+        [
+            ("ls -l", ["ls"]),
+            ("FOO=bar make test", ["make"]),
+            ("cat x | grep y | wc -l", ["cat", "grep", "wc"]),
+            ("a && b || c; d &", ["a", "b", "c", "d"]),
+            ("sort < in > out 2>&1", ["sort"]),
+            ("if true; then ls; fi", ["true", "ls"]),
+            ("for f in a b; do echo $f; done", ["echo"]),
+            ("(cd src && make)", ["cd", "make"]),
+        ],
+    )
+    def test_command_executables(self, command, expected):
+        assert command_executables(command) == expected
+
+
+class TestEstimate:
+    def estimate(self, runner, filename, args=None, **kwargs):
+        session = os.path.join(HERE, "sessions", filename)
+        return runner.invoke(cli, ["estimate", session] + (args or []), **kwargs)
+
+    def test_estimate(self, runner):
+        result = self.estimate(runner, "basic.session")
+        assert result.exit_code == 0, result.output
+        assert "5.0 keys/s" in result.output
+        # 12 characters + RETURN, at 5 keys/s after a 1s pause
+        assert "1-1        shell                           1         13     0:04" in (
+            result.output
+        )
+
+    def test_speed_directive(self, runner):
+        result = self.estimate(runner, "speed.session")
+        assert result.exit_code == 0, result.output
+        # 9 characters typed 3 at a time + RETURN
+        assert " 4 " in result.output.splitlines()[-1]
+
+    def test_speed_option(self, runner):
+        result = self.estimate(runner, "basic.session", ["--speed", "4"])
+        assert result.exit_code == 0, result.output
+        assert " 4 " in result.output.splitlines()[-1]
+
+    def test_sections(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("echo foo\necho bar\n```python\nx = 1\n```\n\necho baz\n")
+            result = runner.invoke(cli, ["estimate", "session.sh"])
+            assert result.exit_code == 0, result.output
+            lines = result.output.splitlines()
+            assert lines[-4].split()[:3] == ["1-2", "shell", "2"]
+            assert lines[-3].split()[:4] == ["3-5", "python", "block", "2"]
+            assert lines[-2].split()[:3] == ["7-7", "shell", "1"]
+            assert lines[-1].split()[:2] == ["Total", "5"]
+
+    def test_uses_timing_and_runtimes(self, runner):
+        with recording_session(runner, ["sleep 1"], args=["--capture"]) as result:
+            assert result.exit_code == 0, result.output
+            # 2s pause, then 9 key presses 250ms apart
+            write_timing("session.sh.timing", [[2000] + [250] * 9])
+            result = runner.invoke(cli, ["estimate", "session.sh"])
+            assert result.exit_code == 0, result.output
+            assert "4.0 keys/s with a 2.0s pause" in result.output
+            assert "(session.sh.timing)" in result.output
+            assert "No command runtimes" not in result.output
+            # 2s pause + 9 keys at 4 keys/s + 1s runtime
+            assert result.output.splitlines()[-1].split()[-1] == "0:05"
+
+    def test_calibrate(self, runner, monkeypatch):
+        times = iter(range(100))
+        monkeypatch.setattr("doitlive.keyboard.time.monotonic", lambda: next(times))
+        result = self.estimate(
+            runner, "basic.session", ["--calibrate"], input="the quick\n"
+        )
+        assert result.exit_code == 0, result.output
+        assert "1.0 keys/s" in result.output
+        assert "(calibration)" in result.output
+
+    def test_unmatched_block(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("```python\nx = 1\n")
+            result = runner.invoke(cli, ["estimate", "session.sh"])
+            assert result.exit_code == 1
+            assert "Unmatched python code block" in result.output
+
+
+WATCHED_SESSION = [
+    "#doitlive env: GREETING=hi\n",
+    "export NAME=doitlive\n",
+    "echo one\n",
+    "\n",
+    "```python\n",
+    "print(1)\n",
+    "print(2)\n",
+    "```\n",
+    "\n",
+    "echo $GREETING $NAME two\n",
+]
+
+
+class TestWatch:
+    @staticmethod
+    def restart(old, new):
+        point = restart_point(old, new, parse_session(old))
+        if point is None:
+            return None
+        start, steps = point
+        return start, [step.index for step in steps]
+
+    def test_restart_point(self):
+        assert self.restart(WATCHED_SESSION, list(WATCHED_SESSION)) is None
+        new = WATCHED_SESSION[:2] + ["echo uno\n"] + WATCHED_SESSION[3:]
+        assert self.restart(WATCHED_SESSION, new) == (2, [0, 1, 2, 4, 9])
+        # Code blocks are restarted from their opening fence
+        new = WATCHED_SESSION[:6] + ["print(3)\n"] + WATCHED_SESSION[7:]
+        assert self.restart(WATCHED_SESSION, new) == (4, [0, 1, 2, 4, 9])
+        # Appending
+        new = WATCHED_SESSION + ["echo three\n"]
+        assert self.restart(WATCHED_SESSION, new) == (10, [0, 1, 2, 4, 9, 10])
+        # Removing a block
+        new = WATCHED_SESSION[:4] + WATCHED_SESSION[8:]
+        assert self.restart(WATCHED_SESSION, new) == (4, [0, 1, 2, 5])
+
+    @staticmethod
+    def fake_watcher(edited):
+        class FakeWatcher:
+            """Writes ``edited`` to the session the first time it is waited
+            on, and presses Ctrl-C the second time.
+            """
+
+            paths = []
+
+            def __init__(self, path):
+                self.path = path
+                self.waits = 0
+                self.paths.append(path)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def wait(self):
+                self.waits += 1
+                if self.waits > 1:
+                    raise KeyboardInterrupt
+                with open(self.path, "w") as fp:
+                    fp.write(edited)
+                return True
+
+        return FakeWatcher
+
+    def test_play_watch(self, runner, monkeypatch):
+        session = "#doitlive env: GREETING=hi\nexport NAME=doitlive\necho one\n"
+        FakeWatcher = self.fake_watcher(session + "cd sub\necho $GREETING $NAME two\n")
+        monkeypatch.setattr("doitlive.watcher.FileWatcher", FakeWatcher)
+        with runner.isolated_filesystem():
+            os.mkdir("sub")
+            with open("session.sh", "w") as fp:
+                fp.write(session)
+            first = ["export NAME=doitlive", "echo one"]
+            second = ["cd sub", "echo $GREETING $NAME two"]
+            user_input = "\n" + "\n".join(random_string(len(c)) for c in first)
+            user_input += "\n\n" + "\n".join(random_string(len(c)) for c in second)
+            cwd = os.getcwd()
+            result = runner.invoke(
+                cli, ["play", "session.sh", "--watch"], input=user_input + "\n\n"
+            )
+            assert os.getcwd() == os.path.join(cwd, "sub")
+        assert result.exit_code == 0, result.output
+        assert result.output.count("Watching session.sh for changes") == 2
+        first_run, second_run = result.output.split("Watching session.sh")[:2]
+        assert "one" in first_run
+        # Only the new steps were played, with the state from the directives
+        # and commands before them
+        assert "one" not in second_run
+        assert "We'll do it live!" not in second_run
+        assert "hi doitlive two" in second_run
+
+    def test_watch_workdir(self, runner, monkeypatch):
+        session = "#doitlive workdir: fixture\necho one\n"
+        FakeWatcher = self.fake_watcher(session + "echo two\n")
+        monkeypatch.setattr("doitlive.watcher.FileWatcher", FakeWatcher)
+        with runner.isolated_filesystem():
+            os.mkdir("fixture")
+            with open("session.sh", "w") as fp:
+                fp.write(session)
+            session_path = os.path.abspath("session.sh")
+            user_input = "\n" + random_string(len("echo one")) + "\n\n"
+            user_input += random_string(len("echo two")) + "\n\n"
+            result = runner.invoke(
+                cli, ["play", "session.sh", "--watch"], input=user_input
+            )
+        assert result.exit_code == 0, result.output
+        # The session file is watched, not a file in the working directory
+        assert FakeWatcher.paths == [session_path]
+        second_run = result.output.split("Watching session.sh")[1]
+        assert "two" in second_run
+
+    def test_watch_dry_run(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh", "w") as fp:
+                fp.write("echo foo\n")
+            result = runner.invoke(cli, ["play", "session.sh", "--watch", "--dry-run"])
+        assert result.exit_code == 2
+        assert "mutually exclusive" in result.output
+
+
 class TestSessionState:
     @pytest.fixture
     def state(self):
@@ -287,6 +952,90 @@ class TestSessionState:
         state.remove_envvar("EDITOR")
         assert "EDITOR=vim" not in state["envvars"]
 
+    def test_redefining_replaces_in_place(self, state):
+        state.add_alias("g=git")
+        state.add_alias("ll=ls -l")
+        state.add_alias("g=git status")
+        assert list(state["aliases"]) == ["g=git status", "ll=ls -l"]
+
+    def test_redefining_stays_bounded(self, state):
+        state.add_envvar("EDITOR=vim")
+        for _ in range(5):
+            state.add_envvar("A=1")
+            state.add_envvar("A=2")
+        assert list(state["envvars"]) == ["EDITOR=vim", "A=2"]
+        fp = io.StringIO()
+        write_script(fp, "true", "/bin/bash", envvars=state["envvars"])
+        assert fp.getvalue().count("export") == 2
+
+    def test_redefining_referenced_variable_appends(self, state):
+        state.add_envvar("A=1")
+        state.add_envvar("B=$A")
+        state.add_envvar("A=2")
+        state.add_envvar("A=3")
+        assert list(state["envvars"]) == ["A=1", "B=$A", "A=3"]
+
+    def test_redefining_to_refer_to_later_variable_appends(self, state):
+        state.add_envvar("A=1")
+        state.add_envvar("B=2")
+        state.add_envvar("A=${B}x")
+        assert list(state["envvars"]) == ["A=1", "B=2", "A=${B}x"]
+
+    def test_repeated_definition_skipped(self, state):
+        state.add_envvar("EDITOR=vim")
+        state.add_envvar("EDITOR=vim")
+        assert list(state["envvars"]) == ["EDITOR=vim"]
+
+    def test_values_with_equals_signs(self, state):
+        state.add_envvar("OPTS=--color=always")
+        state.add_envvar("EDITOR=vim")
+        assert state.remove_envvar("OPTS")
+        assert list(state["envvars"]) == ["EDITOR=vim"]
+
+    def test_remove_undefined(self, state):
+        assert state.remove_alias("nope") is None
+        assert state.remove_envvar("NOPE") is None
+
+    def test_self_referencing_definitions_kept(self, state):
+        state.add_envvar("PATH=/a:$PATH")
+        state.add_envvar("PATH=/b:$PATH")
+        state.add_envvar("PATH=/b:$PATH")
+        assert list(state["envvars"]) == [
+            "PATH=/a:$PATH",
+            "PATH=/b:$PATH",
+            "PATH=/b:$PATH",
+        ]
+
+    def test_later_definitions_see_earlier_values(self, state):
+        state.add_envvar("A=1")
+        state.add_envvar("B=$A")
+        state.add_envvar("A=2")
+        fp = io.StringIO()
+        write_script(fp, 'echo "$A$B"', "/bin/bash", envvars=state["envvars"])
+        fp.seek(0)
+        output = subprocess.run(
+            ["bash", "-c", fp.getvalue()], capture_output=True, text=True
+        ).stdout
+        assert output == "21\n"
+
+    def test_remove_removes_every_definition(self, state):
+        state.add_envvar("PATH=/a:$PATH")
+        state.add_envvar("EDITOR=vim")
+        state.add_envvar("PATH=/b:$PATH")
+        assert state.remove_envvar("PATH")
+        assert list(state["envvars"]) == ["EDITOR=vim"]
+        state.add_envvar("PATH=/a:$PATH")
+        assert list(state["envvars"]) == ["EDITOR=vim", "PATH=/a:$PATH"]
+
+    def test_set_python_namespace(self, state):
+        assert state["fresh_python"] is False
+        state.set_python_namespace("fresh")
+        assert state["fresh_python"] is True
+        state.set_python_namespace("shared")
+        assert state["fresh_python"] is False
+        with pytest.raises(doitlive.SessionError):
+            state.set_python_namespace("bogus")
+
     def test_add_alias(self):
         state = doitlive.SessionState("/bin/zsh", "default", speed=1)
         assert len(state["aliases"]) == 0
@@ -409,6 +1158,154 @@ class TestRecorder:
                 assert "#doitlive env: FIRST=Steve\n" in content
                 assert "#doitlive env: LAST=Loria\n" in content
 
+    def test_journal_is_removed_after_recording(self, runner):
+        with recording_session(runner) as result:
+            assert result.exit_code == 0
+            assert not os.path.exists("session.sh.journal")
+
+    def test_interrupted_recording_leaves_journal(self, runner):
+        with runner.isolated_filesystem():
+            # No "stop" command
+            result = runner.invoke(cli, ["record"], input='\necho "foo"\n')
+            assert result.exit_code != 0
+            assert not os.path.exists("session.sh")
+            with open("session.sh.journal") as fp:
+                assert 'echo \\"foo\\"' in fp.read()
+
+    def test_recover(self, runner):
+        with runner.isolated_filesystem():
+            user_input = "\necho foo\necho bar\nU\ny\necho baz\n"
+            runner.invoke(cli, ["record", "-a", "g=git"], input=user_input)
+            result = runner.invoke(cli, ["record", "--recover"])
+            assert result.exit_code == 0, result.output
+            assert not os.path.exists("session.sh.journal")
+            with open("session.sh") as fp:
+                content = fp.read()
+            assert "#doitlive alias: g=git\n" in content
+            assert "echo foo\n" in content
+            assert "echo bar" not in content
+            assert "echo baz\n" in content
+
+    def test_recover_ignores_incomplete_entry(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh.journal", "w") as fp:
+                fp.write('{"shell": "/bin/bash", "prompt": "default", ')
+                fp.write('"aliases": [], "envvars": []}\n')
+                fp.write('["add", "echo foo\\n\\n"]\n["add", "echo b')
+            result = runner.invoke(cli, ["record", "--recover"])
+            assert result.exit_code == 0, result.output
+            with open("session.sh") as fp:
+                content = fp.read()
+            assert "echo foo\n" in content
+            assert "echo b" not in content
+
+    def test_recover_inside_python_block(self, runner, monkeypatch):
+        from doitlive.python_consoles import PythonRecorderConsole
+
+        interact = PythonRecorderConsole.interact
+
+        def crash(self, *args, **kwargs):
+            interact(self, *args, **kwargs)
+            raise RuntimeError("Recorder crashed")
+
+        monkeypatch.setattr(PythonRecorderConsole, "interact", crash)
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                cli, ["record"], input="\necho foo\npython\nx = 6 * 7\n"
+            )
+            assert isinstance(result.exception, RuntimeError)
+            result = runner.invoke(cli, ["record", "--recover"])
+            assert result.exit_code == 0, result.output
+            with open("session.sh") as fp:
+                content = fp.read()
+            # The lines entered before the crash were journaled
+            assert "```python\nx = 6 * 7\n```\n" in content
+            result = runner.invoke(cli, ["check", "session.sh"])
+            assert result.exit_code == 0, result.output
+
+    def test_journal_synced_per_entry(self, tmp_path, monkeypatch):
+        synced = []
+        monkeypatch.setattr(os, "fsync", synced.append)
+        journal = RecorderJournal(str(tmp_path / "session.sh.journal"))
+        journal.open("/bin/bash", "default")
+        journal.add("echo foo\n\n")
+        journal.undo()
+        # Synced right away, not on the next write
+        assert len(synced) == 3
+        journal.close()
+
+    def test_recover_without_journal(self, runner):
+        with runner.isolated_filesystem():
+            result = runner.invoke(cli, ["record", "--recover"])
+            assert result.exit_code > 0
+            assert "No journal found" in result.output
+
+    def test_prompt_if_journal_exists(self, runner):
+        with runner.isolated_filesystem():
+            with open("session.sh.journal", "w") as fp:
+                fp.write("{}\n")
+            result = runner.invoke(cli, ["record"], input="n\n")
+            assert result.exit_code == 1
+            assert "interrupted recording" in result.output
+
+    def test_timing(self, runner):
+        commands = ["echo foo", "echo bar", "U\ny", "echo bazz"]
+        with recording_session(runner, commands, args=["--timing"]) as result:
+            assert result.exit_code == 0, result.output
+            records = read_timing("session.sh.timing")
+            # One delay per key press (including RETURN)
+            assert [len(record) for record in records] == [
+                len("echo foo") + 1,
+                len("echo bazz") + 1,
+            ]
+            assert "Typing: 19 keystrokes" in result.output
+            with open("session.sh") as fp:
+                content = fp.read()
+            assert "echo foo\n" in content
+            assert "echo bar" not in content
+
+    def test_no_timing_by_default(self, runner):
+        with recording_session(runner):
+            assert not os.path.exists("session.sh.timing")
+
+    def test_capture(self, runner):
+        commands = ["echo foo", "echo bar", "U\ny", "sh -c 'echo bazz; exit 3'"]
+        with recording_session(runner, commands, args=["--capture"]) as result:
+            assert result.exit_code == 0, result.output
+            # Output is still shown while recording
+            assert "bazz" in result.output
+            outputs = read_outputs("session.sh.outputs.gz")
+            assert [(command, status) for command, status, _, _ in outputs] == [
+                ("echo foo", 0),
+                ("sh -c 'echo bazz; exit 3'", 3),
+            ]
+            assert outputs[0][2].strip() == b"foo"
+            assert outputs[1][2].strip() == b"bazz"
+
+    def test_no_capture_by_default(self, runner):
+        with recording_session(runner):
+            assert not os.path.exists("session.sh.outputs.gz")
+
+    def test_play_offline(self, runner):
+        commands = ["echo foo", "touch created"]
+        with recording_session(runner, commands, args=["--capture"]) as result:
+            assert result.exit_code == 0, result.output
+            os.remove("created")
+            user_input = "".join(["\n", "\n".join(commands), "\n\n"])
+            result = runner.invoke(
+                cli, ["play", "session.sh", "--offline"], input=user_input
+            )
+            assert result.exit_code == 0, result.output
+            # Typed command and its captured output
+            assert result.output.count("foo") == 2
+            assert not os.path.exists("created"), "command was run"
+
+    def test_play_offline_without_outputs(self, runner):
+        with recording_session(runner):
+            result = runner.invoke(cli, ["play", "session.sh", "--offline"])
+            assert result.exit_code == 1
+            assert "record --capture" in result.output
+
     def test_python_mode(self, runner):
         with recording_session(runner, ["python", 'print("hello")', "exit()"]):
             with open("session.sh") as fp:
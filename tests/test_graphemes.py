@@ -0,0 +1,63 @@
+from itertools import pairwise
+
+import pytest
+
+from doitlive.graphemes import TypingPlan, cluster_width, grapheme_boundaries
+
+FAMILY = "\U0001f469\u200d\U0001f469\u200d\U0001f467"
+THUMBS_UP = "\U0001f44d\U0001f3fd"
+FLAGS = "\U0001f1eb\U0001f1f7\U0001f1ef\U0001f1f5"
+SCOTLAND = "\U0001f3f4\U000e0067\U000e0062\U000e0073\U000e0063\U000e0074\U000e007f"
+
+
+@pytest.mark.parametrize(
+    ("text", "clusters"),
+    [
+        ("", []),
+        ("echo", ["e", "c", "h", "o"]),
+        ("cafe\u0301!", ["c", "a", "f", "e\u0301", "!"]),
+        (f"a{FAMILY}b", ["a", FAMILY, "b"]),
+        (f"{THUMBS_UP} ", [THUMBS_UP, " "]),
+        (FLAGS, [FLAGS[:2], FLAGS[2:]]),
+        (SCOTLAND, [SCOTLAND]),
+        ("\u2764\ufe0f", ["\u2764\ufe0f"]),
+        ("\u65e5\u672c", ["\u65e5", "\u672c"]),
+    ],
+)
+def test_grapheme_boundaries(text, clusters):
+    boundaries = grapheme_boundaries(text)
+    assert [text[a:b] for a, b in pairwise(boundaries)] == clusters
+
+
+@pytest.mark.parametrize(
+    ("cluster", "width"),
+    [
+        ("a", 1),
+        ("e\u0301", 1),
+        ("\u65e5", 2),
+        (FAMILY, 2),
+        (FLAGS[:2], 2),
+        ("\u0301", 0),
+    ],
+)
+def test_cluster_width(cluster, width):
+    assert cluster_width(cluster) == width
+
+
+class TestTypingPlan:
+    def test_chunks(self):
+        text = f"echo {FAMILY}e\u0301"
+        plan = TypingPlan(text)
+        assert len(plan) == 7
+        typed = []
+        position = 0
+        while position < len(plan):
+            chunk, position = plan.chunk(position, 3)
+            typed.append(chunk)
+        assert typed == ["ech", f"o {FAMILY}", "e\u0301"]
+        assert plan.typed(6) == f"echo {FAMILY}"
+
+    def test_erase(self):
+        plan = TypingPlan("a\u65e5")
+        assert plan.erase(1) == "\b \b"
+        assert plan.erase(2) == "\b\b  \b\b"
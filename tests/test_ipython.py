@@ -5,7 +5,13 @@ import pytest
 from prompt_toolkit.key_binding import KeyPress
 from prompt_toolkit.keys import Keys
 
-from doitlive.ipython.app import DoitliveTerminalInteractiveShell
+import doitlive.ipython
+from doitlive.cli import cli, has_ipython_block
+from doitlive.ipython.app import (
+    DoitliveTerminalInteractiveShell,
+    PlayerTerminalIPythonApp,
+)
+from doitlive.session import parse_session
 
 
 @pytest.mark.skipif(
@@ -79,6 +85,32 @@ class TestPlayerTerminalInteractiveShell:
         shell.next_keys([KeyPress(Keys.Backspace)])
         assert shell.current_command_keys() == "+1"
 
+    def test_on_feed_key_inserts_chunk_as_paste(self, make_shell):
+        shell = make_shell(commands=["import math"], speed=3)
+        keys = shell.next_keys([KeyPress("x")])
+        assert keys == [KeyPress(Keys.BracketedPaste, "imp")]
+
+    def test_on_feed_multiple_keys_merges_chunks(self, make_shell):
+        shell = make_shell(commands=["import math"], speed=3)
+        keys = shell.next_keys([KeyPress("x"), KeyPress("x"), KeyPress("x")])
+        assert keys == [KeyPress(Keys.BracketedPaste, "import ma")]
+
+    @pytest.mark.parametrize("speed", [1, 2, 3, 5])
+    def test_redraws_per_command(self, make_shell, speed):
+        # Each key press injected into prompt_toolkit's input queue triggers
+        # a redraw, so count the injected key presses needed to type and run
+        # a command
+        command = "import math; math.sqrt(144)"
+        shell = make_shell(commands=[command], speed=speed)
+        injected = []
+        while shell.current_command_pos < len(command):
+            injected.extend(shell.next_keys([KeyPress("x")]))
+        injected.extend(shell.next_keys([KeyPress(Keys.Enter)]))
+        assert "".join(key.data for key in injected[:-1]) == command
+        # One redraw per chunk of ``speed`` characters (not per character),
+        # plus one for Enter
+        assert len(injected) == -(-len(command) // speed) + 1
+
     def test_on_feed_key_does_not_increment_pos_past_length_of_command(
         self, make_shell
     ):
@@ -89,3 +121,90 @@ class TestPlayerTerminalInteractiveShell:
         assert shell.current_command_pos == len("abcde")
         shell.next_keys([KeyPress("x")])
         assert shell.current_command_pos == len("abcde")
+
+
+def test_has_ipython_block():
+    steps = parse_session(["echo foo\n", "```ipython\n", "1 + 1\n", "```\n"])
+    assert has_ipython_block(steps)
+    steps = parse_session(["echo foo\n", "```python\n", "1 + 1\n", "```\n"])
+    assert not has_ipython_block(steps)
+
+
+def test_prewarm_ipython_constructs_app(monkeypatch):
+    monkeypatch.setattr(doitlive.ipython, "_prewarm_thread", None)
+    PlayerTerminalIPythonApp.clear_instance()
+    try:
+        thread = doitlive.ipython.prewarm_ipython()
+        assert doitlive.ipython.prewarm_ipython() is thread
+        thread.join()
+        assert PlayerTerminalIPythonApp.initialized()
+    finally:
+        PlayerTerminalIPythonApp.clear_instance()
+
+
+def test_run_ipython_commands():
+    from IPython.core.interactiveshell import InteractiveShell
+
+    try:
+        assert doitlive.ipython.run_ipython_commands(
+            ["x = 1", "if x:", "    y = x + 1", "%time z = y"]
+        )
+        assert InteractiveShell.instance().user_ns["z"] == 2
+        assert not doitlive.ipython.run_ipython_commands(["1 / 0"])
+    finally:
+        InteractiveShell.clear_instance()
+
+
+@pytest.mark.skipif(
+    # FIXME
+    "CI" in os.environ,
+    reason="IPython shell does not work in Azure Pipelines",
+)
+class TestPlayerTerminalIPythonApp:
+    @pytest.fixture()
+    def app(self, monkeypatch):
+        app = PlayerTerminalIPythonApp.instance()
+        # Don't actually run the mainloop
+        monkeypatch.setattr(app, "start", lambda: None)
+        yield app
+        app.end_session()
+        PlayerTerminalIPythonApp.clear_instance()
+
+    def test_play_reuses_shell_across_blocks(self, app):
+        app.play(["x = 42"])
+        shell = app.shell
+        shell.run_cell("x = 42")
+        shell.current_command_index = 1
+        app.play(["x + 1", "y = x"], speed=2)
+        assert app.shell is shell
+        assert shell.user_ns["x"] == 42
+        assert shell.commands == ["x + 1", "y = x"]
+        assert shell.speed == 2
+        assert shell.current_command_index == 0
+        assert shell.current_command_pos == 0
+
+    def test_end_session_discards_shell(self, app):
+        app.play(["x = 42"])
+        app.end_session()
+        assert app.shell is None
+        assert not DoitliveTerminalInteractiveShell.initialized()
+
+
+def test_player_stopped_when_session_aborted(monkeypatch, runner, tmp_path):
+    stopped = []
+
+    def abort(commands, speed):
+        raise click.Abort()
+
+    monkeypatch.setattr(doitlive.ipython, "prewarm_ipython", lambda: None)
+    monkeypatch.setattr(doitlive.ipython, "start_ipython_player", abort)
+    monkeypatch.setattr(
+        doitlive.ipython, "stop_ipython_player", lambda: stopped.append(True)
+    )
+    session = tmp_path / "session.sh"
+    session.write_text("```ipython\n1 + 1\n```\n")
+    result = runner.invoke(
+        cli, ["play", str(session)], input="\n" + "x" * len("ipython") + "\n"
+    )
+    assert result.exit_code == 1
+    assert stopped == [True]
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from doitlive import jobs
+from doitlive.exceptions import SessionError
+from doitlive.jobs import BackgroundJob, BackgroundJobs, Setup, start_in_shell
+
+
+class TestSetup:
+    def test_runs_commands_concurrently(self, tmp_path):
+        commands = [f"sleep 0.3 && touch {tmp_path / str(n)}" for n in range(4)]
+        setup = Setup(commands, shell="sh")
+        started = time.monotonic()
+        setup.start()
+        progress = []
+        setup.wait(progress=lambda done, total: progress.append((done, total)))
+        assert time.monotonic() - started < 1.0
+        assert progress[-1] == (4, 4)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["0", "1", "2", "3"]
+
+    def test_bounded_workers(self, tmp_path):
+        commands = ["sleep 0.2"] * 4
+        setup = Setup(commands, shell="sh", max_workers=2)
+        started = time.monotonic()
+        setup.start()
+        setup.wait()
+        assert time.monotonic() - started >= 0.4
+
+    def test_failure_stops_other_commands(self, tmp_path):
+        marker = tmp_path / "marker"
+        setup = Setup(
+            ["exit 3", f"sleep 2 && touch {marker}"], shell="sh", max_workers=2
+        )
+        started = time.monotonic()
+        setup.start()
+        with pytest.raises(SessionError, match="exit status 3"):
+            setup.wait()
+        assert time.monotonic() - started < 1.5
+        time.sleep(0.1)
+        assert not marker.exists()
+
+    def test_cancel_while_command_starting(self, tmp_path, monkeypatch):
+        marker = tmp_path / "marker"
+        starting = threading.Event()
+
+        def slow_start(command, shell):
+            starting.set()
+            time.sleep(0.2)
+            return start_in_shell(command, shell)
+
+        monkeypatch.setattr(jobs, "start_in_shell", slow_start)
+        setup = Setup([f"sleep 0.5 && touch {marker}"], shell="sh")
+        setup.start()
+        starting.wait()
+        setup.cancel()
+        time.sleep(0.8)
+        assert not marker.exists()
+
+
+class TestBackgroundJob:
+    def test_follow(self):
+        job = BackgroundJob(
+            "job",
+            "echo $GREETING; sleep 0.2; echo two; exit 3",
+            shell="sh",
+            envvars=["GREETING=one"],
+        )
+        chunks = []
+        assert job.follow(chunks.append) == 3
+        assert b"".join(chunks) == b"one\ntwo\n"
+        assert job.done
+        # Following a finished job shows all of its output
+        assert job.follow(chunks.append) == 3
+        assert b"".join(chunks) == b"one\ntwo\n" * 2
+
+    def test_stop_stops_child_processes(self, tmp_path):
+        marker = tmp_path / "marker"
+        job = BackgroundJob("job", f"(sleep 1 && touch {marker}) & wait", shell="sh")
+        started = time.monotonic()
+        job.stop()
+        assert time.monotonic() - started < 1
+        time.sleep(1.2)
+        assert not marker.exists()
+
+    def test_jobs(self):
+        jobs = BackgroundJobs()
+        job = jobs.start("job", "sleep 30", shell="sh")
+        assert jobs.get("job") is job
+        with pytest.raises(SessionError, match="No background job named"):
+            jobs.get("other")
+        jobs.reap()
+        assert job.proc.poll() is not None
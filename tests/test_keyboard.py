@@ -0,0 +1,66 @@
+import pytest
+
+from doitlive.keyboard import (
+    DOWN,
+    END,
+    ESC,
+    HOME,
+    LEFT,
+    UP,
+    KeyDecoder,
+    is_special_key,
+)
+
+
+def decoder_for(*chunks, pending=True):
+    """Return a KeyDecoder that reads ``chunks`` one at a time."""
+    chunks = list(chunks)
+    return KeyDecoder(
+        read=lambda: chunks.pop(0) if chunks else "",
+        pending=lambda timeout: pending and bool(chunks),
+    )
+
+
+def read_all(decoder):
+    keys = []
+    while True:
+        key = decoder.read_key()
+        if not key:
+            return keys
+        keys.append(key)
+
+
+@pytest.mark.parametrize(
+    ("chunks", "keys"),
+    [
+        (["abc"], ["a", "b", "c"]),
+        (["\x1b[A"], [UP]),
+        (["a\x1b[Bb"], ["a", DOWN, "b"]),
+        # Sequences split across reads
+        (["\x1b", "[", "D"], [LEFT]),
+        (["\x1b[1", ";5", "A"], [UP]),
+        # Application cursor mode, and Home/End variants
+        (["\x1bOA\x1bOH"], [UP, HOME]),
+        (["\x1b[1~\x1b[4~"], [HOME, END]),
+        # Unknown sequences are returned whole
+        (["\x1b[15~x"], ["\x1b[15~", "x"]),
+        (["\x1b\n"], [ESC, "\n"]),
+        (["\x1b"], [ESC]),
+    ],
+)
+def test_decode(chunks, keys):
+    assert read_all(decoder_for(*chunks)) == keys
+
+
+def test_bare_escape_times_out():
+    # Nothing follows the ESC in time, so it is the Escape key
+    decoder = decoder_for("\x1b", "[A", pending=False)
+    assert decoder.read_key() == ESC
+    assert decoder.read_key() == "["
+
+
+def test_is_special_key():
+    assert is_special_key(UP)
+    assert is_special_key("\x1b[15~")
+    assert not is_special_key(ESC)
+    assert not is_special_key("a")
@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+
+from doitlive.exceptions import SessionError
+from doitlive.outputs import (
+    CapturedOutputs,
+    command_runtimes,
+    read_outputs,
+    write_outputs,
+)
+
+
+def test_outputs_roundtrip(tmp_path):
+    path = str(tmp_path / "session.sh.outputs.gz")
+    outputs = [
+        ("echo foo", 0, b"foo\r\n", 0.003),
+        ("false", 1, b"", 0.002),
+        ("printf '\\xff'", 0, b"\xff", 0.0),  # Not valid UTF-8
+    ]
+    write_outputs(path, outputs)
+    assert read_outputs(path) == outputs
+
+
+def test_outputs_file_is_compressed(tmp_path):
+    path = str(tmp_path / "session.sh.outputs.gz")
+    write_outputs(path, [("yes | head -1000", 0, b"y\r\n" * 1000, 0.01)])
+    with open(path, "rb") as fp:
+        data = fp.read()
+    assert data[:2] == b"\x1f\x8b"
+    assert len(data) < 3000
+
+
+def test_read_outputs_invalid(tmp_path):
+    path = tmp_path / "session.sh.outputs.gz"
+    with gzip.open(path, "wt") as fp:
+        fp.write("not json\n")
+    with pytest.raises(SessionError):
+        read_outputs(str(path))
+
+
+def test_captured_outputs_in_order():
+    outputs = CapturedOutputs(
+        [
+            ("date", 0, b"Monday\n", 0.0),
+            ("ls", 0, b"a\n", 0.0),
+            ("date", 0, b"Tuesday\n", 0.0),
+        ]
+    )
+    assert outputs.pop("date") == (0, b"Monday\n")
+    assert outputs.pop("date") == (0, b"Tuesday\n")
+    assert outputs.pop("date") is None
+    assert outputs.pop("pwd") is None
+
+
+def test_command_runtimes():
+    outputs = [
+        ("make", 0, b"", 2.0),
+        ("ls", 0, b"", 0.01),
+        ("make", 0, b"", 1.0),
+    ]
+    assert command_runtimes(outputs) == {"make": 1.5, "ls": 0.01}
@@ -0,0 +1,23 @@
+import pstats
+import threading
+import time
+
+from doitlive.profiling import profiling
+
+
+def burn_cpu(seconds):
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def test_other_threads_not_counted(tmp_path):
+    with profiling(str(tmp_path)):
+        thread = threading.Thread(target=burn_cpu, args=(0.3,))
+        thread.start()
+        thread.join()
+    stats = pstats.Stats(str(tmp_path / "profile.pstats"))
+    # The main thread only waited for the other one
+    assert stats.total_tt < 0.1
+    assert (tmp_path / "profile.txt").exists()
+    assert (tmp_path / "memory.txt").exists()
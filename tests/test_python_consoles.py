@@ -1,6 +1,7 @@
 import pytest
 
 import doitlive
+from doitlive.python_consoles import compile_commands
 
 
 class TestPlayerConsole:
@@ -22,6 +23,32 @@ class TestPlayerConsole:
             console.interact()
             assert expected in stdout.getvalue()
 
+    def test_interact_with_compiled_commands(self, runner):
+        commands = ["for i in range(3):", "    print(i * 11)", "", "x = 42"]
+        console = doitlive.PythonPlayerConsole(
+            commands=commands, compiled=compile_commands(commands)
+        )
+        user_input = "\n".join(commands) + "\n\n"
+        with runner.isolation(input=user_input) as (stdout, _, _):
+            console.interact()
+            assert b"22" in stdout.getvalue()
+        assert console.locals["x"] == 42
+
+
+class TestCompileCommands:
+    def test_groups_statements(self):
+        compiled = compile_commands(["x = 1", "if x:", "    x += 1", "", "x"])
+        assert compiled[0] is not None
+        assert compiled[1] is None
+        assert compiled[2] is None
+        assert compiled[3] is not None
+        assert compiled[4] is not None
+
+    def test_syntax_error_lineno(self):
+        with pytest.raises(SyntaxError) as excinfo:
+            compile_commands(["x = 1", "if x:", "    x +", ""])
+        assert excinfo.value.lineno == 3
+
 
 class TestRecorderConsole:
     def test_interact_stores_commands(self, runner):
@@ -31,3 +58,21 @@ class TestRecorderConsole:
             cons.interact()
         for command in commands:
             assert (command + "\n") in cons.commands
+
+
+class TestPythonPlayer:
+    def test_blocks_share_namespace(self, runner):
+        player = doitlive.python_consoles.PythonPlayer()
+        with runner.isolation(input="x = 42\n\nprint(x)\n\n") as (stdout, _, _):
+            player.play(["x = 42"])
+            player.play(["print(x)"])
+            assert b"42" in stdout.getvalue()
+        assert player.namespace["x"] == 42
+
+    def test_fresh_namespace(self, runner):
+        player = doitlive.python_consoles.PythonPlayer()
+        with runner.isolation(input="x = 42\n\ny = 24\n\n"):
+            player.play(["x = 42"])
+            player.play(["y = 24"], fresh=True)
+        assert "x" not in player.namespace
+        assert player.namespace["y"] == 24
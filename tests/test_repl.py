@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from doitlive.exceptions import SessionError
+from doitlive.repl import DEFAULT_PROMPT_PATTERN, PROMPT_PATTERNS, ReplPlayer
+
+
+class TestReplPlayer:
+    @pytest.fixture
+    def player(self):
+        player = ReplPlayer("sh")
+        player.start()
+        yield player
+        player.stop()
+
+    def test_prompt_pattern_for_known_interpreter(self):
+        player = ReplPlayer("sqlite3 mydb.sqlite")
+        assert player.prompt_re.pattern == PROMPT_PATTERNS["sqlite3"]
+        assert player.prompt_re.search("sqlite> ")
+
+    def test_default_prompt_pattern(self):
+        player = ReplPlayer("/usr/local/bin/myrepl --flag")
+        assert player.prompt_re.pattern == DEFAULT_PROMPT_PATTERN
+
+    def test_custom_prompt_pattern(self):
+        player = ReplPlayer("myrepl", prompt_pattern=r"myrepl\] $")
+        assert player.prompt_re.search("myrepl] ")
+
+    def test_read_until_prompt(self, runner, player):
+        with runner.isolation() as (stdout, _, _):
+            prompt = player.read_until_prompt()
+            assert player.prompt_re.search(prompt)
+            os.write(player.fd, b"echo foo\r")
+            prompt = player.read_until_prompt(sent="echo foo")
+            assert player.prompt_re.search(prompt)
+            output = stdout.getvalue()
+        assert b"foo" in output
+        # The interpreter's echo of the input is skipped
+        assert b"echo foo" not in output
+
+    def test_interpreter_stays_alive_between_lines(self, runner, player):
+        with runner.isolation():
+            player.read_until_prompt()
+        pid = player.proc.pid
+        with runner.isolation():
+            os.write(player.fd, b"true\r")
+            player.read_until_prompt(sent="true")
+        assert player.proc.pid == pid
+        assert player.proc.poll() is None
+
+    def test_missing_interpreter(self):
+        player = ReplPlayer("thisisnotacommand")
+        with pytest.raises(SessionError):
+            player.start()
+
+    def test_run(self, runner):
+        with runner.isolation() as (stdout, _, _):
+            status = ReplPlayer("sh").run(["echo foo", "exit 3"])
+            output = stdout.getvalue()
+        assert status == 3
+        assert output == b"foo\n"
+
+    def test_run_missing_interpreter(self, runner):
+        with runner.isolation() as (stdout, _, _):
+            status = ReplPlayer("thisisnotacommand").run(["1 + 1"])
+            output = stdout.getvalue()
+        assert status == 127
+        assert b"thisisnotacommand: No such file or directory" in output
+
+
+def test_unrecognized_prompt_fails_once(runner):
+    player = ReplPlayer("cat", prompt_pattern="never-shown> $", timeout=0.2)
+    with runner.isolation():
+        with pytest.raises(SessionError, match="repl\\[prompt=<regex>\\]:cat"):
+            player.play(["one", "two", "three"])
+    assert player.proc is None
+
+
+def test_invalid_prompt_pattern():
+    with pytest.raises(SessionError, match="Invalid prompt pattern"):
+        ReplPlayer("sh", prompt_pattern="(")
@@ -0,0 +1,74 @@
+import pytest
+
+from doitlive.cli import get_setup_commands, get_workdir
+from doitlive.exceptions import SessionError
+from doitlive.session import (
+    CODE,
+    COMMAND,
+    COMMENT,
+    DIRECTIVE,
+    parse_session,
+)
+
+SESSION = [
+    "#doitlive env: GREETING=hi\n",
+    "# A comment\n",
+    "export NAME=doitlive\n",
+    "\n",
+    "```python\n",
+    "print(1)\n",
+    "```\n",
+    "\n",
+    "```repl[prompt=> $]:sqlite3 db\n",
+    "select 1;\n",
+    "```\n",
+    "\n",
+    "echo $GREETING $NAME\n",
+]
+
+
+def test_parse_session():
+    steps = parse_session(SESSION)
+    assert [(step.kind, step.index, step.end) for step in steps] == [
+        (DIRECTIVE, 0, 1),
+        (COMMENT, 1, 2),
+        (COMMAND, 2, 3),
+        (CODE, 4, 8),
+        (CODE, 8, 12),
+        (COMMAND, 12, 13),
+    ]
+    directive, _, export, python, repl, _ = steps
+    assert (directive.option, directive.arg) == ("env", "GREETING=hi")
+    assert export.is_definition
+    assert (python.shell_name, python.lines) == ("python", ["print(1)"])
+    assert (repl.shell_name, repl.command, repl.prompt) == ("repl", "sqlite3 db", "> $")
+    assert repl.lines == ["select 1;"]
+    assert repl.lineno == 9
+
+
+def test_parse_session_from_start():
+    assert [step.index for step in parse_session(SESSION, 3)] == [4, 8, 12]
+
+
+def test_unmatched_block():
+    lines = ["echo foo\n", "```python\n", "x = 1\n"]
+    with pytest.raises(SessionError, match="Unmatched python code block"):
+        parse_session(lines)
+    steps = parse_session(lines, strict=False)
+    assert [step.kind for step in steps] == [COMMAND, CODE]
+    assert not steps[-1].closed
+    assert steps[-1].lines == ["x = 1"]
+
+
+def test_directives_in_code_blocks_ignored():
+    steps = parse_session(
+        [
+            "#doitlive setup: touch ready\n",
+            "```python\n",
+            "#doitlive setup: rm -rf build\n",
+            "#doitlive workdir: fixtures\n",
+            "```\n",
+        ]
+    )
+    assert get_setup_commands(steps) == ["touch ready"]
+    assert get_workdir(steps) is None
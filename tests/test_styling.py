@@ -1,8 +1,14 @@
+import os
+
 import click
 import pytest
 from click import style
 
-from doitlive import TTY, TermString
+from doitlive import TTY, TermString, format_prompt, styling
+from doitlive.exceptions import ConfigurationError
+from doitlive.keyboard import prefetch_next_prompt
+from doitlive.styling import compile_prompt, render_prompt
+from doitlive.version_control import may_change_vcs_state
 
 
 class TestTermString:
@@ -36,6 +42,29 @@ class TestTermString:
     def test_underlined(self, ts):
         assert str(ts.underlined) == style("foo", underline=True)
 
+    def test_chained(self, ts):
+        assert str(ts.cyan.bold) == style(style("foo", fg="cyan"), bold=True)
+
+    def test_256_colors(self, ts):
+        assert str(ts.color208) == style("foo", fg=208)
+        assert str(ts.color0.bold) == style(style("foo", fg=0), bold=True)
+        with pytest.raises(AttributeError):
+            _ = ts.color256
+
+    def test_truecolor(self, ts):
+        assert str(ts.rgb_ff8700) == style("foo", fg=(255, 135, 0))
+        assert str(ts.rgb_FF8700) == str(ts.rgb_ff8700)
+        with pytest.raises(AttributeError):
+            _ = ts.rgb_ff87
+
+    def test_unknown_style(self, ts):
+        with pytest.raises(AttributeError):
+            _ = ts.purple
+
+    def test_styled_strings_cached(self, ts):
+        assert ts.magenta is ts.magenta
+        assert isinstance(ts.magenta, TermString)
+
     def test_paren(self, ts, ts_blank):
         assert str(ts.paren) == "(foo)"
         assert str(ts_blank.paren) == "\b"
@@ -72,3 +101,123 @@ class TestTTY:
 
     def test_dim(self):
         assert TTY.DIM == style("", dim=True, reset=False)
+
+
+class TestPromptRendering:
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        calls = []
+
+        def get_user():
+            calls.append(os.getcwd())
+            return TermString("doitlive")
+
+        monkeypatch.setitem(styling.PROMPT_VARIABLES, "user", get_user)
+        yield calls
+        styling.invalidate_prompt()
+
+    def test_format_256_colors(self):
+        assert format_prompt("{dollar.color33.bold}") == style(
+            style("$", fg=33), bold=True
+        )
+
+    def test_variables_computed_when_used(self, calls):
+        assert format_prompt("{dir} $") != ""
+        assert calls == []
+        assert format_prompt("{user}@{user}") == "doitlive@doitlive"
+        assert len(calls) == 1
+
+    def test_prefetch(self, calls):
+        styling.prefetch_prompt("{user}")
+        assert render_prompt("{user}") == "doitlive"
+        assert len(calls) == 1
+        # The prefetched prompt is only used once
+        assert render_prompt("{user}") == "doitlive"
+        assert len(calls) == 2
+
+    def test_prefetch_invalidated(self, calls, tmp_path, monkeypatch):
+        styling.prefetch_prompt("{user}")
+        monkeypatch.chdir(tmp_path)
+        assert render_prompt("{user}") == "doitlive"
+        assert calls[-1] == str(tmp_path)
+        styling.prefetch_prompt("{user}")
+        assert render_prompt("{user} $") == "doitlive $"
+        styling.prefetch_prompt("{user}")
+        styling.invalidate_prompt()
+        assert styling._prefetched is None
+
+    def test_prefetch_branch_changed(self, calls, tmp_path, monkeypatch):
+        head = tmp_path / ".git" / "HEAD"
+        head.parent.mkdir()
+        head.write_text("ref: refs/heads/main\n")
+        monkeypatch.chdir(tmp_path)
+        styling.prefetch_prompt("{user}")
+        styling._prefetched[-1].result()
+        rendered = len(calls)
+        # A script checks out another branch while the prompt is rendered
+        stat = os.stat(head)
+        head.write_text("ref: refs/heads/feature\n")
+        os.utime(head, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert render_prompt("{user}") == "doitlive"
+        assert len(calls) == rendered + 1
+
+    def test_no_prefetch_for_vcs_alias(self, calls):
+        aliases = ['gco="git checkout"']
+        prefetch_next_prompt("gco feature", "{user}", aliases)
+        assert styling._prefetched is None
+        prefetch_next_prompt("ls", "{user}", aliases)
+        assert styling._prefetched is not None
+
+    def test_no_prefetch_with_time(self, calls):
+        styling.prefetch_prompt("{now:%H:%M:%S}")
+        assert styling._prefetched is None
+
+
+class TestCompilePrompt:
+    def test_compiled_once(self):
+        compiled = compile_prompt("{user.cyan} {dir.bold} $")
+        assert compile_prompt("{user.cyan} {dir.bold} $") is compiled
+        assert compiled.render() == format_prompt("{user.cyan} {dir.bold} $")
+
+    def test_time_format(self):
+        assert len(compile_prompt("{now:%H:%M} $").render()) == len("00:00 $")
+
+    @pytest.mark.parametrize(
+        ("template", "message"),
+        [
+            ("{nope} $", "Invalid variable"),
+            ("{user.blurple} $", 'Invalid style "blurple"'),
+            ("{user $", "Invalid prompt template"),
+        ],
+    )
+    def test_invalid(self, template, message):
+        with pytest.raises(ConfigurationError, match=message):
+            compile_prompt(template)
+
+
+@pytest.mark.parametrize(
+    ("command", "expected"),
+    [
+        ("git checkout -b feature", True),
+        ("make && hg update stable", True),
+        ("rm -rf .git", True),
+        ("ls -l", False),
+        ("echo digital", False),
+    ],
+)
+def test_may_change_vcs_state(command, expected):
+    assert may_change_vcs_state(command) is expected
+
+
+@pytest.mark.parametrize(
+    ("command", "expected"),
+    [
+        ("gco feature", True),
+        ("ls && sw main", True),
+        ("ll", False),
+        ("echo gco", True),  # Errs on the side of True
+    ],
+)
+def test_may_change_vcs_state_aliases(command, expected):
+    aliases = ['gco="git checkout"', "sw=gco", "ll='ls -l'"]
+    assert may_change_vcs_state(command, aliases) is expected
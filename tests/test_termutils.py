@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+from doitlive.termutils import find_executables
+
+pytestmark = pytest.mark.skipif(
+    sys.platform.startswith("win"), reason="uses POSIX permissions"
+)
+
+
+def test_find_executables(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    for path in (first / "tool", second / "tool", second / "other"):
+        path.write_text("#!/bin/sh\n")
+        path.chmod(0o755)
+    (first / "data").write_text("")
+    (first / "subdir").mkdir()
+    path = os.pathsep.join([str(first), str(tmp_path / "missing"), str(second)])
+
+    found = find_executables(["tool", "other", "data", "subdir", "nope"], path=path)
+    assert found == {
+        "tool": str(first / "tool"),
+        "other": str(second / "other"),
+        "data": None,
+        "subdir": None,
+        "nope": None,
+    }
@@ -0,0 +1,67 @@
+import pytest
+
+from doitlive.exceptions import SessionError
+from doitlive.timing import (
+    decode_timing,
+    decode_varint,
+    encode_timing,
+    encode_varint,
+    estimate_time,
+    keystrokes_for,
+    timing_stats,
+    to_deltas,
+)
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 2**32])
+def test_varint_roundtrip(value):
+    data = encode_varint(value)
+    assert decode_varint(data, 0) == (value, len(data))
+
+
+def test_small_delays_take_one_byte():
+    assert len(encode_varint(127)) == 1
+    assert len(encode_varint(128)) == 2
+
+
+def test_timing_roundtrip():
+    records = [[1500, 120, 80, 95], [], [3000, 200]]
+    assert decode_timing(encode_timing(records)) == records
+
+
+def test_decode_bad_magic():
+    with pytest.raises(SessionError):
+        decode_timing(b"nope")
+
+
+def test_decode_truncated():
+    data = encode_timing([[1500, 120, 80]])
+    with pytest.raises(SessionError):
+        decode_timing(data[:-1])
+
+
+def test_to_deltas():
+    assert to_deltas([10.0, 11.5, 11.625]) == [1500, 125]
+
+
+def test_timing_stats():
+    stats = timing_stats([[1000, 100, 100], [3000, 200, 200, 200]])
+    assert stats["commands"] == 2
+    assert stats["keystrokes"] == 7
+    assert stats["typing_time"] == pytest.approx(0.8)
+    assert stats["keys_per_second"] == pytest.approx(5 / 0.8)
+    assert stats["mean_think_time"] == pytest.approx(2.0)
+    assert stats["total_time"] == pytest.approx(4.8)
+
+
+@pytest.mark.parametrize(
+    ("text", "speed", "expected"),
+    [("echo", 1, 5), ("echo", 2, 3), ("echo", 3, 3), ("", 1, 1)],
+)
+def test_keystrokes_for(text, speed, expected):
+    assert keystrokes_for(text, speed) == expected
+
+
+def test_estimate_time():
+    section = {"commands": 2, "keystrokes": 20, "runtime": 1.5}
+    assert estimate_time(section, keys_per_second=10, think_time=1) == 5.5
@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+
+import pytest
+
+import doitlive.watcher
+from doitlive.watcher import FileWatcher
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def watcher(request, tmp_path, monkeypatch):
+    if request.param == "polling":
+        monkeypatch.setattr(doitlive.watcher, "_inotify", lambda: None)
+    path = tmp_path / "session.sh"
+    path.write_text("echo foo\n")
+    with FileWatcher(str(path), interval=0.01) as watcher:
+        if request.param == "inotify" and watcher._fd is None:
+            pytest.skip("inotify is not available")
+        yield watcher
+
+
+def later(function, delay=0.1):
+    thread = threading.Thread(target=lambda: (time.sleep(delay), function()))
+    thread.start()
+    return thread
+
+
+def test_write(watcher):
+    def edit():
+        with open(watcher.path, "a") as fp:
+            fp.write("echo bar\n")
+
+    thread = later(edit)
+    assert watcher.wait(timeout=5)
+    thread.join()
+
+
+def test_replace(watcher):
+    def edit():
+        new = os.path.join(os.path.dirname(watcher.path), ".session.sh.swp")
+        with open(new, "w") as fp:
+            fp.write("echo bar\n")
+        os.replace(new, watcher.path)
+
+    thread = later(edit)
+    assert watcher.wait(timeout=5)
+    thread.join()
+
+
+def test_other_files_ignored(watcher):
+    other = os.path.join(os.path.dirname(watcher.path), "other.sh")
+    thread = later(lambda: open(other, "w").close())
+    assert not watcher.wait(timeout=0.3)
+    thread.join()
@@ -0,0 +1,72 @@
+import os
+import stat
+import sys
+
+import pytest
+
+from doitlive.exceptions import SessionError
+from doitlive.workdir import clone_file, clone_tree, sandbox
+
+
+@pytest.fixture
+def fixture(tmp_path):
+    root = tmp_path / "fixture"
+    (root / "src" / "pkg").mkdir(parents=True)
+    (root / "README").write_text("readme\n")
+    (root / "src" / "pkg" / "module.py").write_text("x = 1\n")
+    script = root / "run.sh"
+    script.write_text("#!/bin/sh\n")
+    script.chmod(0o755)
+    if not sys.platform.startswith("win"):
+        (root / "link").symlink_to("README")
+        (root / "pkg").symlink_to(os.path.join("src", "pkg"))
+    return root
+
+
+def test_clone_file(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(b"\x00data" * 1000)
+    clone_file(src, tmp_path / "dst")
+    assert (tmp_path / "dst").read_bytes() == src.read_bytes()
+    # The clone is independent of the original
+    (tmp_path / "dst").write_bytes(b"changed")
+    assert src.read_bytes() == b"\x00data" * 1000
+
+
+def test_clone_tree(fixture, tmp_path):
+    dst = tmp_path / "clone"
+    clone_tree(fixture, dst)
+    assert (dst / "README").read_text() == "readme\n"
+    assert (dst / "src" / "pkg" / "module.py").read_text() == "x = 1\n"
+    assert stat.S_IMODE((dst / "run.sh").stat().st_mode) == 0o755
+    if not sys.platform.startswith("win"):
+        assert os.readlink(dst / "link") == "README"
+        assert os.readlink(dst / "pkg") == os.path.join("src", "pkg")
+
+
+def test_sandbox(fixture):
+    cwd = os.getcwd()
+    with sandbox(str(fixture)) as workdir:
+        assert os.getcwd() == workdir
+        assert os.path.basename(workdir) == "fixture"
+        with open("README", "a") as fp:
+            fp.write("changed\n")
+        os.remove(os.path.join("src", "pkg", "module.py"))
+    assert os.getcwd() == cwd
+    assert not os.path.exists(os.path.dirname(workdir))
+    assert (fixture / "README").read_text() == "readme\n"
+    assert (fixture / "src" / "pkg" / "module.py").exists()
+
+
+def test_sandbox_cleans_up_on_error(fixture):
+    cwd = os.getcwd()
+    with pytest.raises(RuntimeError), sandbox(str(fixture)) as workdir:
+        raise RuntimeError
+    assert os.getcwd() == cwd
+    assert not os.path.exists(os.path.dirname(workdir))
+
+
+def test_sandbox_fixture_not_found(tmp_path):
+    with pytest.raises(SessionError, match="fixture not found"):
+        with sandbox(str(tmp_path / "missing")):
+            pass